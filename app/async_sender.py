@@ -0,0 +1,457 @@
+# async_sender.py
+"""
+Asyncio sending engine for the SMTP relay.
+
+Messages are queued to an engine that keeps up to SMTP_ASYNC_CONNECTIONS logged-in relay
+connections, each working through the shared queue, so hundreds of messages can be in
+flight without a process or thread per message.
+
+When the relay advertises PIPELINING (RFC 2920), MAIL FROM, the RCPT TOs and DATA go out
+as one group, and the next message's group is written right behind the previous one's
+end-of-data. A message then costs one round trip instead of 3 + recipients. Relays
+without PIPELINING get the same commands in lock-step.
+
+Outcomes follow smtplib.sendmail: a message's future resolves to the {recipient: (code,
+msg)} of refused recipients, or raises SMTPSenderRefused / SMTPRecipientsRefused /
+SMTPDataError. A 421 or a lost connection raises SMTPServerDisconnected (or the 421
+SMTPResponseException). A message whose data was never written is retried on another
+connection; one whose data was written is not (the relay may have taken it).
+
+The engine keeps the relay's mx_health record itself: a failed connect or a broken
+connection counts once, not once per message. When the circuit is open, or a connect
+fails while no other connection is up, every queued message fails at once instead of
+each waiting out its own connect timeout.
+
+AsyncRelayEngine lives on the event loop that first uses it. EngineThread runs one on a
+private loop thread for synchronous callers (Celery workers), never shared across a fork.
+"""
+import os, re, ssl, time, base64, socket, asyncio, smtplib, threading, logging
+from concurrent.futures import Future
+from typing import Callable, Coroutine, Dict, List, Optional, Sequence, Tuple
+
+from mx_health import health
+
+log = logging.getLogger("mailer")
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+SMTP_ASYNC_CONNECTIONS = int(os.getenv("SMTP_ASYNC_CONNECTIONS", "8"))
+# Messages waiting for a connection before send() callers wait too
+SMTP_ASYNC_QUEUE = int(os.getenv("SMTP_ASYNC_QUEUE", "1000"))
+
+# Tries for a message whose data never went out (a connection dropping under a pipelined
+# envelope is not the message's fault); once its data is sent it is never resent
+_ATTEMPTS = 3
+
+_CRLF = b"\r\n"
+_EOLS = re.compile(rb"\r\n|\n|\r")
+_LEADING_DOT = re.compile(rb"(?m)^\.")
+
+
+def _quote_data(msg: bytes) -> bytes:
+    """CRLF line endings, dot-stuffing and the end-of-data marker (as smtplib.data does)."""
+    data = _LEADING_DOT.sub(b"..", _EOLS.sub(_CRLF, msg))
+    if not data.endswith(_CRLF):
+        data += _CRLF
+    return data + b"." + _CRLF
+
+
+class _Job:
+    __slots__ = ("from_addr", "to_addrs", "msg", "future", "attempts")
+
+    def __init__(self, from_addr: str, to_addrs: List[str], msg: bytes, future: asyncio.Future):
+        self.from_addr = from_addr
+        self.to_addrs = to_addrs
+        self.msg = msg
+        self.future = future
+        self.attempts = 0
+
+    def envelope(self) -> bytes:
+        lines = [f"MAIL FROM:{smtplib.quoteaddr(self.from_addr)}"]
+        lines += [f"RCPT TO:{smtplib.quoteaddr(a)}" for a in self.to_addrs]
+        lines.append("DATA")
+        return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+    def resolve(self, result=None, exc: Optional[BaseException] = None) -> None:
+        if self.future.done():
+            return
+        if exc is not None:
+            self.future.set_exception(exc)
+        else:
+            self.future.set_result(result)
+
+
+class _Broken(Exception):
+    """The connection is unusable; `sent` says whether the current message's data went out."""
+    def __init__(self, exc: BaseException, sent: bool):
+        super().__init__(str(exc))
+        self.exc = exc
+        self.sent = sent
+
+
+class _Connection:
+    def __init__(self, host: str, timeout: float):
+        self.host = host
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.esmtp: Dict[str, str] = {}
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    async def read(self) -> Tuple[int, str]:
+        """One full (possibly multi-line) reply. Raises SMTPServerDisconnected on EOF."""
+        lines = []
+        while True:
+            line_b = await asyncio.wait_for(self.reader.readline(), timeout=self.timeout)
+            if not line_b:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            line = line_b.decode("utf-8", errors="ignore").rstrip("\r\n")
+            lines.append(line[4:])
+            if line[3:4] != "-":
+                try:
+                    code = int(line[:3])
+                except ValueError:
+                    raise smtplib.SMTPServerDisconnected(f"bad reply: {line!r}")
+                if code == 421:
+                    raise smtplib.SMTPResponseException(code, "\n".join(lines).encode())
+                return code, "\n".join(lines)
+
+    async def cmd(self, line: str) -> Tuple[int, str]:
+        self.writer.write(line.encode("utf-8") + _CRLF)
+        await self.writer.drain()
+        return await self.read()
+
+    async def ehlo(self) -> None:
+        code, text = await self.cmd(f"EHLO {socket.getfqdn()}")
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, text.encode())
+        self.esmtp = {}
+        for line in text.split("\n")[1:]:
+            name, _, params = line.partition(" ")
+            self.esmtp[name.upper()] = params
+
+    @property
+    def pipelining(self) -> bool:
+        return "PIPELINING" in self.esmtp
+
+    async def login(self, username: str, password: str) -> None:
+        mechanisms = self.esmtp.get("AUTH", "").upper().split()
+        if "PLAIN" in mechanisms or "LOGIN" not in mechanisms:
+            token = base64.b64encode(f"\0{username}\0{password}".encode()).decode()
+            code, text = await self.cmd(f"AUTH PLAIN {token}")
+        else:
+            await self.cmd("AUTH LOGIN")
+            await self.cmd(base64.b64encode(username.encode()).decode())
+            code, text = await self.cmd(base64.b64encode(password.encode()).decode())
+        if code not in (235, 503):
+            raise smtplib.SMTPAuthenticationError(code, text.encode())
+
+    async def close(self, quit: bool = True) -> None:
+        if not self.writer:
+            return
+        if quit:
+            try:
+                self.writer.write(b"QUIT\r\n")
+                await asyncio.wait_for(self.writer.drain(), timeout=1.0)
+                await asyncio.wait_for(self.reader.readline(), timeout=1.0)
+            except Exception:
+                pass
+        try:
+            self.writer.close()
+            await asyncio.wait_for(self.writer.wait_closed(), timeout=1.0)
+        except Exception:
+            pass
+        self.writer = None
+
+
+class AsyncRelayEngine:
+    """
+    `await engine.send(from_addr, to_addrs, msg)` over a bounded set of pipelined relay
+    connections. Connection settings mirror tasks._open_relay.
+    """
+
+    def __init__(self, host: str, port: int, *, use_tls: bool = True, use_ssl: bool = False,
+                 username: str = "", password: str = "", timeout: float = 30.0,
+                 connections: int = SMTP_ASYNC_CONNECTIONS, max_messages: int = 100,
+                 idle_seconds: float = 60.0, queue_size: int = SMTP_ASYNC_QUEUE):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.connections = max(1, connections)
+        self.max_messages = max(1, max_messages)
+        self.idle_seconds = idle_seconds
+        self.queue_size = max(1, queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._idle_workers = 0
+        self._live = 0  # open connections
+        self.stats = {"connections_opened": 0, "messages": 0, "round_trips": 0}
+
+    # ---- public API ----
+    async def send(self, from_addr: str, to_addrs: Sequence[str], msg: bytes) -> Dict[str, tuple]:
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+        job = _Job(from_addr, list(to_addrs), msg, asyncio.get_running_loop().create_future())
+        await self._queue.put(job)
+        self._spawn()
+        return await job.future
+
+    async def close(self) -> None:
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ---- workers ----
+    def _spawn(self) -> None:
+        """One more connection worker while messages wait and we're below the connection cap."""
+        self._workers = [w for w in self._workers if not w.done()]
+        if self._idle_workers < self._queue.qsize() and len(self._workers) < self.connections:
+            self._workers.append(asyncio.ensure_future(self._worker()))
+
+    async def _next(self, wait: Optional[float]) -> Optional[_Job]:
+        """The next queued message, waiting at most `wait` seconds (None: don't wait)."""
+        while True:
+            if wait is None:
+                try:
+                    job = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return None
+            else:
+                self._idle_workers += 1
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), timeout=wait)
+                except asyncio.TimeoutError:
+                    return None
+                finally:
+                    self._idle_workers -= 1
+            if not job.future.done():  # skip messages whose sender gave up (cancelled)
+                return job
+
+    def _fail_all(self, job: _Job, exc: BaseException) -> None:
+        """The relay can't be reached: fail `job` and everything queued behind it."""
+        job.resolve(exc=exc)
+        while True:
+            try:
+                self._queue.get_nowait().resolve(exc=exc)
+            except asyncio.QueueEmpty:
+                return
+
+    async def _open(self) -> _Connection:
+        conn = _Connection(self.host, health.timeout_for(self.host, self.timeout, "connect"))
+        t0 = time.monotonic()
+        try:
+            conn.reader, conn.writer = await asyncio.wait_for(asyncio.open_connection(
+                self.host, self.port, ssl=ssl.create_default_context() if self.use_ssl else None,
+            ), timeout=conn.timeout)
+            code, text = await conn.read()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, text.encode())
+        except Exception:
+            health.record_failure(self.host)
+            await conn.close(quit=False)
+            raise
+        health.record_success(self.host, "connect", time.monotonic() - t0)
+        conn.timeout = self.timeout
+        try:
+            await conn.ehlo()
+            if self.use_tls and not self.use_ssl:
+                if "STARTTLS" not in conn.esmtp:
+                    raise smtplib.SMTPNotSupportedError("STARTTLS extension not supported by server.")
+                code, text = await conn.cmd("STARTTLS")
+                if code != 220:
+                    raise smtplib.SMTPResponseException(code, text.encode())
+                await asyncio.wait_for(conn.writer.start_tls(ssl.create_default_context(), server_hostname=self.host),
+                                       timeout=self.timeout)
+                await conn.ehlo()
+            if self.username:
+                await conn.login(self.username, self.password)
+        except Exception:
+            await conn.close(quit=False)
+            raise
+        self.stats["connections_opened"] += 1
+        log.info("[SMTP-async] opened relay connection to %s:%s (pipelining=%s)",
+                 self.host, self.port, conn.pipelining)
+        return conn
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._next(self.idle_seconds)
+            if job is None:
+                return  # idle; workers are started again on demand
+            if not self._live and not health.allow(self.host):
+                self._fail_all(job, smtplib.SMTPConnectError(421, f"relay {self.host} circuit open".encode()))
+                continue
+            try:
+                conn = await self._open()
+            except Exception as e:
+                if not self._live:
+                    self._fail_all(job, e)
+                    continue
+                # Other connections are up (the relay may cap connections): leave the queue to them
+                job.attempts += 1
+                if job.attempts >= _ATTEMPTS or not self._requeue(job):
+                    job.resolve(exc=e)
+                return
+            self._live += 1
+            broken = True
+            try:
+                broken = await self._session(conn, job)
+            finally:
+                self._live -= 1
+                await conn.close(quit=not broken)
+
+    async def _session(self, conn: _Connection, job: _Job) -> bool:
+        """Send queued messages over `conn` until it is retired or idle (False) or breaks (True)."""
+        if conn.pipelining:
+            conn.writer.write(job.envelope())
+        while True:
+            try:
+                nxt = await self._transaction(conn, job)
+            except _Broken as b:
+                health.record_failure(self.host)
+                if job.future.done():
+                    return True  # decided before the connection broke (e.g. during RSET)
+                job.attempts += 1
+                if b.sent or job.attempts >= _ATTEMPTS or not self._requeue(job):
+                    job.resolve(exc=b.exc)
+                return True
+            except Exception as e:
+                job.resolve(exc=e)
+                return True
+            conn.sent += 1
+            conn.last_used = time.monotonic()
+            if nxt is None:
+                if conn.sent >= self.max_messages:
+                    return False
+                nxt = await self._next(self.idle_seconds)
+                if nxt is None:
+                    return False
+                if conn.pipelining:
+                    conn.writer.write(nxt.envelope())
+            job = nxt
+
+    async def _envelope(self, conn: _Connection, job: _Job) -> List[Tuple[int, str]]:
+        """
+        Replies to MAIL, each RCPT and DATA. With PIPELINING the commands are already
+        written; otherwise each is sent after the previous reply, stopping at a refused
+        MAIL or when no recipient was accepted (like smtplib).
+        """
+        if conn.pipelining:
+            await conn.writer.drain()
+            self.stats["round_trips"] += 1
+            return [await conn.read() for _ in range(len(job.to_addrs) + 2)]
+        replies = [await conn.cmd(f"MAIL FROM:{smtplib.quoteaddr(job.from_addr)}")]
+        if replies[0][0] != 250:
+            return replies
+        for addr in job.to_addrs:
+            replies.append(await conn.cmd(f"RCPT TO:{smtplib.quoteaddr(addr)}"))
+        if any(code in (250, 251) for code, _ in replies[1:]):
+            replies.append(await conn.cmd("DATA"))
+        self.stats["round_trips"] += len(replies)
+        return replies
+
+    async def _transaction(self, conn: _Connection, job: _Job) -> Optional[_Job]:
+        """
+        Finish `job` (its envelope already written when pipelining). Returns the next
+        message if its envelope was pipelined behind this one's data.
+        """
+        data_sent = False
+        nxt: Optional[_Job] = None
+        try:
+            replies = await self._envelope(conn, job)
+            (mail_code, mail_text), rcpts = replies[0], replies[1:1 + len(job.to_addrs)]
+            refused = {addr: (code, text.encode()) for addr, (code, text) in zip(job.to_addrs, rcpts)
+                       if code not in (250, 251)}
+            data_code, data_text = replies[-1] if len(replies) == len(job.to_addrs) + 2 else (0, "")
+            if mail_code != 250 or len(refused) == len(job.to_addrs) or data_code != 354:
+                if data_code == 354:
+                    # Pipelined DATA was accepted although nothing else was: end it empty
+                    conn.writer.write(b"." + _CRLF)
+                    await conn.read()
+                if mail_code != 250:
+                    job.resolve(exc=smtplib.SMTPSenderRefused(mail_code, mail_text.encode(), job.from_addr))
+                elif len(refused) == len(job.to_addrs):
+                    job.resolve(exc=smtplib.SMTPRecipientsRefused(refused))
+                else:
+                    job.resolve(exc=smtplib.SMTPDataError(data_code, data_text.encode()))
+                await conn.cmd("RSET")
+                return None
+
+            conn.writer.write(_quote_data(job.msg))
+            data_sent = True
+            if conn.pipelining and conn.sent + 1 < self.max_messages:
+                nxt = await self._next(None)
+                if nxt is not None:
+                    conn.writer.write(nxt.envelope())
+            await conn.writer.drain()
+            code, text = await conn.read()
+        except smtplib.SMTPResponseException as e:
+            if e.smtp_code != 421:
+                raise
+            self._requeue(nxt)
+            raise _Broken(e, data_sent)
+        except (OSError, asyncio.TimeoutError, smtplib.SMTPServerDisconnected) as e:
+            self._requeue(nxt)
+            raise _Broken(smtplib.SMTPServerDisconnected(f"{type(e).__name__}: {e}"), data_sent)
+        if code != 250:
+            job.resolve(exc=smtplib.SMTPDataError(code, text.encode()))
+        else:
+            self.stats["messages"] += 1
+            job.resolve(refused)
+        return nxt
+
+    def _requeue(self, job: Optional[_Job]) -> bool:
+        """Queue a message again whose data was never sent; False if it can't be."""
+        if job is None:
+            return True
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            job.resolve(exc=smtplib.SMTPServerDisconnected("connection lost"))
+            return False
+        return True
+
+
+class EngineThread:
+    """
+    Runs an AsyncRelayEngine on a private event loop thread so synchronous code can use it:
+    `runner.run(coro_fn)` executes `await coro_fn(engine)` there and returns the result.
+    The loop (and its connections) is per process: after a fork a new one is started.
+    """
+
+    def __init__(self, factory: Callable[[], AsyncRelayEngine]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.engine: Optional[AsyncRelayEngine] = None
+
+    def _start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="smtp-async", daemon=True).start()
+                self._loop, self._pid, self.engine = loop, os.getpid(), self._factory()
+            return self._loop
+
+    def run(self, fn: Callable[[AsyncRelayEngine], Coroutine], timeout: Optional[float] = None):
+        loop = self._start()
+        engine = self.engine
+        fut: Future = asyncio.run_coroutine_threadsafe(fn(engine), loop)
+        return fut.result(timeout)
+
+    def close(self) -> None:
+        if self._loop is not None and self._pid == os.getpid() and self.engine is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.engine.close(), self._loop).result(5)
+            except Exception:
+                pass
@@ -0,0 +1,675 @@
+# bulk_validation.py
+"""
+Asyncio bulk validation engine.
+
+Runs the same checks as email_validation.validate_email_record, but with async DNS
+and async SMTP sockets so that many addresses are in flight at once. In-flight work
+is capped globally (VALIDATION_CONCURRENCY) and per domain, so one big corporate
+domain cannot monopolise the pool or hammer a single MX.
+
+Stages are timed into validation_metrics under the same names as the sync validator
+(grouped-mode addresses are each charged an equal share of their domain's session).
+"""
+import os, asyncio, ssl, time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import dns.asyncresolver
+
+from email_validation import (
+    ALLOW_SMTP_PROBE, PROBE_BLOCKED, DEFAULT_TIMEOUT, PROBE_MAIL_FROM, PROBE_SMTP_PORT, ACCEPT_ALL_PROBES,
+    MX_RACE_HOSTS, MX_CONNECT_STAGGER,
+    _precheck, _finish, _smtp_verdict, _dns_temp_result, _store_mx_answers, _store_mx_error,
+    _canary_address, _get_typo_index, provider_blocks_smtp,
+)
+from mx_health import health
+from validation_cache import get_accept_all, set_accept_all, get_mx, MX_OK, MX_TEMP
+from validation_metrics import collect, metrics, note, record, timed
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+VALIDATION_CONCURRENCY = int(os.getenv("VALIDATION_CONCURRENCY", "20"))
+# Max addresses of the same domain in flight at once (keeps us polite towards one MX)
+PER_DOMAIN_CONCURRENCY = int(os.getenv("VALIDATION_PER_DOMAIN_CONCURRENCY", "2"))
+# Domain-grouped probing: RCPTs per MAIL transaction before RSET, and per TCP session before reconnecting
+PROBE_RCPTS_PER_TXN = int(os.getenv("PROBE_RCPTS_PER_TXN", "50"))
+PROBE_RCPTS_PER_SESSION = int(os.getenv("PROBE_RCPTS_PER_SESSION", "200"))
+# Give up on a domain after this many sessions in a row made no progress
+PROBE_SESSION_RETRIES = 3
+
+
+class _ProbeError(Exception):
+    """
+    Session setup failed; `reason` mirrors the sync probe's last_reason strings.
+    `host` is the MX that answered but misbehaved (None when no MX answered at all).
+    """
+    def __init__(self, reason: str, host: Optional[str] = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.host = host
+
+
+# ---------------------------
+# Async SMTP client (probe only, never sends DATA)
+# ---------------------------
+class _AsyncSMTP:
+    def __init__(self, host: str, timeout: float):
+        self.host = host
+        self.timeout = timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.connect_times: Dict[str, float] = {}  # tcp_connect / banner, credited if this attempt wins
+
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, PROBE_SMTP_PORT), timeout=self.timeout
+        )
+
+    async def read(self, timeout: Optional[float] = None) -> Tuple[int, str]:
+        """Read a full (possibly multi-line) SMTP response. Same rules as email_validation._read_resp."""
+        timeout = timeout or self.timeout
+        lines = []
+        first_code: Optional[int] = None
+        while True:
+            line_b = await asyncio.wait_for(self.reader.readline(), timeout=timeout)
+            if not line_b:
+                break
+            line = line_b.decode(errors="ignore").rstrip("\r\n")
+            lines.append(line)
+            if len(line) >= 4 and line[:3].isdigit():
+                code = int(line[:3])
+                if first_code is None:
+                    first_code = code
+                if line[3:4] != "-":
+                    return first_code, "\n".join(lines)
+            elif lines:
+                return first_code or 0, "\n".join(lines)
+        return first_code or 0, "\n".join(lines)
+
+    async def cmd(self, line: str, stage: Optional[str] = None, timeout: Optional[float] = None) -> Tuple[int, str]:
+        """
+        One command, fed into the host's health and the `stage` histogram (as _smtp_cmd does);
+        `timeout` overrides the adaptive response timeout (RCPT gets the caller's).
+        """
+        t0 = time.monotonic()
+        try:
+            self.writer.write(line.encode() + b"\r\n")
+            await self.writer.drain()
+            code, text = await self.read(timeout)
+        except OSError:
+            health.record_failure(self.host)
+            if stage:
+                record(stage, time.monotonic() - t0, "error")
+            raise
+        elapsed = time.monotonic() - t0
+        if code in (0, 421):
+            health.record_failure(self.host)
+        else:
+            health.record_success(self.host, "rcpt" if stage == "rcpt" else "response", elapsed)
+        if stage:
+            record(stage, elapsed, code)
+        return code, text
+
+    async def starttls(self) -> None:
+        ctx = ssl.create_default_context()
+        await asyncio.wait_for(self.writer.start_tls(ctx, server_hostname=self.host), timeout=self.timeout)
+
+    async def close(self) -> None:
+        if not self.writer:
+            return
+        try:
+            self.writer.write(b"QUIT\r\n")
+            await asyncio.wait_for(self.writer.drain(), timeout=1.0)
+            await asyncio.wait_for(self.reader.readline(), timeout=1.0)
+        except Exception:
+            pass
+        try:
+            self.writer.close()
+            await asyncio.wait_for(self.writer.wait_closed(), timeout=1.0)
+        except Exception:
+            pass
+
+
+async def _connect_banner(host: str, timeout: float) -> _AsyncSMTP:
+    # Losing race attempts reach the histograms only, like email_validation._connect_banner
+    t0 = time.monotonic()
+    s = _AsyncSMTP(host, health.timeout_for(host, timeout, "connect"))
+    try:
+        await s.connect()
+    except Exception:
+        health.record_failure(host)
+        metrics.observe("tcp_connect", time.monotonic() - t0, "error")
+        await s.close()
+        raise _ProbeError("smtp-inconclusive")
+    t1 = time.monotonic()
+    metrics.observe("tcp_connect", t1 - t0, "ok")
+    try:
+        code, _ = await s.read()
+    except Exception:
+        health.record_failure(host)
+        metrics.observe("banner", time.monotonic() - t1, "error")
+        await s.close()
+        raise _ProbeError("smtp-inconclusive")
+    t2 = time.monotonic()
+    metrics.observe("banner", t2 - t1, code)
+    if code != 220:
+        health.record_failure(host)
+        await s.close()
+        raise _ProbeError(f"bad-banner-{code}")
+    health.record_success(host, "connect", t2 - t0)
+    s.connect_times = {"tcp_connect": t1 - t0, "banner": t2 - t1}
+    # From here on, each command gets the host's adaptive response timeout
+    s.timeout = health.timeout_for(host, timeout, "response")
+    return s
+
+
+async def _race_connect(hosts: List[str], timeout: float, stagger: float = MX_CONNECT_STAGGER) -> _AsyncSMTP:
+    """
+    Happy-eyeballs style connect (async twin of email_validation._race_connect): start the
+    hosts in order, each `stagger` seconds after the previous one (or immediately once it
+    failed), and keep the first 220 banner. Hosts whose circuit is open are skipped.
+    Raises _ProbeError if every attempt fails.
+    """
+    last_reason = "smtp-inconclusive"
+    queue = [h for h in hosts if health.allow(h)]
+    if not queue:
+        raise _ProbeError("mx-circuit-open")
+    pending = set()
+    try:
+        while queue or pending:
+            if queue:
+                pending.add(asyncio.ensure_future(_connect_banner(queue.pop(0), timeout)))
+            done, pending = await asyncio.wait(
+                pending, timeout=stagger if queue else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            for t in done:
+                try:
+                    s = t.result()
+                except _ProbeError as e:
+                    if e.reason != "smtp-inconclusive":
+                        last_reason = e.reason
+                    continue
+                note(s.connect_times)
+                return s
+        raise _ProbeError(last_reason)
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+async def _open_session(hosts: List[str], timeout: float, use_starttls: bool = True) -> _AsyncSMTP:
+    """
+    Race-connect to `hosts`, then EHLO/HELO, optional STARTTLS and MAIL FROM.
+    Raises _ProbeError on failure; the session's MX is available as `.host`.
+    """
+    s = await _race_connect(hosts, timeout)
+    try:
+        code, ehlo = await s.cmd("EHLO validator.local", "ehlo")
+        if code != 250:
+            code, _ = await s.cmd("HELO validator.local", "ehlo")
+            if code != 250:
+                raise _ProbeError(f"helo-fail-{code}", s.host)
+
+        if use_starttls and "STARTTLS" in ehlo.upper():
+            # STARTTLS command + TLS handshake + second EHLO, timed as one stage
+            with timed("starttls") as st:
+                code, _ = await s.cmd("STARTTLS")
+                st.outcome = code
+                if code == 220:
+                    await s.starttls()
+                    code, _ = await s.cmd("EHLO validator.local")
+                    if code != 250:
+                        raise _ProbeError(f"posttls-ehlo-{code}", s.host)
+
+        code, _ = await s.cmd(f"MAIL FROM:<{PROBE_MAIL_FROM}>", "mail_from")
+        if code not in (250, 251):
+            raise _ProbeError(f"mf-{code or 'unknown'}", s.host)
+        return s
+    except _ProbeError:
+        await s.close()
+        raise
+    except Exception:
+        await s.close()
+        raise _ProbeError("smtp-inconclusive", s.host)
+
+
+def _rcpt_outcome(code: int) -> Optional[Tuple[Optional[bool], str]]:
+    """Map a RCPT TO reply onto the probe result; None means 'try the next MX'."""
+    if code == 250:
+        return True, "smtp-250"
+    if code in (450, 451, 452):
+        return None, "smtp-temp"
+    if 500 <= code <= 599:
+        return False, "smtp-5xx"
+    return None
+
+
+async def smtp_probe_async(email: str, mx_hosts: List[str], timeout: float = DEFAULT_TIMEOUT,
+                           use_starttls: bool = True) -> Tuple[Optional[bool], str]:
+    """Async twin of email_validation.smtp_probe (same return contract)."""
+    with timed("smtp_probe") as st:
+        ok, reason = await _smtp_probe_async(email, mx_hosts, timeout, use_starttls)
+        st.outcome = reason
+    return ok, reason
+
+
+async def _smtp_probe_async(email: str, mx_hosts: List[str], timeout: float,
+                            use_starttls: bool) -> Tuple[Optional[bool], str]:
+    if not mx_hosts:
+        return None, "no-mx"
+
+    last_reason = "smtp-inconclusive"
+    remaining = list(mx_hosts[:MX_RACE_HOSTS])
+    while remaining:
+        try:
+            s = await _open_session(remaining, timeout, use_starttls)
+        except _ProbeError as e:
+            if e.reason != "smtp-inconclusive":
+                last_reason = e.reason
+            if e.host is None:
+                break
+            remaining.remove(e.host)
+            continue
+        remaining.remove(s.host)
+        try:
+            code, _ = await s.cmd(f"RCPT TO:<{email}>", "rcpt", timeout)
+        except Exception:
+            continue
+        finally:
+            await s.close()
+        outcome = _rcpt_outcome(code)
+        if outcome is not None:
+            return outcome
+        last_reason = f"smtp-{code or 'unknown'}"
+
+    return None, last_reason
+
+
+async def is_accept_all_async(domain: str, mx_hosts: List[str], timeout: float = DEFAULT_TIMEOUT) -> Optional[bool]:
+    """Async twin of email_validation.is_accept_all."""
+    if not mx_hosts:
+        return None
+    successes = 0
+    attempts = max(1, ACCEPT_ALL_PROBES)
+    for _ in range(attempts):
+        ok, _ = await smtp_probe_async(_canary_address(domain), mx_hosts, timeout=timeout)
+        if ok is True:
+            successes += 1
+        elif ok is None:
+            return None
+    if successes == attempts:
+        return True
+    if successes == 0:
+        return False
+    return None
+
+
+async def accept_all_cached_async(domain: str, mx_hosts: List[str], timeout: float = DEFAULT_TIMEOUT) -> Optional[bool]:
+    """Async twin of email_validation.accept_all_cached."""
+    hit, verdict = await asyncio.to_thread(get_accept_all, domain)
+    if hit:
+        return verdict
+    verdict = await is_accept_all_async(domain, mx_hosts, timeout=timeout)
+    await asyncio.to_thread(set_accept_all, domain, verdict)
+    return verdict
+
+
+def _is_rcpt_limit(code: int, text: str) -> bool:
+    """452 4.5.3 / 552 5.5.3 'too many recipients' (as opposed to a full mailbox or greylisting)."""
+    t = text.lower()
+    return code in (452, 552) and ("4.5.3" in t or "5.5.3" in t or "too many" in t)
+
+
+async def _reset_txn(s: _AsyncSMTP) -> None:
+    """RSET and start a new MAIL transaction on the same session."""
+    code, _ = await s.cmd("RSET")
+    if code != 250:
+        raise _ProbeError(f"rset-{code or 'unknown'}")
+    code, _ = await s.cmd(f"MAIL FROM:<{PROBE_MAIL_FROM}>", "mail_from")
+    if code not in (250, 251):
+        raise _ProbeError(f"mf-{code or 'unknown'}")
+
+
+async def smtp_probe_domain_async(
+    domain: str,
+    emails: List[str],
+    mx_hosts: List[str],
+    timeout: float = DEFAULT_TIMEOUT,
+    use_starttls: bool = True,
+    canaries: bool = True,
+) -> Tuple[Dict[str, Tuple[Optional[bool], str]], Optional[bool]]:
+    """
+    Probe every address of one domain over as few SMTP sessions as possible.
+
+    The accept-all canaries are issued first, then all real RCPTs, in one session.
+    The MAIL transaction is RSET every PROBE_RCPTS_PER_TXN recipients (or earlier if the
+    server answers "too many recipients"), and a fresh session is opened after
+    PROBE_RCPTS_PER_SESSION recipients or when the server drops us (421 / EOF).
+
+    Returns ({email: (ok, reason)}, accept_all) with the same per-address contract as
+    smtp_probe and the same tri-state as is_accept_all. With canaries=False no canary
+    RCPTs are sent and accept_all is None.
+    """
+    emails = list(dict.fromkeys(emails))
+    if not mx_hosts:
+        return {e: (None, "no-mx") for e in emails}, None
+
+    canary_addrs = [_canary_address(domain) for _ in range(max(1, ACCEPT_ALL_PROBES))] if canaries else []
+    queue = deque(canary_addrs + emails)
+    results: Dict[str, Tuple[Optional[bool], str]] = {}
+    last_reason = "smtp-inconclusive"
+    failures = 0
+
+    while queue and failures < PROBE_SESSION_RETRIES:
+        try:
+            s = await _open_session(mx_hosts[:MX_RACE_HOSTS], timeout, use_starttls)
+        except _ProbeError as e:
+            last_reason = e.reason
+            failures += 1
+            continue
+
+        in_txn = in_session = 0
+        try:
+            while queue and in_session < PROBE_RCPTS_PER_SESSION:
+                if in_txn >= PROBE_RCPTS_PER_TXN:
+                    await _reset_txn(s)
+                    in_txn = 0
+                addr = queue[0]
+                code, text = await s.cmd(f"RCPT TO:<{addr}>", "rcpt", timeout)
+                if _is_rcpt_limit(code, text) and in_txn:
+                    await _reset_txn(s)
+                    in_txn = 0
+                    continue
+                if code in (0, 421):
+                    # Server is shedding the session; carry on with a fresh one
+                    raise _ProbeError(f"smtp-{code or 'unknown'}")
+                results[addr] = _rcpt_outcome(code) or (None, f"smtp-{code}")
+                queue.popleft()
+                in_txn += 1
+                in_session += 1
+        except _ProbeError as e:
+            last_reason = e.reason
+        except Exception:
+            last_reason = "smtp-inconclusive"
+        finally:
+            await s.close()
+        failures = 0 if in_session else failures + 1
+
+    for addr in queue:
+        results[addr] = (None, last_reason)
+
+    verdicts = [results.pop(c)[0] for c in canary_addrs]
+    if not verdicts or any(v is None for v in verdicts):
+        accept_all = None
+    elif all(verdicts):
+        accept_all = True
+    elif not any(verdicts):
+        accept_all = False
+    else:
+        accept_all = None
+    return results, accept_all
+
+
+# ---------------------------
+# Engine
+# ---------------------------
+class _BulkEngine:
+    def __init__(self, concurrency: int, per_domain: int, timeout: float, do_smtp: bool,
+                 prechecked: Optional[Mapping[str, dict]] = None):
+        self.prechecked = prechecked or {}
+        self.sem = asyncio.Semaphore(concurrency)
+        self.per_domain = max(1, per_domain)
+        self.timeout = timeout
+        self.do_smtp = do_smtp
+        self.resolver = dns.asyncresolver.Resolver()
+        self._domain_sems: Dict[str, asyncio.Semaphore] = {}
+        self._mx_inflight: Dict[str, asyncio.Future] = {}
+
+    def _domain_sem(self, domain: str) -> asyncio.Semaphore:
+        sem = self._domain_sems.get(domain)
+        if sem is None:
+            sem = self._domain_sems[domain] = asyncio.Semaphore(self.per_domain)
+        return sem
+
+    async def _resolve_mx(self, domain: str) -> Tuple[str, List[str], str]:
+        try:
+            answers = await self.resolver.resolve(domain, "MX", lifetime=self.timeout)
+        except Exception as e:
+            return await asyncio.to_thread(_store_mx_error, domain, e)
+        return await asyncio.to_thread(_store_mx_answers, domain, answers)
+
+    async def check_mx(self, domain: str) -> Tuple[str, List[str], str]:
+        """Async check_mx_status: shared cache, and concurrent lookups for one domain share a query."""
+        # The cache may go to Redis: keep that (blocking) round trip off the event loop
+        cached = await asyncio.to_thread(get_mx, domain)
+        if cached is not None:
+            return cached
+        fut = self._mx_inflight.get(domain)
+        if fut is None:
+            fut = self._mx_inflight[domain] = asyncio.ensure_future(self._resolve_mx(domain))
+            fut.add_done_callback(lambda _f: self._mx_inflight.pop(domain, None))
+        return await asyncio.shield(fut)
+
+    def precheck(self, email: str) -> Tuple[Optional[dict], Optional[dict]]:
+        ctx = self.prechecked.get(email)
+        if ctx is not None:  # already screened (prescreen.contexts); the stages below mutate checks
+            return {**ctx, "checks": dict(ctx["checks"])}, None
+        try:
+            return _precheck(email)
+        except Exception as e:
+            return None, _unknown(email, e)
+
+    async def _resolve_stage(self, ctx: dict) -> Tuple[Optional[dict], List[str], Optional[str]]:
+        """
+        DNS + probe policy for one address.
+        Returns (final_result, hosts, provider); final_result is None when an SMTP probe is needed.
+        """
+        domain, checks = ctx["domain"], ctx["checks"]
+        with timed("mx") as st:
+            mx_status, hosts, provider_guess = await self.check_mx(domain)
+            st.outcome = mx_status
+        checks["has_mx_or_a_record"] = mx_status == MX_OK
+        if mx_status == MX_TEMP:
+            return _dns_temp_result(ctx), [], None
+        if mx_status != MX_OK:
+            return _finish(ctx, "invalid", 0.10, provider_guess or None, "no-mx"), [], None
+
+        block_name = provider_blocks_smtp(domain)
+        provider = provider_guess or block_name
+        probe = False
+        if self.do_smtp and ALLOW_SMTP_PROBE:
+            checks["smtp_checked"] = True
+            probe = not (block_name and not PROBE_BLOCKED)
+        if not probe:
+            return _smtp_verdict(ctx, provider, None, None, bool(block_name)), hosts, provider
+        return None, hosts, provider
+
+    async def validate(self, email: str) -> dict:
+        t0 = time.monotonic()
+        with collect() as t:
+            res = await self._validate(email)
+        _account(res, time.monotonic() - t0, t.seconds)
+        return res
+
+    async def _validate(self, email: str) -> dict:
+        ctx, early = self.precheck(email)
+        if early:
+            return early
+        try:
+            # Take the per-domain slot first so a queue of same-domain addresses
+            # never holds global slots while it waits.
+            async with self._domain_sem(ctx["domain"].lower()), self.sem:
+                final, hosts, provider = await self._resolve_stage(ctx)
+                if final:
+                    return final
+                smtp_ok, smtp_note = await smtp_probe_async(ctx["email"], hosts, timeout=self.timeout)
+                accept_all = None
+                if smtp_ok is True:
+                    # The canary probes count towards accept_all only, not the address's own stages
+                    with timed("accept_all", isolate=True) as st:
+                        accept_all = await accept_all_cached_async(ctx["domain"], hosts, timeout=self.timeout)
+                        st.outcome = accept_all
+                return _smtp_verdict(ctx, provider, smtp_ok, accept_all, smtp_ok is None, smtp_note=smtp_note)
+        except Exception as e:
+            return _unknown(email, e)
+
+    async def validate_domain(self, ctxs: List[dict]) -> List[dict]:
+        """Grouped mode: all addresses of one domain share one SMTP session (see smtp_probe_domain_async)."""
+        t0 = time.monotonic()
+        with collect() as t:
+            out = await self._validate_domain(ctxs)
+        # One session served them all: each address is charged an equal share
+        share = 1.0 / max(1, len(out))
+        for res in out:
+            _account(res, (time.monotonic() - t0) * share, {k: v * share for k, v in t.seconds.items()})
+        return out
+
+    async def _validate_domain(self, ctxs: List[dict]) -> List[dict]:
+        out: List[dict] = []
+        try:
+            async with self.sem:
+                to_probe = []
+                hosts: List[str] = []
+                for ctx in ctxs:
+                    final, hosts_, provider = await self._resolve_stage(ctx)
+                    if final:
+                        out.append(final)
+                    else:
+                        hosts = hosts_
+                        to_probe.append((ctx, provider))
+                if to_probe:
+                    domain = to_probe[0][0]["domain"]
+                    aa_hit, aa_cached = await asyncio.to_thread(get_accept_all, domain)
+                    outcomes, accept_all = await smtp_probe_domain_async(
+                        domain, [c["email"] for c, _ in to_probe], hosts, timeout=self.timeout,
+                        canaries=not aa_hit,
+                    )
+                    if aa_hit:
+                        accept_all = aa_cached
+                    else:
+                        await asyncio.to_thread(set_accept_all, domain, accept_all)
+                    for ctx, provider in to_probe:
+                        smtp_ok, smtp_note = outcomes.get(ctx["email"], (None, "smtp-inconclusive"))
+                        out.append(_smtp_verdict(ctx, provider, smtp_ok, accept_all, smtp_ok is None,
+                                                 smtp_note=smtp_note))
+        except Exception as e:
+            done = {r["email"] for r in out}
+            out.extend(_unknown(c["raw"], e) for c in ctxs if c["raw"] not in done)
+        return out
+
+
+def _account(res: dict, elapsed: float, stages: Dict[str, float]) -> None:
+    """The "total" stage and the domain's cost for one result (as validate_email_record does)."""
+    record("total", elapsed, res.get("reason"))
+    metrics.charge_domain((res.get("checks") or {}).get("domain"), {**stages, "total": elapsed})
+
+
+def _unknown(email: str, exc: Exception) -> dict:
+    return {"email": email, "verdict": "unknown", "status": "unknown", "reason": str(exc), "provider": None}
+
+
+async def _as_completed(coros: Iterable, window: int) -> AsyncIterator:
+    """Schedule coroutines with at most `window` outstanding; yield each result as it lands."""
+    pending = set()
+    try:
+        for coro in coros:
+            pending.add(asyncio.ensure_future(coro))
+            if len(pending) >= window:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    yield t.result()
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                yield t.result()
+    finally:
+        for t in pending:
+            t.cancel()
+
+
+# ---------------------------
+# Public API
+# ---------------------------
+async def validate_emails_bulk(
+    emails: Iterable[str],
+    concurrency: Optional[int] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    do_smtp: bool = False,
+    per_domain: Optional[int] = None,
+    group_by_domain: bool = False,
+    prechecked: Optional[Mapping[str, dict]] = None,
+) -> AsyncIterator[dict]:
+    """
+    Validate many addresses concurrently, yielding each result (same shape as
+    validate_email_record) as soon as it is ready. Order is NOT preserved; use the
+    "email" key to match results back to inputs.
+
+    group_by_domain=True probes each domain over a single SMTP session (one accept-all
+    check per domain instead of per address). It reads `emails` up front to build the
+    groups; the default mode streams the input.
+
+    `prechecked` maps input addresses to their offline precheck context (from
+    prescreen.contexts); those addresses skip the per-address syntax/list checks.
+    """
+    concurrency = max(1, concurrency or VALIDATION_CONCURRENCY)
+    # Prechecks run on the event loop: build the lazy typo index before the first one needs it
+    await asyncio.to_thread(_get_typo_index)
+    engine = _BulkEngine(concurrency, per_domain or PER_DOMAIN_CONCURRENCY, timeout, do_smtp, prechecked)
+    # Bounded window of scheduled tasks: memory stays flat however long `emails` is.
+    window = concurrency * 4
+
+    if not group_by_domain:
+        async for res in _as_completed((engine.validate(e) for e in emails), window):
+            yield res
+        return
+
+    groups: Dict[str, List[dict]] = {}
+    for email in emails:
+        t0 = time.monotonic()
+        with collect() as t:
+            ctx, early = engine.precheck(email)
+        if early:
+            _account(early, time.monotonic() - t0, t.seconds)
+            yield early
+        else:
+            groups.setdefault(ctx["domain"].lower(), []).append(ctx)
+    async for batch in _as_completed((engine.validate_domain(ctxs) for ctxs in groups.values()), window):
+        for res in batch:
+            yield res
+
+
+def validate_emails_bulk_sync(
+    emails: Iterable[str],
+    concurrency: Optional[int] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    do_smtp: bool = False,
+    group_by_domain: bool = False,
+    prechecked: Optional[Mapping[str, dict]] = None,
+) -> List[dict]:
+    """Blocking wrapper for sync callers (routers, Celery tasks). Returns results in completion order."""
+    async def _collect():
+        return [r async for r in validate_emails_bulk(emails, concurrency, timeout, do_smtp,
+                                                      group_by_domain=group_by_domain, prechecked=prechecked)]
+    return asyncio.run(_collect())
+
+
+def prefetch_mx_sync(domains: Iterable[str], concurrency: Optional[int] = None,
+                     timeout: float = DEFAULT_TIMEOUT) -> Dict[str, str]:
+    """
+    Resolve the MX records of many domains concurrently into the shared MX cache, so the
+    validation pass that follows starts warm. Returns {domain: MX_OK / MX_NONE / MX_TEMP}.
+    """
+    concurrency = max(1, concurrency or VALIDATION_CONCURRENCY)
+
+    async def _run():
+        engine = _BulkEngine(concurrency, PER_DOMAIN_CONCURRENCY, timeout, do_smtp=False)
+
+        async def _one(domain: str):
+            async with engine.sem:
+                status, _hosts, _provider = await engine.check_mx(domain)
+            return domain, status
+
+        unique = {d.lower() for d in domains if d}
+        return dict([r async for r in _as_completed((_one(d) for d in unique), concurrency * 4)])
+    return asyncio.run(_run())
@@ -0,0 +1,68 @@
+# dispatch.py
+"""
+Queueing a campaign for an audience in bulk.
+
+The audience is resolved inside the database: one INSERT ... SELECT creates the Message
+rows straight from the matching contacts and returns only their new ids, so no contact
+rows travel to the API process and nothing is flushed row by row. The ids are committed
+before any task is published, then go to the workers as send_batch_task groups of
+SEND_BATCH_SIZE.
+
+Contacts that already have a queued or sent message for the campaign are skipped, so
+repeating a send (e.g. a client retrying after a timeout) doesn't mail anyone twice;
+contacts whose earlier message failed are queued again.
+"""
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import Select, and_, exists, insert, literal, select
+from sqlalchemy.orm import Session
+
+from models import Contact, Message
+from tasks import enqueue_send_many
+
+# Keep IN (...) lists well below driver parameter limits
+_IN_CHUNK = 1000
+
+
+def audience(status_filter: Optional[str] = None, owner_id: Optional[int] = None) -> Select:
+    """Contact ids with `status_filter` ("all" or empty: any status), optionally of one owner."""
+    stmt = select(Contact.id)
+    if status_filter and status_filter != "all":
+        stmt = stmt.where(Contact.status == status_filter)
+    if owner_id is not None:
+        stmt = stmt.where(Contact.owner_id == owner_id)
+    return stmt
+
+
+def queue_messages(db: Session, campaign_id: int, contacts: Select) -> List[int]:
+    """Create queued Messages for the contact ids selected by `contacts`; returns their ids (not committed)."""
+    sub = contacts.subquery()
+    already = exists().where(and_(
+        Message.campaign_id == campaign_id,
+        Message.contact_id == sub.c.id,
+        Message.status.in_(("queued", "sent")),
+    ))
+    stmt = (
+        insert(Message)
+        .from_select(
+            ["campaign_id", "contact_id", "status"],
+            select(literal(campaign_id), sub.c.id, literal("queued")).where(~already),
+        )
+        .returning(Message.id)
+    )
+    return list(db.execute(stmt).scalars())
+
+
+def dispatch(db: Session, campaign_id: int, contacts: Sequence[Select]) -> Dict[str, int]:
+    """Queue the campaign for every audience in `contacts`, commit, then publish the batches."""
+    ids: List[int] = []
+    for stmt in contacts:
+        ids.extend(queue_messages(db, campaign_id, stmt))
+    db.commit()  # workers must see the rows before they get the ids
+    return {"enqueued": len(ids), "tasks": enqueue_send_many(ids) if ids else 0}
+
+
+def selected(contact_ids: Sequence[int]) -> List[Select]:
+    """Audience statements for an explicit selection, one per IN-list chunk."""
+    ids = sorted(set(contact_ids))
+    return [select(Contact.id).where(Contact.id.in_(ids[i:i + _IN_CHUNK])) for i in range(0, len(ids), _IN_CHUNK)]
@@ -0,0 +1,138 @@
+# domain_lists.py
+"""
+Large lookup lists (disposable domains, role accounts, free providers) kept off the heap.
+
+A source list (one entry per line, '#' comments allowed) is compiled once into a sorted,
+de-duplicated, newline-separated file and memory-mapped read-only. Membership is a binary
+search over the mapped bytes, so a 100k+ entry list costs no Python objects per entry and
+the pages are shared by every process that maps the file (API workers, forked Celery
+children) through the OS page cache.
+
+The source file is re-checked every DOMAIN_LIST_RELOAD_SECONDS; when it changes the list
+is recompiled and remapped in place (hot reload). Without a file, or if it cannot be read,
+the built-in entries are used.
+"""
+import os, mmap, time, hashlib, tempfile, threading, logging
+from typing import Iterable, Optional, Set, Union
+
+log = logging.getLogger(__name__)
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+DOMAIN_LIST_RELOAD_SECONDS = float(os.getenv("DOMAIN_LIST_RELOAD_SECONDS", "60"))
+DOMAIN_LIST_CACHE_DIR = os.getenv("DOMAIN_LIST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sglite-lists"))
+
+
+def _read_entries(path: str) -> Set[bytes]:
+    out: Set[bytes] = set()
+    with open(path, encoding="utf-8", errors="ignore") as fh:
+        for line in fh:
+            entry = line.split("#", 1)[0].strip().lower().rstrip(".")
+            if entry:
+                out.add(entry.encode("utf-8"))
+    return out
+
+
+def _pack(entries: Iterable[bytes]) -> bytes:
+    return b"\n".join(sorted(set(entries)))
+
+
+def _search(buf: Union[bytes, mmap.mmap], key: bytes) -> bool:
+    """Binary search for a whole line equal to `key` in a sorted newline-separated buffer."""
+    lo, hi = 0, len(buf)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = buf.rfind(b"\n", lo, mid) + 1 or lo
+        end = buf.find(b"\n", start, hi)
+        if end == -1:
+            end = hi
+        line = buf[start:end]
+        if line == key:
+            return True
+        if line < key:
+            lo = end + 1
+        else:
+            hi = start
+    return False
+
+
+class DomainList:
+    def __init__(self, name: str, builtin: Iterable[str], path: Optional[str] = None):
+        self.name = name
+        self.path = path or None
+        self._builtin = {e.lower().encode("utf-8") for e in builtin}
+        self._buf: Union[bytes, mmap.mmap] = _pack(self._builtin)
+        self._stamp = None
+        self._checked_at = 0.0
+        self._count = len(self._builtin)
+        self._lock = threading.Lock()
+        if self.path:
+            self._reload()
+
+    def __len__(self) -> int:
+        return self._count
+
+    # ---- loading ----
+    def _source_stamp(self):
+        st = os.stat(self.path)
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _compiled_path(self, stamp) -> str:
+        tag = hashlib.sha1(f"{os.path.abspath(self.path)}:{stamp}".encode()).hexdigest()[:16]
+        return os.path.join(DOMAIN_LIST_CACHE_DIR, f"{self.name}.{tag}.sorted")
+
+    def _compile(self, stamp) -> str:
+        """Compile the source once per version; other processes reuse the result."""
+        target = self._compiled_path(stamp)
+        if os.path.exists(target):
+            return target
+        os.makedirs(DOMAIN_LIST_CACHE_DIR, exist_ok=True)
+        data = _pack(_read_entries(self.path) | self._builtin)
+        fd, tmp = tempfile.mkstemp(dir=DOMAIN_LIST_CACHE_DIR, prefix=self.name + ".")
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp, target)
+        return target
+
+    def _reload(self) -> None:
+        self._checked_at = time.monotonic()
+        try:
+            stamp = self._source_stamp()
+            if stamp == self._stamp:
+                return
+            with open(self._compile(stamp), "rb") as fh:
+                size = os.fstat(fh.fileno()).st_size
+                buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        except Exception as e:
+            log.warning("Domain list %s: cannot load %s (%s); keeping current entries", self.name, self.path, e)
+            return
+        # Swap, don't close: lookups in flight keep the old map alive until they finish
+        self._buf, self._stamp = buf, stamp
+        self._count = sum(buf[i:i + (1 << 20)].count(b"\n") for i in range(0, size, 1 << 20)) + 1 if size else 0
+        log.info("Domain list %s: %d entries from %s", self.name, self._count, self.path)
+
+    def _maybe_reload(self) -> None:
+        if self.path and time.monotonic() - self._checked_at >= DOMAIN_LIST_RELOAD_SECONDS:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= DOMAIN_LIST_RELOAD_SECONDS:
+                    self._reload()
+
+    # ---- lookups ----
+    def contains(self, entry: str) -> bool:
+        """Exact (case-insensitive) membership."""
+        self._maybe_reload()
+        return _search(self._buf, entry.strip().lower().encode("utf-8"))
+
+    def __contains__(self, entry: str) -> bool:
+        return self.contains(entry)
+
+    def match_domain(self, domain: str) -> Optional[str]:
+        """The listed entry covering `domain` (itself or a parent, e.g. a.b.mailinator.com), else None."""
+        self._maybe_reload()
+        labels = domain.strip().lower().rstrip(".").split(".")
+        for i in range(len(labels) - 1):  # never match a bare TLD
+            candidate = ".".join(labels[i:])
+            if _search(self._buf, candidate.encode("utf-8")):
+                return candidate
+        return None
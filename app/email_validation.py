@@ -1,8 +1,18 @@
 # email_validation.py
-import os, re, socket, ssl, random, string, difflib
+import os, re, socket, ssl, random, string, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import lru_cache
 from typing import Tuple, List, Optional, Dict
 from email_validator import validate_email, EmailNotValidError
-import dns.resolver
+import dns.resolver, dns.name
+
+from mx_health import health
+from probe_pool import ProbeSession, probe_pool
+from domain_lists import DomainList
+from provider_index import ProviderIndex
+from typo_index import build_index
+from validation_metrics import collect, metrics, note, record, timed
+from validation_cache import get_accept_all, set_accept_all, get_mx, set_mx, MX_OK, MX_NONE, MX_TEMP
 
 # ---------------------------
 # Config (via .env)
@@ -14,10 +24,33 @@ DEFAULT_TIMEOUT = float(os.getenv("VALIDATION_TIMEOUT", "6"))
 
 # SMTP probe envelope sender (null sender <> is sometimes treated differently)
 PROBE_MAIL_FROM = os.getenv("PROBE_MAIL_FROM", "probe@localhost.localdomain")
+# MX port; only worth changing for local test servers (scripts/bench_validation.py)
+PROBE_SMTP_PORT = int(os.getenv("PROBE_SMTP_PORT", "25"))
 
 # Stricter accept-all detection: number of random addresses to test
 ACCEPT_ALL_PROBES = int(os.getenv("ACCEPT_ALL_PROBES", "2"))  # 2–3 is reasonable
 
+# MX connect racing: try the best MX hosts in preference order, starting the next one
+# after this many seconds without a banner; the first 220 wins.
+MX_RACE_HOSTS = int(os.getenv("MX_RACE_HOSTS", "3"))
+MX_CONNECT_STAGGER = float(os.getenv("MX_CONNECT_STAGGER", "0.3"))
+
+# Typo suggestions: optional popular-domain list ("domain [count]" per line) on top of the built-ins
+TYPO_DOMAINS_FILE = os.getenv("TYPO_DOMAINS_FILE", "")
+TYPO_MAX_DISTANCE = int(os.getenv("TYPO_MAX_DISTANCE", "2"))
+TYPO_CACHE_SIZE = int(os.getenv("TYPO_CACHE_SIZE", "50000"))
+
+# External lists (one entry per line), merged with the built-ins below and hot-reloaded
+DISPOSABLE_DOMAINS_FILE = os.getenv("DISPOSABLE_DOMAINS_FILE", "")
+ROLE_ACCOUNTS_FILE = os.getenv("ROLE_ACCOUNTS_FILE", "")
+FREE_PROVIDERS_FILE = os.getenv("FREE_PROVIDERS_FILE", "")
+
+# Provider rules on top of the built-in tables below (see provider_index.py for the format)
+PROVIDER_RULES_FILE = os.getenv(
+    "PROVIDER_RULES_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "lists", "providers.txt")
+)
+PROVIDER_CACHE_SIZE = int(os.getenv("PROVIDER_CACHE_SIZE", "50000"))
+
 EMAIL_REGEX = re.compile(
     r"^(?P<local>[a-zA-Z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[a-zA-Z0-9!#$%&'*+/=?^_`{|}~-]+)*)@(?P<domain>[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)+)$"
 )
@@ -34,6 +67,10 @@ FREE_PROVIDERS = {
     "icloud.com","me.com","aol.com","proton.me","zoho.com","gmx.com","mail.com"
 }
 
+_disposable_list = DomainList("disposable", DISPOSABLE_DOMAINS, DISPOSABLE_DOMAINS_FILE)
+_role_list = DomainList("role", ROLE_ACCOUNTS, ROLE_ACCOUNTS_FILE)
+_free_list = DomainList("free", FREE_PROVIDERS, FREE_PROVIDERS_FILE)
+
 # Providers that typically refuse/obfuscate mailbox verification
 SMTP_BLOCKLIST_PROVIDERS = {
     "gmail.com": "Google Workspace/Gmail",
@@ -50,10 +87,30 @@ SMTP_BLOCKLIST_PROVIDERS = {
     "aol.com": "AOL",
 }
 
-COMMON_DOMAINS = sorted(FREE_PROVIDERS | {
-    "gmail.co","gamil.com","gnail.com","gmai.com","yhoo.com","yahoo.co","hotnail.com",
-    "outlok.com","icloud.co","me.co","protonmail.com","pm.me","zoho.in","gmx.de","mail.ru"
-})
+# MX host suffix -> who hosts the domain's mail
+MX_PROVIDER_SUFFIXES = {
+    "google.com": "Google Workspace/Gmail",
+    "googlemail.com": "Google Workspace/Gmail",
+    "outlook.com": "Microsoft 365/Outlook",
+    "microsoft.com": "Microsoft 365/Outlook",
+    "yahoodns.net": "Yahoo",
+    "yahoo.com": "Yahoo",
+    "protonmail.ch": "Proton",
+    "proton.me": "Proton",
+    "icloud.com": "Apple iCloud",
+    "me.com": "Apple iCloud",
+}
+
+_providers = ProviderIndex(SMTP_BLOCKLIST_PROVIDERS, MX_PROVIDER_SUFFIXES, PROVIDER_RULES_FILE)
+
+# Correct spellings we suggest; misspellings are found by edit distance, not listed
+COMMON_DOMAINS = sorted(FREE_PROVIDERS | {"pm.me","zoho.in","gmx.de","mail.ru"})
+# Explicit rewrites that edit distance would not produce (or would rank differently)
+TYPO_FIXES = {
+    "gamil.com":"gmail.com","gnail.com":"gmail.com","gmai.com":"gmail.com","gmail.co":"gmail.com",
+    "yhoo.com":"yahoo.com","yahoo.co":"yahoo.com","hotnail.com":"hotmail.com","outlok.com":"outlook.com",
+    "iclod.com":"icloud.com","me.co":"me.com","protonmail.com":"proton.me","pm.me":"proton.me"
+}
 
 # ---------------------------
 # Helpers
@@ -72,60 +129,84 @@ def check_syntax(email: str):
             return True, m.group("local"), m.group("domain")
         return False, None, None
 
-_mx_cache: Dict[str, Tuple[bool, List[str], str]] = {}
+def _mx_from_answers(answers) -> Tuple[List[str], str]:
+    """Return (hosts, provider_guess) for a resolved MX answer set; hosts are in preference order."""
+    # A null MX ("0 .", RFC 7505) leaves an empty host name: the domain accepts no mail
+    ranked = sorted((r.preference, str(r.exchange).rstrip(".")) for r in answers)
+    hosts = [h for _, h in ranked if h]
+    # The most preferred host that we recognise names the provider
+    provider_guess = next((p for p in map(mx_provider, hosts) if p), "")
+    return hosts, provider_guess
+
+def _store_mx_answers(domain: str, answers) -> Tuple[str, List[str], str]:
+    hosts, provider_guess = _mx_from_answers(answers)
+    status = MX_OK if hosts else MX_NONE
+    ttl = answers.rrset.ttl if getattr(answers, "rrset", None) is not None else None
+    set_mx(domain, status, hosts, provider_guess, ttl=ttl)
+    return status, hosts, provider_guess
+
+def _store_mx_error(domain: str, exc: Exception) -> Tuple[str, List[str], str]:
+    # NXDOMAIN / no MX / malformed names are real answers; anything else (timeouts,
+    # SERVFAIL, unreachable resolvers) is transient and only cached briefly.
+    if isinstance(exc, (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.YXDOMAIN, dns.name.NameTooLong,
+                        dns.name.LabelTooLong, dns.name.EmptyLabel)):
+        status = MX_NONE
+    else:
+        status = MX_TEMP
+    set_mx(domain, status, [], "")
+    return status, [], ""
+
+def check_mx_status(domain: str, timeout: float = DEFAULT_TIMEOUT) -> Tuple[str, List[str], str]:
+    """Return (status, hosts, provider_guess); status is MX_OK, MX_NONE or MX_TEMP."""
+    cached = get_mx(domain)
+    if cached is not None:
+        return cached
+    try:
+        answers = dns.resolver.resolve(domain, "MX", lifetime=timeout)
+    except Exception as e:
+        return _store_mx_error(domain, e)
+    return _store_mx_answers(domain, answers)
 
 def check_mx(domain: str, timeout: float = DEFAULT_TIMEOUT):
     """Return (has_mx, hosts, provider_guess)."""
-    if domain in _mx_cache:
-        return _mx_cache[domain]
-    try:
-        answers = dns.resolver.resolve(domain, "MX", lifetime=timeout)
-        hosts = sorted([str(r.exchange).rstrip(".") for r in answers])
-        provider_guess = ""
-        for h in hosts:
-            hl = h.lower()
-            if "google" in hl:
-                provider_guess = "Google Workspace/Gmail"
-            elif "outlook" in hl or "protection.outlook.com" in hl or "microsoft" in hl:
-                provider_guess = "Microsoft 365/Outlook"
-            elif "yahoodns" in hl or "yahoo" in hl:
-                provider_guess = "Yahoo"
-            elif "proton" in hl:
-                provider_guess = "Proton"
-            elif "icloud" in hl or "me.com" in hl:
-                provider_guess = "Apple iCloud"
-        res = (True, hosts, provider_guess)
-        _mx_cache[domain] = res
-        return res
-    except Exception:
-        res = (False, [], "")
-        _mx_cache[domain] = res
-        return res
+    status, hosts, provider_guess = check_mx_status(domain, timeout=timeout)
+    return status == MX_OK, hosts, provider_guess
 
 def is_disposable(domain: str) -> bool:
-    return domain.lower() in DISPOSABLE_DOMAINS
+    # subdomains count too: x.mailinator.com is as disposable as mailinator.com
+    return _disposable_list.match_domain(domain) is not None
 
 def is_role_account(local: str) -> bool:
     root = local.split("+")[0].split(".")[0].lower()
-    return root in ROLE_ACCOUNTS
+    return _role_list.contains(root)
+
+def is_free_provider(domain: str) -> bool:
+    return _free_list.contains(domain)
 
+@lru_cache(maxsize=PROVIDER_CACHE_SIZE)
 def provider_blocks_smtp(domain: str) -> Optional[str]:
-    d = domain.lower()
-    for key, name in SMTP_BLOCKLIST_PROVIDERS.items():
-        if d == key or d.endswith("." + key):
-            return name
-    return None
+    return _providers.domain_provider(domain)
+
+@lru_cache(maxsize=PROVIDER_CACHE_SIZE)
+def mx_provider(host: str) -> Optional[str]:
+    return _providers.mx_provider(host)
+
+_typo_index = None
 
+def _get_typo_index():
+    """Built on first use: a large TYPO_DOMAINS_FILE takes a few seconds to index."""
+    global _typo_index
+    if _typo_index is None:
+        _typo_index = build_index(COMMON_DOMAINS, TYPO_DOMAINS_FILE, TYPO_MAX_DISTANCE)
+    return _typo_index
+
+@lru_cache(maxsize=TYPO_CACHE_SIZE)
 def typo_suggestion(domain: str) -> Optional[str]:
-    fixes = {
-        "gamil.com":"gmail.com","gnail.com":"gmail.com","gmai.com":"gmail.com","gmail.co":"gmail.com",
-        "yhoo.com":"yahoo.com","yahoo.co":"yahoo.com","hotnail.com":"hotmail.com","outlok.com":"outlook.com",
-        "iclod.com":"icloud.com","me.co":"me.com","protonmail.com":"proton.me","pm.me":"proton.me"
-    }
     d = domain.lower()
-    if d in fixes: return fixes[d]
-    cand = difflib.get_close_matches(d, COMMON_DOMAINS, n=1, cutoff=0.86)
-    return cand[0] if cand else None
+    if d in TYPO_FIXES: return TYPO_FIXES[d]
+    match = _get_typo_index().lookup(d)
+    # A known domain is spelled right; only suggest for near misses
+    return match[0] if match and match[1] > 0 else None
 
 # ---------------------------
 # SMTP helpers / probe
@@ -160,114 +241,250 @@ def _read_resp(fh, sock: socket.socket, timeout: float) -> Tuple[int, str]:
                 return first_code or 0, "\n".join(lines)
     return first_code or 0, "\n".join(lines)
 
+def _smtp_cmd(fh, sock: socket.socket, line: bytes, host: str, timeout: float,
+              stage: Optional[str] = None) -> Tuple[int, str]:
+    """
+    Send one command and read its reply, feeding the round-trip into the host's health
+    (and into the `stage` timing histogram when given).
+    """
+    t0 = time.monotonic()
+    try:
+        fh.write(line)
+        code, text = _read_resp(fh, sock, timeout)
+    except OSError:
+        health.record_failure(host)
+        if stage:
+            record(stage, time.monotonic() - t0, "error")
+        raise
+    elapsed = time.monotonic() - t0
+    if code in (0, 421):
+        health.record_failure(host)
+    else:
+        health.record_success(host, "rcpt" if stage == "rcpt" else "response", elapsed)
+    if stage:
+        record(stage, elapsed, code)
+    return code, text
+
+def _connect_banner(host: str, timeout: float, stages: Optional[Dict[str, float]] = None):
+    """
+    Open a socket to host:25 and read the greeting. Returns (sock, fh); raises on anything but 220.
+    Runs in a race thread, so its stage times go to the histograms here and into `stages`
+    for the caller to credit to the probe if this attempt wins.
+    """
+    t0 = time.monotonic()
+    timeout = health.timeout_for(host, timeout, "connect")
+    try:
+        sock = socket.create_connection((host, PROBE_SMTP_PORT), timeout=timeout)
+    except OSError:
+        health.record_failure(host)
+        metrics.observe("tcp_connect", time.monotonic() - t0, "error")
+        raise
+    t1 = time.monotonic()
+    metrics.observe("tcp_connect", t1 - t0, "ok")
+    code = None
+    try:
+        sock.settimeout(timeout)
+        fh = sock.makefile("rwb", buffering=0)
+        code, _ = _read_resp(fh, sock, timeout)
+        if code != 220:
+            raise ConnectionError(f"bad-banner-{code}")
+        t2 = time.monotonic()
+        health.record_success(host, "connect", t2 - t0)
+        metrics.observe("banner", t2 - t1, code)
+        if stages is not None:
+            stages.update(tcp_connect=t1 - t0, banner=t2 - t1)
+        return sock, fh
+    except Exception:
+        health.record_failure(host)
+        metrics.observe("banner", time.monotonic() - t1, code if code is not None else "error")
+        sock.close()
+        raise
+
+def _close_quietly(fut) -> None:
+    try:
+        sock, fh = fut.result()
+        fh.close(); sock.close()
+    except Exception:
+        pass
+
+def _race_connect(hosts: List[str], timeout: float, stagger: float = MX_CONNECT_STAGGER):
+    """
+    Happy-eyeballs style connect: start the hosts in order, each `stagger` seconds after the
+    previous one (or immediately once it failed), and keep the first 220 banner.
+    Hosts whose circuit is open are skipped.
+    Returns (host, sock, fh, last_reason); host is None if every attempt failed.
+    """
+    last_reason = "smtp-inconclusive"
+    hosts = [h for h in hosts if health.allow(h)]
+    if not hosts:
+        return None, None, None, "mx-circuit-open"
+    ex = ThreadPoolExecutor(max_workers=len(hosts))
+    pending = {}
+    queue = list(hosts)
+    try:
+        while queue or pending:
+            if queue:
+                host = queue.pop(0)
+                stages: Dict[str, float] = {}
+                pending[ex.submit(_connect_banner, host, timeout, stages)] = (host, stages)
+            done, _ = wait(list(pending), timeout=stagger if queue else None, return_when=FIRST_COMPLETED)
+            for fut in done:
+                host, stages = pending.pop(fut)
+                try:
+                    sock, fh = fut.result()
+                except Exception as e:
+                    if str(e).startswith("bad-banner-"):
+                        last_reason = str(e)
+                    continue
+                # Losers are closed as soon as they finish connecting
+                for other in pending:
+                    other.add_done_callback(_close_quietly)
+                pending.clear()
+                note(stages)
+                return host, sock, fh, last_reason
+        return None, None, None, last_reason
+    finally:
+        ex.shutdown(wait=False)
+
+class _HandshakeError(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+def _handshake(host: str, sock: socket.socket, fh, rtimeout: float, use_starttls: bool) -> ProbeSession:
+    """EHLO (HELO fallback), STARTTLS when offered, EHLO again. Raises _HandshakeError."""
+    code, ehlo = _smtp_cmd(fh, sock, b"EHLO validator.local\r\n", host, rtimeout, "ehlo")
+    if code != 250:
+        # try HELO
+        code, _ = _smtp_cmd(fh, sock, b"HELO validator.local\r\n", host, rtimeout, "ehlo")
+        if code != 250:
+            raise _HandshakeError(f"helo-fail-{code}")
+
+    tls = False
+    # STARTTLS if offered
+    if use_starttls and "STARTTLS" in ehlo.upper():
+        # STARTTLS command + TLS handshake + second EHLO, timed as one stage
+        with timed("starttls") as st:
+            code, _ = _smtp_cmd(fh, sock, b"STARTTLS\r\n", host, rtimeout)
+            st.outcome = code
+            if code == 220:
+                ctx = ssl.create_default_context()
+                sock = ctx.wrap_socket(sock, server_hostname=host)
+                fh = sock.makefile("rwb", buffering=0)
+                tls = True
+                # EHLO again after TLS
+                code, _ = _smtp_cmd(fh, sock, b"EHLO validator.local\r\n", host, rtimeout)
+                if code != 250:
+                    st.outcome = f"posttls-ehlo-{code}"
+                    raise _HandshakeError(f"posttls-ehlo-{code}")
+    return ProbeSession(host, sock, fh, tls)
+
+def _session_alive(sess: ProbeSession) -> bool:
+    """Pool check: collect the reply to the RSET sent when the session was released."""
+    if not sess.pending_reset:
+        return True
+    sess.pending_reset = False
+    try:
+        code, _ = _read_resp(sess.fh, sess.sock, health.timeout_for(sess.host, DEFAULT_TIMEOUT, "response"))
+    except OSError:
+        return False
+    return code == 250
+
+def _session_reset(sess: ProbeSession) -> None:
+    """Send RSET without waiting; the next user of the session reads the reply."""
+    sess.fh.write(b"RSET\r\n")
+    sess.pending_reset = True
+
+def _session_quit(sess: ProbeSession) -> None:
+    sess.fh.write(b"QUIT\r\n")
+    _read_resp(sess.fh, sess.sock, 2.0)
+
+def _release_session(sess: ProbeSession, reusable: bool) -> None:
+    if reusable:
+        try:
+            _session_reset(sess)
+        except OSError:
+            reusable = False
+    probe_pool.release(sess, reusable, _session_quit)
+
 def smtp_probe(email: str, mx_hosts: List[str], timeout: float = DEFAULT_TIMEOUT, use_starttls: bool = True):
     """
     Return:
       (True,  "smtp-250")  -> mailbox accepted
       (False, "smtp-5xx")  -> mailbox rejected
       (None,  <reason>)    -> inconclusive (temp fail, starttls required, blocked, etc.)
+
+    A warm pooled session to one of the MX hosts is used when available (see probe_pool).
     """
+    with timed("smtp_probe") as st:
+        ok, reason = _smtp_probe(email, mx_hosts, timeout, use_starttls)
+        st.outcome = reason
+    return ok, reason
+
+def _smtp_probe(email: str, mx_hosts: List[str], timeout: float, use_starttls: bool):
     if not mx_hosts:
         return None, "no-mx"
 
     last_reason = "smtp-inconclusive"
+    remaining = list(mx_hosts[:MX_RACE_HOSTS])
+    with timed("pool") as st:
+        sess = probe_pool.acquire(remaining, _session_alive)
+        st.outcome = "hit" if sess is not None else "miss"
+
+    while sess is not None or remaining:
+        if sess is None:
+            host, sock, fh, race_reason = _race_connect(remaining, timeout)
+            if host is None:
+                return None, race_reason if race_reason != "smtp-inconclusive" else last_reason
+            remaining.remove(host)
+            try:
+                sess = _handshake(host, sock, fh, health.timeout_for(host, timeout, "response"), use_starttls)
+            except Exception as e:
+                last_reason = getattr(e, "reason", last_reason)
+                try:
+                    fh.close(); sock.close()
+                except Exception:
+                    pass
+                continue  # try next MX
+            probe_pool.adopt(sess)
 
-    for host in mx_hosts[:3]:
-        sock = None
-        fh = None
+        # Per-command timeout tracks how fast this MX usually answers
+        host = sess.host
+        rtimeout = health.timeout_for(host, timeout, "response")
         try:
-            sock = socket.create_connection((host, 25), timeout=timeout)
-            sock.settimeout(timeout)
-            fh = sock.makefile("rwb", buffering=0)
-
-            # Banner
-            code, _ = _read_resp(fh, sock, timeout)
-            if code != 220:
-                last_reason = f"bad-banner-{code}"
-                raise Exception("bad banner")
-
-            # EHLO
-            fh.write(b"EHLO validator.local\r\n")
-            code, ehlo = _read_resp(fh, sock, timeout)
-            if code != 250:
-                # try HELO
-                fh.write(b"HELO validator.local\r\n")
-                code, _ = _read_resp(fh, sock, timeout)
-                if code != 250:
-                    last_reason = f"helo-fail-{code}"
-                    raise Exception("helo failed")
-
-            # STARTTLS if offered
-            if use_starttls and "STARTTLS" in ehlo.upper():
-                fh.write(b"STARTTLS\r\n")
-                code, _ = _read_resp(fh, sock, timeout)
-                if code == 220:
-                    ctx = ssl.create_default_context()
-                    sock = ctx.wrap_socket(sock, server_hostname=host)
-                    fh = sock.makefile("rwb", buffering=0)
-                    # EHLO again after TLS
-                    fh.write(b"EHLO validator.local\r\n")
-                    code, _ = _read_resp(fh, sock, timeout)
-                    if code != 250:
-                        last_reason = f"posttls-ehlo-{code}"
-                        raise Exception("post-TLS EHLO failed")
-
             # MAIL FROM (use non-null sender to avoid odd policy edge-cases)
             mf = f"MAIL FROM:<{PROBE_MAIL_FROM}>\r\n".encode()
-            fh.write(mf)
-            code, _ = _read_resp(fh, sock, timeout)
+            code, _ = _smtp_cmd(sess.fh, sess.sock, mf, host, rtimeout, "mail_from")
             if code not in (250, 251):
                 last_reason = f"mf-{code or 'unknown'}"
                 raise Exception("MAIL FROM rejected")
 
-            # RCPT TO
+            # RCPT TO: mailbox lookups can be slow, so it gets the full timeout
             rt = f"RCPT TO:<{email}>\r\n".encode()
-            fh.write(rt)
-            code, _ = _read_resp(fh, sock, timeout)
-
-            # QUIT (best-effort)
-            try:
-                fh.write(b"QUIT\r\n")
-                _ = _read_resp(fh, sock, timeout)
-            except Exception:
-                pass
-
-            if code == 250:
-                try:
-                    fh.close(); sock.close()
-                except Exception:
-                    pass
-                return True, "smtp-250"
-            if code in (450, 451, 452):
-                try:
-                    fh.close(); sock.close()
-                except Exception:
-                    pass
-                return None, "smtp-temp"
-            if 500 <= code <= 599:
-                try:
-                    fh.close(); sock.close()
-                except Exception:
-                    pass
-                return False, "smtp-5xx"
-
-            last_reason = f"smtp-{code or 'unknown'}"
-            try:
-                fh.close(); sock.close()
-            except Exception:
-                pass
-
+            code, _ = _smtp_cmd(sess.fh, sess.sock, rt, host, timeout, "rcpt")
         except Exception:
-            # try next MX
-            try:
-                if fh: fh.close()
-                if sock: sock.close()
-            except Exception:
-                pass
+            # dead pooled session or refused sender: try a fresh connection / the next MX
+            probe_pool.discard(sess, _session_quit)
+            sess = None
             continue
 
+        # 421 (or no reply) means the server is done with us
+        _release_session(sess, reusable=code not in (0, 421))
+        if code == 250:
+            return True, "smtp-250"
+        if code in (450, 451, 452):
+            return None, "smtp-temp"
+        if 500 <= code <= 599:
+            return False, "smtp-5xx"
+        last_reason = f"smtp-{code or 'unknown'}"
+        sess = None
+
     return None, last_reason
 
+def _canary_address(domain: str) -> str:
+    rnd = ''.join(random.choices(string.ascii_lowercase + string.digits, k=16))
+    return f"{rnd}@{domain}"
+
 def is_accept_all(domain: str, mx_hosts: List[str], timeout: float = DEFAULT_TIMEOUT) -> Optional[bool]:
     """
     Probe N random addresses on the same domain.
@@ -280,9 +497,7 @@ def is_accept_all(domain: str, mx_hosts: List[str], timeout: float = DEFAULT_TIM
     successes = 0
     attempts = max(1, ACCEPT_ALL_PROBES)
     for _ in range(attempts):
-        rnd = ''.join(random.choices(string.ascii_lowercase + string.digits, k=16))
-        fake = f"{rnd}@{domain}"
-        ok, _ = smtp_probe(fake, mx_hosts, timeout=timeout)
+        ok, _ = smtp_probe(_canary_address(domain), mx_hosts, timeout=timeout)
         if ok is True:
             successes += 1
         elif ok is None:
@@ -293,6 +508,15 @@ def is_accept_all(domain: str, mx_hosts: List[str], timeout: float = DEFAULT_TIM
         return False
     return None
 
+def accept_all_cached(domain: str, mx_hosts: List[str], timeout: float = DEFAULT_TIMEOUT) -> Optional[bool]:
+    """is_accept_all, answered from the shared per-domain cache when possible."""
+    hit, verdict = get_accept_all(domain)
+    if hit:
+        return verdict
+    verdict = is_accept_all(domain, mx_hosts, timeout=timeout)
+    set_accept_all(domain, verdict)
+    return verdict
+
 # ---------------------------
 # Cosmetic score for risky (optional UI)
 # ---------------------------
@@ -311,19 +535,25 @@ def _fallback_risky_score(checks: dict) -> float:
     return max(0.0, min(0.89, score))
 
 # ---------------------------
-# Public API
+# Verdict assembly (shared by the sync path and the bulk engine)
 # ---------------------------
-def validate_email_record(email: str, timeout: float = DEFAULT_TIMEOUT, do_smtp: bool = False, accept_all_note: bool = True):
+def _finish(ctx: dict, verdict: str, score: float, provider: Optional[str], reason: str, checks: Optional[dict] = None) -> dict:
+    return {
+        "email": ctx["raw"], "verdict": verdict, "status": verdict,
+        "score": score, "checks": checks if checks is not None else ctx["checks"],
+        "provider": provider, "suggestion": ctx["suggestion"], "reason": reason,
+    }
+
+def _precheck(email: str):
     """
-    Strict verdicts:
-      - valid   => SMTP 250 AND NOT accept-all
-      - invalid => bad-syntax / no-mx / SMTP 5xx
-      - risky   => everything else (unverifiable provider, accept-all, timeouts)
-    Returns keys: email, verdict, status (same), score, checks, provider, suggestion, reason
+    Offline stage: syntax, role/disposable/free flags and typo hint.
+    Returns (ctx, early_result); early_result is set when the address is already invalid.
     """
     raw = email
     email = normalize(email)
-    ok, local, domain = check_syntax(email)
+    with timed("syntax") as st:
+        ok, local, domain = check_syntax(email)
+        st.outcome = "ok" if ok else "bad"
 
     checks = {
         "has_valid_address_syntax": bool(ok and local and domain),
@@ -336,33 +566,91 @@ def validate_email_record(email: str, timeout: float = DEFAULT_TIMEOUT, do_smtp:
         "smtp_deliverable": False,
         "domain": domain or None,
     }
+    ctx = {"raw": raw, "email": email, "local": local, "domain": domain, "checks": checks, "suggestion": None}
 
     if not checks["has_valid_address_syntax"]:
-        return {
-            "email": raw, "verdict": "invalid", "status": "invalid",
-            "score": 0.05, "checks": checks, "provider": None,
-            "suggestion": None, "reason": "bad-syntax"
-        }
+        return ctx, _finish(ctx, "invalid", 0.05, None, "bad-syntax")
 
     checks["is_role_address"] = is_role_account(local)
     checks["is_disposable"]   = is_disposable(domain)
-    checks["is_free_provider"] = domain.lower() in FREE_PROVIDERS
-    suggestion = typo_suggestion(domain)
-
-    has_mx, hosts, provider_guess = check_mx(domain, timeout=timeout)
-    checks["has_mx_or_a_record"] = has_mx
-    if not has_mx:
-        return {
-            "email": raw, "verdict": "invalid", "status": "invalid",
-            "score": 0.10, "checks": checks,
-            "provider": provider_guess or None,
-            "suggestion": suggestion, "reason": "no-mx"
-        }
+    checks["is_free_provider"] = is_free_provider(domain)
+    ctx["suggestion"] = typo_suggestion(domain)
+    return ctx, None
+
+def _dns_temp_result(ctx: dict) -> dict:
+    """DNS did not answer (timeout/SERVFAIL): we know nothing about the domain yet."""
+    score = _fallback_risky_score({**ctx["checks"], "unverifiable_provider": True})
+    return _finish(ctx, "risky", round(float(score), 3), None, "dns-temp")
+
+def _smtp_verdict(ctx: dict, provider: Optional[str], smtp_ok: Optional[bool], accept_all: Optional[bool],
+                  unverifiable: bool, accept_all_note: bool = True, smtp_note: str = "") -> dict:
+    """
+    Map the SMTP outcome (or its absence) onto the strict verdicts.
+    A 4xx RCPT reply (greylisting) keeps reason "smtp-temp" so it can be re-probed later.
+    """
+    checks = ctx["checks"]
+    if smtp_ok is True:
+        checks["smtp_deliverable"] = True
+        checks["is_accept_all"] = accept_all
+        if accept_all is True and accept_all_note:
+            # Accept-all domains are unverifiable pre-send
+            return _finish(ctx, "risky", 0.74, provider, "accept-all")
+        # Only path to 'valid'
+        return _finish(ctx, "valid", 0.95, provider, "smtp-250")
+    if smtp_ok is False:
+        return _finish(ctx, "invalid", 0.15, provider, "smtp-5xx", checks={**checks, "is_accept_all": False})
+
+    reason = "unverifiable" if unverifiable else "dns-only"
+    if smtp_note == "smtp-temp":
+        reason = smtp_note
+    score = _fallback_risky_score({**checks, "unverifiable_provider": unverifiable})
+    return _finish(ctx, "risky", round(float(score), 3), provider, reason)
+
+# ---------------------------
+# Public API
+# ---------------------------
+def validate_email_record(email: str, timeout: float = DEFAULT_TIMEOUT, do_smtp: bool = False, accept_all_note: bool = True,
+                          timings: bool = False):
+    """
+    Strict verdicts:
+      - valid   => SMTP 250 AND NOT accept-all
+      - invalid => bad-syntax / no-mx / SMTP 5xx
+      - risky   => everything else (unverifiable provider, accept-all, timeouts, greylisting, DNS temp failures)
+    Returns keys: email, verdict, status (same), score, checks, provider, suggestion, reason
+    (+ timings: {"ms": {stage: ms}, "codes": {stage: outcome}} when timings=True)
+    """
+    t0 = time.monotonic()
+    with collect() as t:
+        res = _validate_record(email, timeout, do_smtp, accept_all_note)
+    elapsed = time.monotonic() - t0
+    record("total", elapsed, res["reason"])
+    t.add("total", elapsed, res["reason"])
+    metrics.charge_domain(res["checks"].get("domain"), t.seconds)
+    if timings:
+        res["timings"] = t.as_dict()
+    return res
+
+def _validate_record(email: str, timeout: float, do_smtp: bool, accept_all_note: bool):
+    ctx, early = _precheck(email)
+    if early:
+        return early
+    email, domain, checks = ctx["email"], ctx["domain"], ctx["checks"]
+
+    with timed("mx") as st:
+        mx_status, hosts, provider_guess = check_mx_status(domain, timeout=timeout)
+        st.outcome = mx_status
+    checks["has_mx_or_a_record"] = mx_status == MX_OK
+    if mx_status == MX_TEMP:
+        return _dns_temp_result(ctx)
+    if mx_status != MX_OK:
+        return _finish(ctx, "invalid", 0.10, provider_guess or None, "no-mx")
 
     block_name = provider_blocks_smtp(domain)
+    provider = provider_guess or block_name
     unverifiable = False
     smtp_ok = None
     smtp_note = ""
+    accept_all = None
 
     if do_smtp and ALLOW_SMTP_PROBE:
         checks["smtp_checked"] = True
@@ -371,42 +659,14 @@ def validate_email_record(email: str, timeout: float = DEFAULT_TIMEOUT, do_smtp:
         else:
             smtp_ok, smtp_note = smtp_probe(email, hosts, timeout=timeout)
             if smtp_ok is True:
-                checks["smtp_deliverable"] = True
-                aa = is_accept_all(domain, hosts, timeout=timeout)
-                checks["is_accept_all"] = aa
-                if aa is True and accept_all_note:
-                    # Accept-all domains are unverifiable pre-send
-                    return {
-                        "email": raw, "verdict": "risky", "status": "risky",
-                        "score": 0.74, "checks": checks,
-                        "provider": provider_guess or block_name,
-                        "suggestion": suggestion, "reason": "accept-all"
-                    }
-                # Only path to 'valid'
-                return {
-                    "email": raw, "verdict": "valid", "status": "valid",
-                    "score": 0.95, "checks": checks,
-                    "provider": provider_guess or block_name,
-                    "suggestion": suggestion, "reason": "smtp-250"
-                }
-            elif smtp_ok is False:
-                return {
-                    "email": raw, "verdict": "invalid", "status": "invalid",
-                    "score": 0.15, "checks": {**checks, "is_accept_all": False},
-                    "provider": provider_guess or block_name,
-                    "suggestion": suggestion, "reason": "smtp-5xx"
-                }
-            else:
+                # The canary probes count towards accept_all only, not the address's own stages
+                with timed("accept_all", isolate=True) as st:
+                    accept_all = accept_all_cached(domain, hosts, timeout=timeout)
+                    st.outcome = accept_all
+            elif smtp_ok is None:
                 unverifiable = True
 
     if block_name and not checks["smtp_checked"]:
         unverifiable = True
 
-    reason = "unverifiable" if unverifiable else "dns-only"
-    score = _fallback_risky_score({**checks, "unverifiable_provider": unverifiable})
-    return {
-        "email": raw, "verdict": "risky", "status": "risky",
-        "score": round(float(score), 3),
-        "checks": checks, "provider": provider_guess or block_name,
-        "suggestion": suggestion, "reason": reason if reason else (smtp_note or "dns-only"),
-    }
+    return _smtp_verdict(ctx, provider, smtp_ok, accept_all, unverifiable, accept_all_note, smtp_note)
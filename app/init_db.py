@@ -15,6 +15,26 @@ def create_all():
         cols = {c["name"] for c in insp.get_columns("contacts")}
         if "owner_id" not in cols:
             conn.execute(text("ALTER TABLE contacts ADD COLUMN owner_id INTEGER REFERENCES users(id)"))
+        # add updated_at to campaigns (render-cache key)
+        cols = {c["name"] for c in insp.get_columns("campaigns")}
+        if "updated_at" not in cols:
+            conn.execute(text("ALTER TABLE campaigns ADD COLUMN updated_at TIMESTAMP WITH TIME ZONE"))
+        # validation job leases (one worker per job)
+        cols = {c["name"] for c in insp.get_columns("validation_jobs")}
+        if "lease_id" not in cols:
+            conn.execute(text("ALTER TABLE validation_jobs ADD COLUMN lease_id VARCHAR(32)"))
+        if "heartbeat_at" not in cols:
+            conn.execute(text("ALTER TABLE validation_jobs ADD COLUMN heartbeat_at TIMESTAMP WITH TIME ZONE"))
+        # messages by campaign (dispatch, stats)
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_messages_campaign_contact ON messages (campaign_id, contact_id)"))
+        # validation_results.email: one UNIQUE constraint instead of a second unique index
+        # (SQLite can't add constraints; its unique index serves ON CONFLICT just as well)
+        indexes = {i["name"] for i in insp.get_indexes("validation_results")}
+        if conn.dialect.name == "postgresql" and "ix_validation_results_email" in indexes:
+            uniques = {u["name"] for u in insp.get_unique_constraints("validation_results")}
+            if "validation_results_email_key" not in uniques:
+                conn.execute(text("ALTER TABLE validation_results ADD CONSTRAINT validation_results_email_key UNIQUE (email)"))
+            conn.execute(text("DROP INDEX ix_validation_results_email"))
 
     # seed an admin if none exists
     db = SessionLocal()
@@ -15,13 +15,15 @@ from schemas import (
     CampaignStats, SendSelectedIn,
     ComposeIn,
 )
-from tasks import enqueue_send
+from dispatch import audience, dispatch, selected
 
 # Routers
 from routers import auth as auth_router
 from routers import contacts as contacts_router
 from routers import admin_users as admin_users_router
 from routers import contacts_import_mapping as contacts_import_mapping_router  # <-- NEW
+from routers import validation_jobs as validation_jobs_router
+from routers import metrics as metrics_router
 
 API_TOKEN = os.getenv("API_TOKEN", "dev-token-change-me")
 
@@ -48,6 +50,7 @@ def require_token(x_api_key: Optional[str] = Header(None)):
 app.include_router(auth_router.router, prefix="/api")
 app.include_router(contacts_router.router, prefix="/api")
 app.include_router(admin_users_router.router, prefix="/api")
+app.include_router(validation_jobs_router.router, prefix="/api")
 
 
 # Bulk Upload + Mapping (Preview -> Commit)
@@ -58,6 +61,9 @@ app.include_router(
     dependencies=[Depends(require_token)]
 )
 
+# Validation metrics (x-api-key, so scrapers don't need a user login)
+app.include_router(metrics_router.router, prefix="/api", dependencies=[Depends(require_token)])
+
 @app.get("/health")
 def health():
     return {"ok": True}
@@ -73,24 +79,16 @@ def create_campaign(payload: CampaignIn, db: Session = Depends(get_db)):
     return c
 
 @app.post("/campaigns/{campaign_id}/send", dependencies=[Depends(require_token)])
-def send_campaign(campaign_id: int, status_filter: str = "valid", db: Session = Depends(get_db)):
+def send_campaign(campaign_id: int, status_filter: str = "valid", owner_id: Optional[int] = None,
+                  db: Session = Depends(get_db)):
     campaign = db.get(Campaign, campaign_id)
     if not campaign:
         raise HTTPException(404, "Campaign not found")
 
-    contacts = db.execute(
-        select(Message).where(Message.campaign_id == campaign_id)
-    ).scalars().all()
-
-    if not contacts:
-        return {"enqueued": 0, "note": f"No contacts with status={status_filter}"}
-
-    created = 0
-    for c in contacts:
-        m = Message(campaign_id=campaign_id, contact_id=c.id, status="queued")
-        db.add(m); db.flush(); enqueue_send(m.id); created += 1
-    db.commit()
-    return {"enqueued": created}
+    result = dispatch(db, campaign_id, [audience(status_filter, owner_id)])
+    if not result["enqueued"]:
+        return {"enqueued": 0, "note": f"No contacts with status={status_filter} left to send"}
+    return result
 
 @app.post("/campaigns/{campaign_id}/send_selected", dependencies=[Depends(require_token)])
 def send_selected_contacts(campaign_id: int, payload: SendSelectedIn, db: Session = Depends(get_db)):
@@ -100,12 +98,7 @@ def send_selected_contacts(campaign_id: int, payload: SendSelectedIn, db: Sessio
     if not payload.contact_ids:
         return {"enqueued": 0, "note": "No contacts selected"}
 
-    enq = 0
-    for cid in payload.contact_ids:
-        m = Message(campaign_id=camp.id, contact_id=cid, status="queued")
-        db.add(m); db.flush(); enqueue_send(m.id); enq += 1
-    db.commit()
-    return {"enqueued": enq}
+    return dispatch(db, camp.id, selected(payload.contact_ids))
 
 @app.get("/campaigns/{campaign_id}/stats", response_model=CampaignStats, dependencies=[Depends(require_token)])
 def campaign_stats(campaign_id: int, db: Session = Depends(get_db)):
@@ -136,7 +129,8 @@ def compose_and_send(payload: ComposeIn, db: Session = Depends(get_db)):
     status_map = {"valid": "valid", "invalid": "invalid", "risky": "risky"}
 
     from models import Contact
-    from email_validation import validate_email_record
+    from reprobe import defer_if_temp
+    from validation_store import validate_cached
 
     for addr in extra_emails:
         row = db.execute(select(Contact).where(Contact.email == addr)).scalar_one_or_none()
@@ -144,10 +138,11 @@ def compose_and_send(payload: ComposeIn, db: Session = Depends(get_db)):
             row = Contact(email=addr, status="new")
             db.add(row); db.flush()
         if payload.validate_extras:
-            res = validate_email_record(addr, timeout=6.0, do_smtp=True)
+            res = validate_cached(db, addr, timeout=6.0, do_smtp=True, force=payload.force_validation)
             row.status = status_map.get(res["verdict"], "unknown")
             row.reason = res.get("reason")
             row.provider = res.get("provider")
+            defer_if_temp(res)
         target_ids.add(row.id)
     db.commit()
 
@@ -160,21 +155,11 @@ def compose_and_send(payload: ComposeIn, db: Session = Depends(get_db)):
             "note": "No recipients"
         }
 
-    valid_rows = db.execute(
-        select(Contact)
-        .where(Contact.id.in_(list(target_ids)))
-        .where(Contact.status == "valid")
-    ).scalars().all()
-
-    enq = 0
-    for c in valid_rows:
-        m = Message(campaign_id=camp.id, contact_id=c.id, status="queued")
-        db.add(m); db.flush(); enqueue_send(m.id); enq += 1
-    db.commit()
+    result = dispatch(db, camp.id, [s.where(Contact.status == "valid") for s in selected(target_ids)])
 
     return {
         "campaign_id": camp.id,
         "selected": len(target_ids),
-        "valid_recipients": len(valid_rows),
-        "enqueued": enq
+        "valid_recipients": result["enqueued"],  # a new campaign: every valid recipient is queued
+        "enqueued": result["enqueued"]
     }
@@ -0,0 +1,177 @@
+# merge_tags.py
+"""
+Per-recipient merge tags in campaign subject/html/text.
+
+  {{first_name}}              the contact's first name, or "" when empty
+  {{first_name|there}}        ... or "there" when empty ("{{company|"your team"}}" keeps spaces)
+
+Fields: the Contact columns in FIELDS. Anything else between braces is left as written,
+so stray "{{" in CSS or scripts is harmless.
+
+A campaign's three templates are parsed once per version (campaign id, updated_at) into
+a plan of literal chunks and slots; rendering for a contact is a single join, no
+re-parsing. Values are escaped for where the tag sits in the HTML body: text and quoted
+attribute values are HTML-escaped, and quoted href/src (etc.) values must also be
+absolute http(s) or mailto links. Anywhere else inside a tag (unquoted values, attribute
+names, on* handlers, style) a contact value can't be made safe, so the tag always renders
+its default there, as does a URL that fails the check. Text body values are used as-is;
+subject values too, except that line breaks and other control characters become a space,
+so a value can't end the Subject header or add headers of its own. Defaults are campaign
+content, written by the author, and are inserted unescaped.
+
+For the Web API the same plan is emitted with a substitution key per slot, so a 1000-
+recipient batch still shares one body and SendGrid fills in each recipient's values.
+"""
+import os, re, html, threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Mapping, Optional, Tuple, Union
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+MERGE_TAG_CACHE_SIZE = int(os.getenv("MERGE_TAG_CACHE_SIZE", "256"))
+
+FIELDS = ("first_name", "last_name", "email", "company", "role", "website", "phone", "linkedin_url")
+_TAG = re.compile(r"\{\{\s*([A-Za-z_]+)\s*(?:\|\s*(\"[^\"]*\"|'[^']*'|[^}]*?)\s*)?\}\}")
+# Inside a start tag, in the (possibly still open) value of attribute `name`; group 2 is its quote
+_ATTR = re.compile(r"([A-Za-z_:][-A-Za-z0-9_:.]*)\s*=\s*([\"']?)[^\"'>]*$")
+_URL_ATTRS = {"href", "src", "action", "background", "poster", "cite", "formaction"}
+_SAFE_URL = re.compile(r"^(https?://|mailto:)[^\s]*$", re.I)
+_CONTROL = re.compile(r"[\x00-\x1f\x7f]+")
+
+TEXT, HEADER, HTML_TEXT, HTML_ATTR, HTML_URL, UNSAFE = "text", "header", "html", "attr", "url", "unsafe"
+
+
+class Slot:
+    __slots__ = ("field", "default", "context")
+
+    def __init__(self, field: str, default: str, context: str):
+        self.field = field
+        self.default = default
+        self.context = context
+
+    def value(self, values: Mapping[str, Optional[str]]) -> str:
+        v = (values.get(self.field) or "").strip()
+        if not v or self.context == UNSAFE:
+            return self.default
+        if self.context == TEXT:
+            return v
+        if self.context == HEADER:
+            return _CONTROL.sub(" ", v)
+        if self.context == HTML_URL and not _SAFE_URL.match(v):
+            return self.default
+        return html.escape(v, quote=True)
+
+
+def _context(source: str, end: int) -> str:
+    """Where a tag at source[end] sits in an HTML body, judged from the markup before it."""
+    lt, gt = source.rfind("<", 0, end), source.rfind(">", 0, end)
+    if lt <= gt:
+        return HTML_TEXT
+    m = _ATTR.search(source, lt, end)
+    if m is None or not m.group(2):
+        return UNSAFE  # attribute name or unquoted value: escaping can't keep a value in place
+    name = m.group(1).lower()
+    if name.startswith("on") or name == "style":
+        return UNSAFE  # script / CSS, where HTML escaping means nothing
+    return HTML_URL if name in _URL_ATTRS else HTML_ATTR
+
+
+class Template:
+    __slots__ = ("parts", "slots")
+
+    def __init__(self, source: Optional[str], is_html: bool = False, header: bool = False):
+        self.parts: List[Union[str, Slot]] = []
+        self.slots: List[Slot] = []
+        if not source:
+            return
+        pos = 0
+        for m in _TAG.finditer(source):
+            field = m.group(1).lower()
+            if field not in FIELDS:
+                continue
+            default = (m.group(2) or "").strip()
+            if len(default) >= 2 and default[0] == default[-1] and default[0] in "\"'":
+                default = default[1:-1]
+            context = _context(source, m.start()) if is_html else HEADER if header else TEXT
+            slot = Slot(field, default, context)
+            if m.start() > pos:
+                self.parts.append(source[pos:m.start()])
+            self.parts.append(slot)
+            self.slots.append(slot)
+            pos = m.end()
+        if pos < len(source):
+            self.parts.append(source[pos:])
+
+    def render(self, values: Mapping[str, Optional[str]]) -> str:
+        return "".join([p if p.__class__ is str else p.value(values) for p in self.parts])
+
+    def with_keys(self, key_of: Dict[int, str]) -> str:
+        """The template with each slot replaced by its substitution key."""
+        return "".join([p if p.__class__ is str else key_of[id(p)] for p in self.parts])
+
+
+class CampaignTemplate:
+    """Compiled subject / html_body / text_body of one campaign version."""
+
+    def __init__(self, subject: Optional[str], html_body: Optional[str], text_body: Optional[str]):
+        self.sources = (subject, html_body, text_body)
+        self.subject = Template(subject, header=True)
+        self.html = Template(html_body, is_html=True)
+        self.text = Template(text_body)
+        self.slots = self.subject.slots + self.html.slots + self.text.slots
+        self.personalized = bool(self.slots)
+        # False when only the subject has tags: the encoded body can still be shared
+        self.body_personalized = bool(self.html.slots or self.text.slots)
+        # Web API form: one key per slot ("{{first_name}}" in html and in text may escape differently)
+        self._keys = {id(s): f"%%zs{i}%%" for i, s in enumerate(self.slots)}
+
+    def render(self, values: Mapping[str, Optional[str]]) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """(subject, html, text) for one contact; unchanged sources when there are no tags."""
+        if not self.personalized:
+            return self.sources
+        subject, html_body, text_body = self.sources
+        return (
+            self.subject.render(values) if subject is not None else None,
+            self.html.render(values) if html_body is not None else None,
+            self.text.render(values) if text_body is not None else None,
+        )
+
+    def keyed_sources(self) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """(subject, html, text) with substitution keys in place of the tags."""
+        subject, html_body, text_body = self.sources
+        return (
+            self.subject.with_keys(self._keys) if subject is not None else None,
+            self.html.with_keys(self._keys) if html_body is not None else None,
+            self.text.with_keys(self._keys) if text_body is not None else None,
+        )
+
+    def substitutions(self, values: Mapping[str, Optional[str]]) -> Dict[str, str]:
+        return {self._keys[id(s)]: s.value(values) for s in self.slots}
+
+
+def contact_values(row) -> Dict[str, Optional[str]]:
+    """Merge values from a Contact (or any object / mapping with the FIELDS)."""
+    if isinstance(row, Mapping):
+        return {f: row.get(f) for f in FIELDS}
+    return {f: getattr(row, f, None) for f in FIELDS}
+
+
+_plans: "OrderedDict[Hashable, CampaignTemplate]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def compile_campaign(key: Hashable, subject: Optional[str], html_body: Optional[str],
+                     text_body: Optional[str]) -> CampaignTemplate:
+    """The compiled templates for a campaign version `key` (campaign id, updated_at); LRU-cached."""
+    with _lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+    plan = CampaignTemplate(subject, html_body, text_body)
+    with _lock:
+        _plans[key] = plan
+        while len(_plans) > max(1, MERGE_TAG_CACHE_SIZE):
+            _plans.popitem(last=False)
+    return plan
@@ -0,0 +1,145 @@
+# mime_cache.py
+"""
+Per-process cache of rendered campaign bodies for the SMTP sender.
+
+Building a MIMEMultipart and serialising it re-encodes the same html/text body (base64
+for UTF-8) for every recipient. Here the body parts are encoded once per campaign
+version, keyed by (campaign id, updated_at), and stored as ready-to-send bytes. A
+recipient's message is then its Subject/From/To block spliced in front of those bytes.
+
+Entries are evicted least-recently-used first, beyond MIME_CACHE_ENTRIES or
+MIME_CACHE_MAX_BYTES, so editing campaigns (new updated_at) can't grow memory.
+
+Bodies that differ per recipient (merge tags) can't be cached; personal_message() frames
+them directly (UTF-8 base64 parts, fixed headers) rather than through MIMEMultipart.
+"""
+import os, uuid, base64, threading
+from collections import OrderedDict
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import compat32
+from typing import Hashable, Optional
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+MIME_CACHE_ENTRIES = int(os.getenv("MIME_CACHE_ENTRIES", "64"))
+MIME_CACHE_MAX_BYTES = int(os.getenv("MIME_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+_CRLF = "\r\n"
+# Same serialisation as msg.as_string(), with SMTP line endings
+_POLICY = compat32.clone(linesep=_CRLF)
+
+
+def encode_header(name: str, value: str) -> bytes:
+    """One `Name: value` header line (RFC 2047-encoded when not ASCII), CRLF-terminated."""
+    try:
+        value.encode("ascii")
+        h = Header(value, header_name=name)
+    except UnicodeEncodeError:
+        h = Header(value, "utf-8", header_name=name)
+    return f"{name}: {h.encode(linesep=_CRLF)}{_CRLF}".encode("ascii")
+
+
+class RenderedBody:
+    """The message minus its per-recipient headers: MIME headers (with the boundary) + encoded parts."""
+    __slots__ = ("mime_headers", "body", "subject")
+
+    def __init__(self, mime_headers: bytes, body: bytes, subject: Optional[bytes]):
+        self.mime_headers = mime_headers
+        self.body = body
+        self.subject = subject
+
+    @property
+    def size(self) -> int:
+        return len(self.mime_headers) + len(self.body)
+
+    def message(self, from_header: str, to_email: str, subject: Optional[str] = None) -> bytes:
+        """Full message for one recipient. `subject` overrides the cached one (personalised subjects)."""
+        subject_line = encode_header("Subject", subject) if subject is not None else self.subject or b""
+        return b"".join((
+            self.mime_headers,
+            subject_line,
+            encode_header("From", from_header),
+            encode_header("To", to_email),
+            b"\r\n",
+            self.body,
+        ))
+
+
+def render(subject: Optional[str], html: Optional[str], text: Optional[str]) -> RenderedBody:
+    msg = MIMEMultipart("alternative")
+    if text:
+        msg.attach(MIMEText(text, "plain"))
+    if html:
+        msg.attach(MIMEText(html, "html"))
+    raw = msg.as_bytes(policy=_POLICY)
+    head, body = raw.split(b"\r\n\r\n", 1)
+    return RenderedBody(head + b"\r\n", body, encode_header("Subject", subject) if subject is not None else None)
+
+
+_PART_HEADERS = {
+    subtype: (f'Content-Type: text/{subtype}; charset="utf-8"{_CRLF}MIME-Version: 1.0{_CRLF}'
+              f"Content-Transfer-Encoding: base64{_CRLF}{_CRLF}").encode("ascii")
+    for subtype in ("plain", "html")
+}
+
+
+def personal_message(subject: Optional[str], html: Optional[str], text: Optional[str],
+                     from_header: str, to_email: str) -> bytes:
+    """One recipient's multipart/alternative message, same layout as render() + message()."""
+    boundary = f"===============zs{uuid.uuid4().hex}==".encode("ascii")
+    out = [
+        b'Content-Type: multipart/alternative; boundary="' + boundary + b'"\r\nMIME-Version: 1.0\r\n',
+        encode_header("Subject", subject) if subject is not None else b"",
+        encode_header("From", from_header),
+        encode_header("To", to_email),
+        b"\r\n",
+    ]
+    for subtype, content in (("plain", text), ("html", html)):
+        if content:
+            out += (b"--", boundary, b"\r\n", _PART_HEADERS[subtype],
+                    base64.encodebytes(content.encode("utf-8")).replace(b"\n", b"\r\n"))
+    out += (b"--", boundary, b"--\r\n")
+    return b"".join(out)
+
+
+class RenderCache:
+    def __init__(self, max_entries: int = MIME_CACHE_ENTRIES, max_bytes: int = MIME_CACHE_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, RenderedBody]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, subject: Optional[str], html: Optional[str], text: Optional[str]) -> RenderedBody:
+        """The rendered body for `key` (a campaign version), rendering it on first use."""
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+                return hit
+        rendered = render(subject, html, text)  # outside the lock; a rare duplicate render is harmless
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = rendered
+            self._bytes += rendered.size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return rendered
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+render_cache = RenderCache()
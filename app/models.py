@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, func
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, func, Float, Boolean, JSON, Index
 from sqlalchemy.orm import relationship
 import enum
 from db import Base
@@ -40,6 +40,8 @@ class Campaign(Base):
     html_body = Column(Text, nullable=True)
     text_body = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Part of the sender's render-cache key: bump it whenever the content changes
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 class Message(Base):
     __tablename__ = "messages"
@@ -53,6 +55,59 @@ class Message(Base):
     campaign = relationship("Campaign")
     contact = relationship("Contact")
 
+    # Campaign stats, and the "already queued/sent?" check when dispatching
+    __table_args__ = (Index("ix_messages_campaign_contact", "campaign_id", "contact_id"),)
+
+class ValidationResult(Base):
+    """Last validation outcome per normalized email, so fresh results can be reused."""
+    __tablename__ = "validation_results"
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String(320), unique=True, nullable=False)  # the unique constraint is the lookup index
+    verdict = Column(String(20), nullable=False)
+    reason = Column(String(255), nullable=True)
+    provider = Column(String(80), nullable=True)
+    suggestion = Column(String(255), nullable=True)
+    score = Column(Float, nullable=True)
+    checks = Column(JSON, nullable=True)
+
+    # probe metadata
+    smtp_probed = Column(Boolean, nullable=False, default=False)
+    duration_ms = Column(Integer, nullable=True)
+    checked_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class ValidationJob(Base):
+    """Background validation of a contact selection; processed in chunks from `checkpoint`."""
+    __tablename__ = "validation_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status = Column(String(20), nullable=False, default="queued")  # queued/running/done/cancelled/failed
+
+    # selection + options
+    contact_ids = Column(JSON, nullable=True)
+    status_filter = Column(String(20), nullable=True)
+    do_smtp = Column(Boolean, nullable=False, default=False)
+    force = Column(Boolean, nullable=False, default=False)
+    timeout = Column(Float, nullable=False, default=6.0)
+    concurrency = Column(Integer, nullable=False, default=20)
+
+    # contact ids in processing (domain-sorted) order, fixed when the job first runs
+    items = Column(JSON, nullable=True)
+    total = Column(Integer, nullable=False, default=0)
+    checkpoint = Column(Integer, nullable=False, default=0)  # items[:checkpoint] are done
+    valid = Column(Integer, nullable=False, default=0)
+    invalid = Column(Integer, nullable=False, default=0)
+    risky = Column(Integer, nullable=False, default=0)
+    unknown = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+
+    # the run that owns the job, and its last check-in (after every chunk)
+    lease_id = Column(String(32), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
 class RoleEnum(str, enum.Enum):
     user = "user"
     admin = "admin"
@@ -0,0 +1,159 @@
+# mx_health.py
+"""
+Per-host SMTP health: latency estimates, adaptive timeouts and a circuit breaker.
+
+Used by the validator's MX probes and by the sender's relay connections. Each host
+keeps a smoothed latency/variance pair per stage ("connect" = TCP + banner,
+"response" = one command round-trip, "rcpt" = a RCPT TO round-trip), TCP-RTO style, and
+the timeout we grant it is derived from those numbers instead of always paying
+VALIDATION_TIMEOUT. RCPT is tracked on its own: servers look the mailbox up (or tarpit)
+there, so it is legitimately much slower than EHLO/MAIL and is always given the caller's
+full timeout rather than an estimate.
+
+After HEALTH_FAILURE_THRESHOLD consecutive failures the circuit opens and the host is
+skipped. Once the cool-down has passed a single half-open trial is let through; success
+closes the circuit, failure re-opens it with a doubled cool-down.
+State is per process.
+"""
+import os, time, threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+HEALTH_FAILURE_THRESHOLD = int(os.getenv("HEALTH_FAILURE_THRESHOLD", "5"))
+HEALTH_OPEN_SECONDS = float(os.getenv("HEALTH_OPEN_SECONDS", "60"))
+HEALTH_MAX_OPEN_SECONDS = float(os.getenv("HEALTH_MAX_OPEN_SECONDS", "900"))
+# Never grant less than this, however fast a host has been
+HEALTH_MIN_TIMEOUT = float(os.getenv("HEALTH_MIN_TIMEOUT", "1.5"))
+# Hosts tracked per process; the least recently used ones are forgotten first
+HEALTH_MAX_HOSTS = int(os.getenv("HEALTH_MAX_HOSTS", "10000"))
+# EWMA weights (same as TCP's RTO estimator)
+_ALPHA = 0.125
+_BETA = 0.25
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class _Estimator:
+    __slots__ = ("srtt", "rttvar", "samples")
+
+    def __init__(self):
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.samples = 0
+
+    def add(self, sample: float) -> None:
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = (1 - _BETA) * self.rttvar + _BETA * abs(self.srtt - sample)
+            self.srtt = (1 - _ALPHA) * self.srtt + _ALPHA * sample
+        self.samples += 1
+
+    def timeout(self, default: float) -> float:
+        if self.srtt is None:
+            return default
+        return max(HEALTH_MIN_TIMEOUT, min(default, self.srtt + 4 * self.rttvar))
+
+
+class HostHealth:
+    def __init__(self):
+        self.stages: Dict[str, _Estimator] = {"connect": _Estimator(), "response": _Estimator(), "rcpt": _Estimator()}
+        self.failure_rate = 0.0          # EWMA of failures (0..1)
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.open_for = HEALTH_OPEN_SECONDS
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trial_started = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            **{
+                f"{name}_ms": round(e.srtt * 1000, 1) if e.srtt is not None else None
+                for name, e in self.stages.items()
+            },
+        }
+
+
+class HealthRegistry:
+    def __init__(self, max_hosts: int = HEALTH_MAX_HOSTS):
+        self.max_hosts = max(1, max_hosts)
+        self._hosts: "OrderedDict[str, HostHealth]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, host: str) -> HostHealth:
+        h = self._hosts.get(host)
+        if h is None:
+            h = self._hosts[host] = HostHealth()
+            while len(self._hosts) > self.max_hosts:
+                self._hosts.popitem(last=False)
+        else:
+            self._hosts.move_to_end(host)
+        return h
+
+    def allow(self, host: str) -> bool:
+        """
+        May we talk to `host` now? Call once per attempt: in half-open state it hands out
+        the single trial slot (re-issued if a trial never reports back).
+        """
+        with self._lock:
+            h = self._get(host.lower())
+            if h.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if h.state == OPEN and now - h.opened_at >= h.open_for:
+                h.state = HALF_OPEN
+                h.trial_in_flight = False
+            if h.state == HALF_OPEN and (not h.trial_in_flight or now - h.trial_started >= h.open_for):
+                h.trial_in_flight = True
+                h.trial_started = now
+                return True
+            return False
+
+    def timeout_for(self, host: str, default: float, stage: str = "connect") -> float:
+        with self._lock:
+            return self._get(host.lower()).stages[stage].timeout(default)
+
+    def record_success(self, host: str, stage: str = "connect", latency: Optional[float] = None) -> None:
+        with self._lock:
+            h = self._get(host.lower())
+            if latency is not None:
+                h.stages[stage].add(latency)
+            h.failure_rate *= (1 - _ALPHA)
+            h.consecutive_failures = 0
+            if h.state != CLOSED:
+                h.state = CLOSED
+                h.trial_in_flight = False
+                h.open_for = HEALTH_OPEN_SECONDS
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            h = self._get(host.lower())
+            h.failure_rate = (1 - _ALPHA) * h.failure_rate + _ALPHA
+            h.consecutive_failures += 1
+            if h.state == HALF_OPEN:
+                h.open_for = min(HEALTH_MAX_OPEN_SECONDS, h.open_for * 2)
+                self._open(h)
+            elif h.state == CLOSED and h.consecutive_failures >= HEALTH_FAILURE_THRESHOLD:
+                self._open(h)
+
+    @staticmethod
+    def _open(h: HostHealth) -> None:
+        h.state = OPEN
+        h.opened_at = time.monotonic()
+        h.trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {host: h.snapshot() for host, h in self._hosts.items()}
+
+
+# Process-wide registry shared by the validator and the sender
+health = HealthRegistry()
@@ -0,0 +1,102 @@
+# prescreen.py
+"""
+Vectorized offline pre-screen for uploaded lists.
+
+Runs the network-free checks of email_validation (syntax, disposable, role account,
+free provider, typo hint) over a whole column in one pandas pass instead of one Python
+call per address. Rows that are obviously invalid never reach the DNS/SMTP stage, and
+the unique domain set is handed back so DNS can be prefetched once per domain.
+contexts() turns the surviving rows into the bulk engine's precheck results, so the
+engine doesn't repeat these checks address by address.
+"""
+from typing import Dict, Iterable, Set, Tuple, Union
+
+import pandas as pd
+
+from email_validation import (
+    EMAIL_REGEX, check_syntax, typo_suggestion, is_disposable, is_role_account, is_free_provider,
+)
+
+COLUMNS = ["email", "normalized", "local", "domain", "syntax_ok",
+           "is_disposable", "is_role_address", "is_free_provider", "suggestion"]
+
+
+def prescreen_series(emails: Union[pd.Series, Iterable[str]]) -> Tuple[pd.DataFrame, Set[str]]:
+    """
+    Classify a column of addresses. Accepts a pandas Series or anything pd.Series() takes
+    (lists, numpy/Arrow arrays).
+
+    Returns (frame, domains): one row per input with the COLUMNS above (index preserved),
+    and the set of lower-cased domains of the syntactically valid rows.
+    """
+    raw = emails if isinstance(emails, pd.Series) else pd.Series(list(emails), dtype=object)
+    raw = raw.fillna("").astype(str)
+
+    # same normalization as email_validation.normalize
+    norm = raw.str.strip().str.strip('";').str.replace(" ", "", regex=False)
+    parts = norm.str.extract(EMAIL_REGEX)
+    local, domain = parts["local"], parts["domain"]
+    syntax_ok = domain.notna()
+
+    # The regex is stricter than email_validator (unicode, quoted locals). Give the few
+    # rows it rejects the full scalar check before calling them invalid.
+    for idx in syntax_ok.index[~syntax_ok & (norm != "")]:
+        ok, lp, dp = check_syntax(norm.at[idx])
+        if ok and lp and dp:
+            local.at[idx], domain.at[idx] = lp, dp
+            syntax_ok.at[idx] = True
+
+    domain_l = domain.str.lower()
+    role_root = local.str.split("+").str[0].str.split(".").str[0].str.lower()
+
+    # List lookups run once per distinct value, then broadcast over the column
+    domains = set(domain_l[syntax_ok].dropna().unique())
+    roots = set(role_root[syntax_ok].dropna().unique())
+    disposable = {d: is_disposable(d) for d in domains}
+    free = {d: is_free_provider(d) for d in domains}
+    role = {r: is_role_account(r) for r in roots}
+
+    def _flag(values: pd.Series, table: dict) -> pd.Series:
+        return values.map(table).eq(True) & syntax_ok
+
+    frame = pd.DataFrame({
+        "email": raw,
+        "normalized": norm,
+        "local": local,
+        "domain": domain,
+        "syntax_ok": syntax_ok,
+        "is_disposable": _flag(domain_l, disposable),
+        "is_role_address": _flag(role_root, role),
+        "is_free_provider": _flag(domain_l, free),
+    }, index=raw.index)
+
+    hints = {d: typo_suggestion(d) for d in domains}
+    suggestion = domain_l.map(hints).astype(object)
+    frame["suggestion"] = suggestion.where(suggestion.notna() & syntax_ok, None)
+    return frame[COLUMNS], domains
+
+
+def contexts(frame: pd.DataFrame) -> Dict[str, dict]:
+    """
+    {input email: precheck context} for the syntactically valid rows of a prescreen frame,
+    in the shape of email_validation._precheck's ctx (see bulk_validation's `prechecked`).
+    """
+    out: Dict[str, dict] = {}
+    for row in frame[frame["syntax_ok"]].itertuples(index=False):
+        local, domain = row.local.lower(), row.domain.lower()  # as check_syntax returns them
+        out[row.email] = {
+            "raw": row.email, "email": row.normalized, "local": local, "domain": domain,
+            "suggestion": row.suggestion or None,
+            "checks": {
+                "has_valid_address_syntax": True,
+                "has_mx_or_a_record": False,
+                "is_disposable": bool(row.is_disposable),
+                "is_role_address": bool(row.is_role_address),
+                "is_free_provider": bool(row.is_free_provider),
+                "is_accept_all": None,
+                "smtp_checked": False,
+                "smtp_deliverable": False,
+                "domain": domain,
+            },
+        }
+    return out
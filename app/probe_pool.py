@@ -0,0 +1,176 @@
+# probe_pool.py
+"""
+Per-process pool of warm SMTP probe sessions, keyed by MX host.
+
+Single-address checks (validate_one, revalidate) would otherwise pay TCP + banner + EHLO
++ STARTTLS + EHLO for every call. A finished probe hands its session back instead of
+sending QUIT. The caller resets the transaction with RSET, and the next probe to the same
+host picks the session up and goes straight to MAIL FROM / RCPT TO.
+
+Sessions are dropped after PROBE_POOL_IDLE_SECONDS unused, after PROBE_POOL_MAX_USES
+probes, or as soon as the server answers 421 or the connection breaks. At most
+PROBE_POOL_MAX_PER_HOST sessions per host are open through the pool; beyond that callers
+get one-off connections. The pool is SMTP-agnostic: the validator supplies the liveness
+check and the goodbye.
+"""
+import os, time, threading
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, Optional
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+PROBE_POOL_ENABLED = os.getenv("PROBE_POOL_ENABLED", "true").lower() == "true"
+PROBE_POOL_MAX_PER_HOST = int(os.getenv("PROBE_POOL_MAX_PER_HOST", "2"))
+# Well under the 5 minutes RFC 5321 asks servers to wait; many cut idle clients sooner
+PROBE_POOL_IDLE_SECONDS = float(os.getenv("PROBE_POOL_IDLE_SECONDS", "30"))
+PROBE_POOL_MAX_USES = int(os.getenv("PROBE_POOL_MAX_USES", "50"))
+
+
+class ProbeSession:
+    """An SMTP connection past EHLO (and STARTTLS when offered)."""
+    __slots__ = ("host", "sock", "fh", "tls", "created", "last_used", "uses", "pooled", "pending_reset")
+
+    def __init__(self, host: str, sock, fh, tls: bool = False):
+        self.host = host.lower()
+        self.sock = sock
+        self.fh = fh
+        self.tls = tls
+        self.created = self.last_used = time.monotonic()
+        self.uses = 0
+        self.pooled = False          # counts against the host's cap
+        self.pending_reset = False   # RSET sent, reply not read yet
+
+    def close(self) -> None:
+        for part in (self.fh, self.sock):
+            try:
+                part.close()
+            except Exception:
+                pass
+
+
+class ProbePool:
+    def __init__(self, max_per_host: int = PROBE_POOL_MAX_PER_HOST, idle_seconds: float = PROBE_POOL_IDLE_SECONDS,
+                 max_uses: int = PROBE_POOL_MAX_USES, enabled: bool = PROBE_POOL_ENABLED):
+        self.max_per_host = max(0, max_per_host)
+        self.idle_seconds = idle_seconds
+        self.max_uses = max(1, max_uses)
+        self.enabled = enabled and self.max_per_host > 0
+        self._idle: Dict[str, Deque[ProbeSession]] = {}
+        self._open: Dict[str, int] = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _expired(self, s: ProbeSession, now: float) -> bool:
+        return now - s.last_used > self.idle_seconds or s.uses >= self.max_uses
+
+    def _forget(self, s: ProbeSession) -> None:
+        """Caller holds the lock."""
+        if s.pooled:
+            s.pooled = False
+            n = self._open.get(s.host, 1) - 1
+            if n > 0:
+                self._open[s.host] = n
+            else:
+                self._open.pop(s.host, None)
+
+    def acquire(self, hosts: Iterable[str], check: Callable[[ProbeSession], bool]) -> Optional[ProbeSession]:
+        """
+        A live idle session for the first of `hosts` that has one, else None.
+        `check` confirms the session still works (e.g. reads the reply to the RSET sent on release).
+        """
+        if not self.enabled:
+            return None
+        if time.monotonic() - self._last_sweep > self.idle_seconds:
+            self.sweep()  # sessions of hosts nobody asks for again
+        for host in hosts:
+            host = host.lower()
+            while True:
+                now = time.monotonic()
+                with self._lock:
+                    idle = self._idle.get(host)
+                    s = idle.pop() if idle else None  # most recently used first
+                    if s is not None and self._expired(s, now):
+                        self._forget(s)
+                        stale = s
+                        s = None
+                    else:
+                        stale = None
+                if stale is not None:
+                    stale.close()
+                    continue
+                if s is None:
+                    break
+                if check(s):
+                    return s
+                self.discard(s)
+        return None
+
+    def adopt(self, s: ProbeSession) -> None:
+        """Register a freshly opened session so it may be pooled on release (if the host has room)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._open.get(s.host, 0) < self.max_per_host:
+                self._open[s.host] = self._open.get(s.host, 0) + 1
+                s.pooled = True
+
+    def release(self, s: ProbeSession, reusable: bool, goodbye: Callable[[ProbeSession], None]) -> None:
+        """Return a session after a probe. Non-reusable or over-cap sessions get `goodbye` (QUIT) and close."""
+        s.uses += 1
+        s.last_used = time.monotonic()
+        if reusable and s.pooled and not self._expired(s, s.last_used):
+            with self._lock:
+                self._idle.setdefault(s.host, deque()).append(s)
+            return
+        self.discard(s, goodbye)
+
+    def discard(self, s: ProbeSession, goodbye: Optional[Callable[[ProbeSession], None]] = None) -> None:
+        with self._lock:
+            self._forget(s)
+        if goodbye is not None:
+            try:
+                goodbye(s)
+            except Exception:
+                pass
+        s.close()
+
+    def sweep(self) -> int:
+        """Close idle sessions past their idle timeout. Returns how many were closed."""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            self._last_sweep = now
+            for host, idle in list(self._idle.items()):
+                keep: Deque[ProbeSession] = deque()
+                for s in idle:
+                    if self._expired(s, now):
+                        self._forget(s)
+                        stale.append(s)
+                    else:
+                        keep.append(s)
+                if keep:
+                    self._idle[host] = keep
+                else:
+                    del self._idle[host]
+        for s in stale:
+            s.close()
+        return len(stale)
+
+    def clear(self) -> None:
+        """Close every idle session (sessions in use are closed when released)."""
+        with self._lock:
+            idle = [s for q in self._idle.values() for s in q]
+            self._idle.clear()
+            for s in idle:
+                self._forget(s)
+        for s in idle:
+            s.close()
+
+    def stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {h: {"open": n, "idle": len(self._idle.get(h, ()))} for h, n in self._open.items()}
+
+
+# Process-wide pool used by the synchronous validator
+probe_pool = ProbePool()
@@ -0,0 +1,85 @@
+# provider_index.py
+"""
+Domain -> provider classification with reversed-label suffix tries.
+
+Rules are domain suffixes ("google.com" covers "aspmx.l.google.com"), stored label by
+label from the TLD down, so a lookup costs one dict step per label of the name being
+classified however many rules there are. The most specific (longest) matching suffix wins.
+
+Two rule kinds:
+  domain   recipient domains whose provider refuses mailbox verification (provider_blocks_smtp)
+  mx       MX host suffixes used to guess who hosts a domain's mail (check_mx)
+
+Rules file format, one rule per line ('#' starts a comment):
+  <kind> <suffix> <provider name, may contain spaces>
+"""
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+RULE_KINDS = ("domain", "mx")
+_VALUE = ""  # labels are never empty, so this key can hold the node's value
+
+
+class SuffixTrie:
+    def __init__(self):
+        self._root: dict = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, suffix: str, value: str) -> None:
+        node = self._root
+        for label in reversed(suffix.lower().strip(".").split(".")):
+            node = node.setdefault(label, {})
+        if _VALUE not in node:
+            self._size += 1
+        node[_VALUE] = value
+
+    def match(self, name: str) -> Optional[str]:
+        """Value of the longest rule that `name` equals or ends with (at a label boundary)."""
+        node = self._root
+        found = None
+        for label in reversed(name.lower().rstrip(".").split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(_VALUE, found)
+        return found
+
+
+def load_rules(path: str) -> Iterable[Tuple[str, str, str]]:
+    """Yield (kind, suffix, provider) from a rules file; malformed lines are logged and skipped."""
+    with open(path, encoding="utf-8") as fh:
+        for n, line in enumerate(fh, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split(None, 2)
+            if len(parts) != 3 or parts[0] not in RULE_KINDS:
+                log.warning("Provider rules %s:%d: cannot parse %r", path, n, line)
+                continue
+            yield parts[0], parts[1], parts[2].strip()
+
+
+class ProviderIndex:
+    def __init__(self, domain_rules: Dict[str, str], mx_rules: Dict[str, str], path: Optional[str] = None):
+        self.tries = {"domain": SuffixTrie(), "mx": SuffixTrie()}
+        for suffix, name in domain_rules.items():
+            self.tries["domain"].add(suffix, name)
+        for suffix, name in mx_rules.items():
+            self.tries["mx"].add(suffix, name)
+        if path:
+            try:
+                for kind, suffix, name in load_rules(path):
+                    self.tries[kind].add(suffix, name)
+            except OSError as e:
+                log.warning("Provider rules: cannot read %s (%s); using built-in rules only", path, e)
+
+    def domain_provider(self, domain: str) -> Optional[str]:
+        return self.tries["domain"].match(domain)
+
+    def mx_provider(self, host: str) -> Optional[str]:
+        return self.tries["mx"].match(host)
@@ -0,0 +1,219 @@
+# relay_pool.py
+"""
+Per-process pool of authenticated SMTP relay connections for the sender.
+
+Opening a relay connection costs TCP + EHLO + STARTTLS + AUTH, which for our relay is
+more than the DATA transfer of a typical message. The pool keeps up to SMTP_POOL_SIZE
+logged-in connections per process and hands them out one message (or batch) at a time.
+
+A connection is retired after SMTP_MAX_MESSAGES_PER_CONN messages, after
+SMTP_POOL_IDLE_SECONDS unused, or as soon as the relay answers 421 / drops it. One that
+sat idle longer than SMTP_NOOP_AFTER seconds is checked with NOOP before use.
+Per-recipient refusals don't break a connection (smtplib RSETs after them).
+
+Connections are never shared across a fork: a pool used in a new process (Celery
+prefork child) forgets what it inherited and connects afresh.
+"""
+import os, time, atexit, smtplib, threading, logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+log = logging.getLogger("mailer")
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_MAX_MESSAGES_PER_CONN = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONN", "100"))
+SMTP_POOL_IDLE_SECONDS = float(os.getenv("SMTP_POOL_IDLE_SECONDS", "60"))
+SMTP_NOOP_AFTER = float(os.getenv("SMTP_NOOP_AFTER", "5"))
+# How long a sender waits for a free connection when all SMTP_POOL_SIZE are busy
+SMTP_POOL_WAIT = float(os.getenv("SMTP_POOL_WAIT", "60"))
+
+
+def connection_broken(e: Exception) -> bool:
+    """True if `e` means the connection itself is unusable (not just this message refused)."""
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code == 421
+    # SMTPException subclasses OSError; only socket-level errors are left here
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+class RelayConnection:
+    __slots__ = ("server", "created", "last_used", "sent", "pid")
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.created = self.last_used = time.monotonic()
+        self.sent = 0
+        self.pid = os.getpid()
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], msg) -> Dict[str, tuple]:
+        try:
+            return self.server.sendmail(from_addr, to_addrs, msg)
+        finally:
+            self.sent += 1
+            self.last_used = time.monotonic()
+
+    def alive(self) -> bool:
+        try:
+            code, _ = self.server.noop()
+        except Exception:
+            return False
+        return code == 250
+
+    def close(self, quit: bool = True) -> None:
+        if quit:
+            try:
+                self.server.quit()
+                return
+            except Exception:
+                pass
+        try:
+            self.server.close()
+        except Exception:
+            pass
+
+
+class RelayPool:
+    def __init__(self, connect: Callable[[], smtplib.SMTP], size: int = SMTP_POOL_SIZE,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_CONN, idle_seconds: float = SMTP_POOL_IDLE_SECONDS,
+                 noop_after: float = SMTP_NOOP_AFTER, wait: float = SMTP_POOL_WAIT):
+        self._connect = connect
+        self.size = max(1, size)
+        self.max_messages = max(1, max_messages)
+        self.idle_seconds = idle_seconds
+        self.noop_after = noop_after
+        self.wait = wait
+        self._idle: Deque[RelayConnection] = deque()
+        self._open = 0
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+
+    def _after_fork(self) -> None:
+        """Caller holds the lock. The parent's sockets are not ours to talk on: forget them."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle.clear()
+            self._open = 0
+
+    def _retired(self, conn: RelayConnection, now: float) -> bool:
+        return conn.sent >= self.max_messages or now - conn.last_used > self.idle_seconds
+
+    def acquire(self) -> RelayConnection:
+        """A live logged-in connection; connects when none is idle. Raises what the connect raises."""
+        deadline = time.monotonic() + self.wait
+        with self._cond:
+            self._after_fork()
+            while not self._idle and self._open >= self.size:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise RuntimeError("no relay connection free in the pool")
+                self._cond.wait(left)
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._open += 1
+
+        if conn is not None:
+            now = time.monotonic()
+            if self._retired(conn, now):
+                conn.close()
+            elif now - conn.last_used <= self.noop_after or conn.alive():
+                return conn
+            else:
+                conn.close(quit=False)
+        try:
+            return RelayConnection(self._connect())
+        except Exception:
+            self._drop_slot()
+            raise
+
+    def release(self, conn: RelayConnection, reusable: bool = True) -> None:
+        if conn.pid != os.getpid():
+            return  # from before a fork; _after_fork already forgot it
+        if reusable and not self._retired(conn, time.monotonic()):
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+            return
+        conn.close(quit=reusable)
+        self._drop_slot()
+
+    def _drop_slot(self) -> None:
+        with self._cond:
+            self._open = max(0, self._open - 1)
+            self._cond.notify()
+
+    @contextmanager
+    def batch(self) -> Iterator[Callable[[str, List[str], object], Dict[str, tuple]]]:
+        """
+        `with pool.batch() as sendmail:` sends a run of messages over one pooled connection,
+        handing it back (and taking another) only when it is retired or breaks. If a
+        connection that had already been used turns out dead, the message is retried once
+        on a fresh connection.
+        """
+        held: List[Optional[RelayConnection]] = [None]
+
+        def sendmail(from_addr: str, to_addrs: List[str], msg) -> Dict[str, tuple]:
+            for attempt in (1, 2):
+                conn = held[0] = held[0] or self.acquire()
+                reused = conn.sent > 0
+                try:
+                    resp = conn.sendmail(from_addr, to_addrs, msg)
+                except Exception as e:
+                    if not connection_broken(e):
+                        raise
+                    held[0] = None
+                    self.release(conn, reusable=False)
+                    if reused and attempt == 1:
+                        log.info("[SMTP] pooled connection dropped (%r); retrying on a new one", e)
+                        continue
+                    raise
+                if conn.sent >= self.max_messages:
+                    held[0] = None
+                    self.release(conn)
+                return resp
+
+        try:
+            yield sendmail
+        finally:
+            if held[0] is not None:
+                self.release(held[0])
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], msg) -> Dict[str, tuple]:
+        """Send one message over a pooled connection (see batch())."""
+        with self.batch() as send:
+            return send(from_addr, to_addrs, msg)
+
+    def close_all(self) -> None:
+        with self._cond:
+            self._after_fork()
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open = max(0, self._open - len(idle))
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"open": self._open, "idle": len(self._idle), "size": self.size}
+
+
+_pools: List[RelayPool] = []
+
+
+def new_pool(connect: Callable[[], smtplib.SMTP], **kwargs) -> RelayPool:
+    """Create a pool whose idle connections get a QUIT at interpreter exit."""
+    pool = RelayPool(connect, **kwargs)
+    _pools.append(pool)
+    return pool
+
+
+@atexit.register
+def _close_pools() -> None:
+    for pool in _pools:
+        pool.close_all()
@@ -0,0 +1,159 @@
+# reprobe.py
+"""
+Deferred re-probing of greylisted addresses.
+
+A 4xx reply to RCPT TO (reason "smtp-temp") usually means greylisting: the server wants
+us to come back in a few minutes. Instead of leaving the contact "risky" for good, we
+park the address in Redis and let a Celery task re-probe it later.
+
+Layout (per recipient domain, so one re-probe run = one grouped SMTP session):
+  reprobe:dom:<domain>     hash   email -> {"a": attempt, "t": not_before_epoch}
+  reprobe:sched:<domain>   string set while a run for the domain is queued
+
+Backoff follows REPROBE_DELAYS (seconds, one entry per attempt). After the last attempt
+the address keeps its "risky / smtp-temp" status.
+"""
+import os, json, time, logging
+from typing import Optional
+
+from sqlalchemy import select
+
+from db import SessionLocal
+from models import Contact
+from validation_cache import get_redis
+from validation_store import save_results
+
+log = logging.getLogger(__name__)
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+REPROBE_ENABLED = os.getenv("REPROBE_ENABLED", "true").lower() == "true"
+REPROBE_DELAYS = [int(x) for x in os.getenv("REPROBE_DELAYS", "300,900,3600").split(",") if x.strip()]
+REPROBE_TIMEOUT = float(os.getenv("REPROBE_TIMEOUT", "8"))
+
+_KEY = "reprobe:dom:"
+_SCHED = "reprobe:sched:"
+
+STATUS_MAP = {"valid": "valid", "invalid": "invalid", "risky": "risky"}
+
+
+def _domain_of(email: str) -> Optional[str]:
+    return email.rsplit("@", 1)[1].lower() if "@" in email else None
+
+
+def schedule(email: str, attempt: int = 0) -> bool:
+    """Park `email` for a re-probe. Returns False when re-probing is off or out of attempts."""
+    if not REPROBE_ENABLED or attempt >= len(REPROBE_DELAYS):
+        return False
+    domain = _domain_of(email)
+    r = get_redis()
+    if not domain or r is None:
+        return False
+    delay = REPROBE_DELAYS[attempt]
+    try:
+        r.hset(_KEY + domain, email, json.dumps({"a": attempt, "t": time.time() + delay}))
+    except Exception as e:
+        log.warning("Re-probe scheduling failed for %s: %s", email, e)
+        return False
+    _ensure_run(domain, delay)
+    return True
+
+
+def defer_if_temp(res: dict) -> bool:
+    """Hook for validation callers: park greylisted results, ignore everything else."""
+    if res.get("reason") != "smtp-temp":
+        return False
+    return schedule(str(res.get("email", "")).strip().lower())
+
+
+def _ensure_run(domain: str, delay: float) -> None:
+    """Queue one run per domain; addresses added meanwhile ride along with it."""
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        if not r.set(_SCHED + domain, "1", nx=True, ex=int(delay) + 600):
+            return
+    except Exception as e:
+        log.warning("Re-probe run for %s not queued: %s", domain, e)
+        return
+    from tasks import celery_app  # late import: tasks registers the task that calls run_domain
+    if celery_app:
+        celery_app.send_task("reprobe_domain_task", args=[domain], countdown=max(1, int(delay)))
+    else:
+        r.delete(_SCHED + domain)
+
+
+def _due(domain: str) -> dict:
+    """Pop the addresses of `domain` whose backoff has elapsed. Returns {email: attempt}."""
+    r = get_redis()
+    now = time.time()
+    entries = r.hgetall(_KEY + domain) or {}
+    due = {}
+    for email, raw in entries.items():
+        try:
+            meta = json.loads(raw)
+        except Exception:
+            meta = {"a": 0, "t": 0}
+        if meta.get("t", 0) <= now:
+            due[email] = int(meta.get("a", 0))
+    if due:
+        r.hdel(_KEY + domain, *due.keys())
+    return due
+
+
+def _next_due_in(domain: str) -> Optional[float]:
+    r = get_redis()
+    times = []
+    for raw in (r.hvals(_KEY + domain) or []):
+        try:
+            times.append(float(json.loads(raw).get("t", 0)))
+        except Exception:
+            times.append(0.0)
+    return max(0.0, min(times) - time.time()) if times else None
+
+
+def run_domain(domain: str) -> dict:
+    """
+    Re-probe every due address of `domain` over one grouped SMTP session and write the
+    verdicts back to Contact. Still-greylisted addresses are rescheduled with the next delay.
+    """
+    from bulk_validation import validate_emails_bulk_sync
+
+    r = get_redis()
+    if r is None:
+        return {"domain": domain, "probed": 0}
+    r.delete(_SCHED + domain)
+    due = _due(domain)
+
+    resolved = deferred = 0
+    if due:
+        results = validate_emails_bulk_sync(list(due), timeout=REPROBE_TIMEOUT, do_smtp=True, group_by_domain=True)
+        by_email = {str(res.get("email", "")).lower(): res for res in results}
+
+        db = SessionLocal()
+        try:
+            rows = db.execute(select(Contact).where(Contact.email.in_(list(by_email)))).scalars().all()
+            for c in rows:
+                res = by_email[c.email]
+                if res.get("reason") == "smtp-temp":
+                    if schedule(c.email, due.get(c.email, 0) + 1):
+                        deferred += 1
+                        continue
+                c.status = STATUS_MAP.get(res.get("verdict"), "unknown")
+                c.reason = res.get("reason")
+                c.provider = res.get("provider")
+                resolved += 1
+            save_results(db, [res for res in results if res.get("reason") != "smtp-temp"])
+            db.commit()
+        finally:
+            db.close()
+
+    # Addresses parked after this run was queued still need one
+    wait = _next_due_in(domain)
+    if wait is not None:
+        _ensure_run(domain, wait)
+
+    log.info("Re-probe %s: %d due, %d resolved, %d deferred again", domain, len(due), resolved, deferred)
+    return {"domain": domain, "probed": len(due), "resolved": resolved, "deferred": deferred}
@@ -1,16 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import select, or_, func
-from typing import Optional, List
-import logging
+from sqlalchemy import select, update, or_, func
+from typing import Dict, Optional, List
+import json, os, logging
 
+from db import SessionLocal
 from deps import get_db, get_current_user
 from models import Contact, User
-from schemas import ContactIn, ContactOut, normalize_email
-from email_validation import validate_email_record
+from schemas import ContactIn, ContactOut, ValidateBulkIn, normalize_email
+from bulk_validation import validate_emails_bulk, VALIDATION_CONCURRENCY
+from reprobe import defer_if_temp
+from validation_store import validate_cached, lookup_fresh, save_results
 
 log = logging.getLogger(__name__)
 
+# Contacts per page in /validate_bulk: read, validate, then written back in one commit
+VALIDATION_BULK_BATCH = int(os.getenv("VALIDATION_BULK_BATCH", "500"))
+
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 
 
@@ -188,6 +196,8 @@ def delete_contact(
 def validate_one_api(
     payload: dict,
     use_smtp_probe: bool = Query(True, description="Enable SMTP probe (default: True)"),
+    force: bool = Query(False, description="Ignore a stored result and validate again"),
+    timings: bool = Query(False, description="Include per-stage timings (ms) and outcome codes"),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
@@ -203,7 +213,7 @@ def validate_one_api(
         db.refresh(row)
 
     try:
-        res = validate_email_record(email, timeout=8.0, do_smtp=use_smtp_probe)
+        res = validate_cached(db, email, timeout=8.0, do_smtp=use_smtp_probe, force=force, timings=timings)
     except Exception as e:
         log.warning("Validation failed for %s: %s", email, e)
         res = {"verdict": "unknown", "reason": str(e), "provider": None}
@@ -213,8 +223,9 @@ def validate_one_api(
     row.reason = res.get("reason")
     row.provider = res.get("provider")
     db.commit()
+    defer_if_temp(res)
 
-    return {
+    out = {
         "id": row.id,
         "email": row.email,
         "status": row.status,
@@ -222,12 +233,16 @@ def validate_one_api(
         "provider": row.provider,
         "verdict": res.get("verdict", "unknown"),
     }
+    if timings:
+        out["timings"] = res.get("timings")  # None when answered from the store
+    return out
 
 
 @router.post("/{contact_id}/revalidate", response_model=ContactOut)
 def revalidate_contact(
     contact_id: int,
     use_smtp_probe: bool = Query(True),
+    force: bool = Query(False, description="Ignore a stored result and validate again"),
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
@@ -238,7 +253,7 @@ def revalidate_contact(
         raise HTTPException(status_code=403, detail="Forbidden")
 
     try:
-        res = validate_email_record(c.email, timeout=8.0, do_smtp=use_smtp_probe)
+        res = validate_cached(db, c.email, timeout=8.0, do_smtp=use_smtp_probe, force=force)
     except Exception as e:
         log.warning("Revalidation failed for %s: %s", c.email, e)
         res = {"verdict": "unknown", "reason": str(e), "provider": None}
@@ -248,7 +263,107 @@ def revalidate_contact(
     c.reason = res.get("reason")
     c.provider = res.get("provider")
     db.commit()
+    defer_if_temp(res)
     db.refresh(c)
 
     owner_email = db.execute(select(User.email).where(User.id == c.owner_id)).scalar_one_or_none()
     return _to_out(c, owner_email)
+
+
+# --------- Bulk validation (streamed) ---------
+def _bulk_page(stmt, after_id: int) -> List[tuple]:
+    db = SessionLocal()
+    try:
+        return db.execute(stmt.where(Contact.id > after_id).limit(VALIDATION_BULK_BATCH)).all()
+    finally:
+        db.close()
+
+
+def _bulk_cached(emails: List[str], do_smtp: bool) -> Dict[str, dict]:
+    db = SessionLocal()
+    try:
+        return lookup_fresh(db, emails, do_smtp)
+    finally:
+        db.close()
+
+
+def _bulk_write_back(rows: List[dict], fresh: List[dict]) -> None:
+    """One commit per page: contact statuses (bulk UPDATE by id) plus the new stored results."""
+    db = SessionLocal()
+    try:
+        if rows:
+            db.execute(update(Contact), rows)
+        save_results(db, fresh)
+        db.commit()
+    finally:
+        db.close()
+    for res in fresh:
+        defer_if_temp(res)
+
+
+async def _bulk_stream(stmt, body: ValidateBulkIn):
+    status_map = {"valid": "valid", "invalid": "invalid", "risky": "risky"}
+    counts = {"valid": 0, "invalid": 0, "risky": 0, "unknown": 0}
+    after_id = 0
+    while True:
+        page = await run_in_threadpool(_bulk_page, stmt, after_id)
+        if not page:
+            break
+        after_id = page[-1][0]
+        ids_by_email: Dict[str, List[int]] = {}
+        for cid, email in page:
+            ids_by_email.setdefault(email, []).append(cid)
+
+        cached = {} if body.force else await run_in_threadpool(_bulk_cached, list(ids_by_email), body.use_smtp_probe)
+        todo = [e for e in ids_by_email if e not in cached]
+        rows: List[dict] = []
+        fresh: List[dict] = []
+
+        async def _results():
+            for res in cached.values():
+                yield res
+            # Callers may ask for less parallelism than the server allows, never more
+            concurrency = max(1, min(body.concurrency, VALIDATION_CONCURRENCY))
+            async for res in validate_emails_bulk(todo, concurrency=concurrency, timeout=body.timeout,
+                                                  do_smtp=body.use_smtp_probe):
+                fresh.append(res)
+                yield res
+
+        async for res in _results():
+            status = status_map.get(res.get("verdict"), "unknown")
+            counts[status] += 1
+            for cid in ids_by_email.get(res.get("email"), []):
+                rows.append({"id": cid, "status": status, "reason": res.get("reason"), "provider": res.get("provider")})
+                yield json.dumps({
+                    "id": cid, "email": res.get("email"), "status": status, "verdict": res.get("verdict", "unknown"),
+                    "reason": res.get("reason"), "provider": res.get("provider"),
+                    "suggestion": res.get("suggestion"), "cached": bool(res.get("cached")),
+                }) + "\n"
+
+        await run_in_threadpool(_bulk_write_back, rows, fresh)
+
+    yield json.dumps({"done": True, "total": sum(counts.values()), **counts}) + "\n"
+
+
+@router.post("/validate_bulk")
+def validate_bulk(
+    body: ValidateBulkIn,
+    user: User = Depends(get_current_user),
+):
+    """
+    Validate many contacts and stream one NDJSON line per contact as results land, then a
+    final {"done": true, ...} summary line. Contacts are written back page by page.
+    """
+    if not body.contact_ids and not body.status:
+        raise HTTPException(status_code=400, detail="contact_ids or status required")
+
+    stmt = select(Contact.id, Contact.email).order_by(Contact.id)
+    if user.role != "admin":
+        stmt = stmt.where(Contact.owner_id == user.id)
+    if body.contact_ids:
+        stmt = stmt.where(Contact.id.in_(body.contact_ids))
+    if body.status and body.status != "all":
+        stmt = stmt.where(Contact.status == body.status)
+
+    # The request's session is closed before the body streams, so pages use their own sessions
+    return StreamingResponse(_bulk_stream(stmt, body), media_type="application/x-ndjson")
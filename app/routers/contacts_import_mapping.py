@@ -10,7 +10,11 @@ import jwt
 
 from db import get_db
 from models import Contact, User
-from email_validation import validate_email_record
+from bulk_validation import VALIDATION_CONCURRENCY, prefetch_mx_sync
+from prescreen import contexts, prescreen_series
+from reprobe import defer_if_temp
+from validation_jobs import create_job, enqueue_job
+from validation_store import validate_many_cached
 
 # ---------- CONFIG ----------
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
@@ -133,6 +137,8 @@ def commit(
     upload_id: str = Form(...),
     mapping_json: str = Form(...),     # JSON: { target_field -> source_column or "" }
     validate: bool = Form(False),
+    force: bool = Form(False),         # re-validate even if a fresh stored result exists
+    background: bool = Form(False),    # validate in a background job; poll /api/validation/jobs/{job_id}
     db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user_or_none),
 ):
@@ -156,6 +162,7 @@ def commit(
         raise HTTPException(400, "Email mapping is required and must be one of the source columns")
 
     created = updated = validated = 0
+    to_validate: Dict[str, Contact] = {}
 
     for _, row in df.iterrows():
         email = _lower(row.get(src_email, ""))
@@ -204,11 +211,42 @@ def commit(
             db.add(obj); db.flush(); created += 1
 
         if validate:
-            res = validate_email_record(obj.email, timeout=8.0, do_smtp=True)
+            to_validate[obj.email] = obj
+
+    if to_validate:
+        # Offline checks for the whole column at once: bad syntax never reaches the network
+        screen, domains = prescreen_series(pd.Series(list(to_validate), dtype=object))
+        for email in screen.loc[~screen["syntax_ok"], "email"]:
+            obj = to_validate.pop(email)
+            obj.status, obj.reason, obj.provider = "invalid", "bad-syntax", None
+            validated += 1
+        # One DNS query per distinct domain, ahead of the probes
+        if domains and not background:
+            prefetch_mx_sync(domains, concurrency=VALIDATION_CONCURRENCY, timeout=8.0)
+
+    if to_validate and background:
+        db.commit()  # the job's worker must see the new contacts
+        # Owned by the importer (admins act on every contact), so they can poll and cancel it
+        owner_id = None if current_user is None or current_user.role == "admin" else current_user.id
+        job = create_job(db, owner_id, [obj.id for obj in to_validate.values()], None,
+                         do_smtp=True, force=force, timeout=8.0, concurrency=VALIDATION_CONCURRENCY)
+        enqueue_job(job.id)
+        rds.delete(f"import:{upload_id}")
+        return {"created": created, "updated": updated, "validated": validated, "job_id": job.id}
+
+    if to_validate:
+        # One concurrent pass over the whole upload instead of one blocking probe per row
+        # The prescreen already ran the offline checks: the engine starts at DNS
+        for res in validate_many_cached(db, list(to_validate), timeout=8.0, do_smtp=True, force=force,
+                                        concurrency=VALIDATION_CONCURRENCY, prechecked=contexts(screen)):
+            obj = to_validate.get(res.get("email"))
+            if obj is None:
+                continue
             obj.status   = {"valid":"valid","invalid":"invalid","risky":"risky"}.get(res.get("verdict"), "unknown")
             obj.reason   = res.get("reason")
             obj.provider = res.get("provider")
             validated += 1
+            defer_if_temp(res)
 
     db.commit()
     rds.delete(f"import:{upload_id}")
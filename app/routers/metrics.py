@@ -0,0 +1,31 @@
+# app/routers/metrics.py
+from fastapi import APIRouter, Query
+from fastapi.responses import PlainTextResponse
+
+from validation_metrics import metrics
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/validation")
+def validation_metrics(
+    format: str = Query("json", pattern="^(json|prometheus)$"),
+    top_domains: int = Query(20, ge=0, le=500, description="Slowest domains to list (by total time)"),
+    scope: str = Query("cluster", pattern="^(cluster|process)$",
+                       description="cluster: every API/worker process (via Redis); process: this one only"),
+):
+    """
+    Per-stage validation timings (JSON, or Prometheus text for scrapers). The cluster view
+    lags each process by up to VALIDATION_METRICS_FLUSH_SECONDS and falls back to this
+    process without Redis; the JSON "scope" field says which one you got.
+    """
+    shared = scope == "cluster"
+    if format == "prometheus":
+        return PlainTextResponse(metrics.prometheus(shared=shared), media_type="text/plain; version=0.0.4")
+    return metrics.snapshot(top_domains=top_domains, shared=shared)
+
+
+@router.post("/validation/reset")
+def reset_validation_metrics():
+    metrics.reset()
+    return {"ok": True}
@@ -0,0 +1,61 @@
+# app/routers/validation_jobs.py
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from deps import get_db, get_current_user
+from models import User, ValidationJob
+from schemas import ValidateBulkIn, ValidationJobOut
+from bulk_validation import VALIDATION_CONCURRENCY
+from validation_jobs import create_job, enqueue_job, cancel_job, resume_job, progress, owned_ids
+
+router = APIRouter(prefix="/validation/jobs", tags=["validation"])
+
+
+def _get_job(db: Session, job_id: int, user: User) -> ValidationJob:
+    job = db.get(ValidationJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if user.role != "admin" and job.owner_id != user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return job
+
+
+@router.post("", response_model=ValidationJobOut, status_code=202)
+def create_validation_job(
+    body: ValidateBulkIn,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    if not body.contact_ids and not body.status:
+        raise HTTPException(status_code=400, detail="contact_ids or status required")
+    # admins act on every contact, like the contacts list
+    owner_id: Optional[int] = None if user.role == "admin" else user.id
+    contact_ids = body.contact_ids
+    if contact_ids and owner_id is not None:
+        contact_ids = owned_ids(db, contact_ids, owner_id)
+        if not contact_ids:
+            raise HTTPException(status_code=404, detail="No matching contacts")
+    job = create_job(db, owner_id, contact_ids, body.status, do_smtp=body.use_smtp_probe,
+                     force=body.force, timeout=body.timeout,
+                     concurrency=max(1, min(body.concurrency, VALIDATION_CONCURRENCY)))
+    enqueue_job(job.id)
+    return progress(job)
+
+
+@router.get("/{job_id}", response_model=ValidationJobOut)
+def get_validation_job(job_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    return progress(_get_job(db, job_id, user))
+
+
+@router.post("/{job_id}/cancel", response_model=ValidationJobOut)
+def cancel_validation_job(job_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    return progress(cancel_job(db, _get_job(db, job_id, user)))
+
+
+@router.post("/{job_id}/resume", response_model=ValidationJobOut)
+def resume_validation_job(job_id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    job = _get_job(db, job_id, user)
+    if job.status == "done":
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return progress(resume_job(db, job))
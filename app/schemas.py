@@ -1,4 +1,5 @@
 # app/schemas.py
+from datetime import datetime
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, EmailStr, field_validator
 import re
@@ -99,6 +100,27 @@ class ValidationRequest(BaseModel):
     concurrency: int = 20
     timeout: float = 6.0
 
+class ValidateBulkIn(ValidationRequest):
+    # Either explicit contacts or a status filter ("all" = every contact you can see)
+    contact_ids: Optional[List[int]] = None
+    status: Optional[str] = None
+    force: bool = False
+
+class ValidationJobOut(BaseModel):
+    id: int
+    status: str
+    total: int
+    done: int
+    valid: int
+    invalid: int
+    risky: int
+    unknown: int
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 class ValidateOneIn(BaseModel):
     email: EmailStr
 
@@ -138,6 +160,7 @@ class ComposeIn(BaseModel):
     bcc_extra: List[EmailStr] = []
 
     validate_extras: bool = True
+    force_validation: bool = False   # ignore stored validation results for the extras
 
     @field_validator("from_email", mode="before")
     @classmethod
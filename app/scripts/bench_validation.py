@@ -0,0 +1,295 @@
+# scripts/bench_validation.py
+"""
+Offline validation benchmark: no real DNS, no real MX servers.
+
+Starts fake SMTP servers on loopback addresses (one per behaviour), answers MX lookups
+from a stub resolver, and drives the validator over a synthetic list:
+
+  sync      validate_email_record, one address after another (or --threads at once)
+  bulk      bulk_validation.validate_emails_bulk_sync
+  grouped   bulk_validation.validate_emails_bulk_sync(group_by_domain=True)
+
+For each run it prints addresses/sec, p50/p99 latency (time to result for the batch
+engines) and the SMTP connections the fake servers accepted. Caches, host health and the
+probe pool are reset between runs so they don't carry over from one run to the next.
+
+Server behaviours:
+  normal      250 for local parts starting with "user", 550 otherwise
+  acceptall   250 for everything
+  reject      550 for everything
+  greylist    451 for a recipient's first --greylist seconds, then like "normal"
+  tarpit      like "normal", but every reply is delayed by --tarpit seconds
+
+Usage (from the app directory):
+  python scripts/bench_validation.py --addresses 2000 --domains 40 --modes bulk,grouped
+"""
+import os, sys, time, json, asyncio, argparse, threading, random
+from types import SimpleNamespace
+from typing import Dict, List
+
+BEHAVIOURS = ["normal", "acceptall", "reject", "greylist", "tarpit"]
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Offline validation benchmark")
+    ap.add_argument("--addresses", type=int, default=1000)
+    ap.add_argument("--domains", type=int, default=20, help="domains per behaviour")
+    ap.add_argument("--behaviours", default=",".join(BEHAVIOURS))
+    ap.add_argument("--modes", default="sync,bulk,grouped")
+    ap.add_argument("--sync-limit", type=int, default=200, help="addresses for the sync mode (it is slow)")
+    ap.add_argument("--threads", type=int, default=1, help="concurrent validate_email_record calls in sync mode")
+    ap.add_argument("--concurrency", type=int, default=20)
+    ap.add_argument("--timeout", type=float, default=3.0)
+    ap.add_argument("--latency", type=float, default=20.0, help="ms per SMTP reply")
+    ap.add_argument("--dns-latency", type=float, default=5.0, help="ms per MX lookup")
+    ap.add_argument("--greylist", type=float, default=60.0, help="seconds a new recipient is greylisted")
+    ap.add_argument("--tarpit", type=float, default=1.0, help="extra seconds per reply on the tarpit server")
+    ap.add_argument("--nomx-share", type=float, default=0.05, help="share of addresses on domains without MX")
+    ap.add_argument("--port", type=int, default=2525)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="print results as JSON")
+    return ap.parse_args()
+
+
+ARGS = parse_args()
+
+# The validator reads its config at import time: isolate it before importing it
+os.environ["PROBE_SMTP_PORT"] = str(ARGS.port)
+os.environ["ALLOW_SMTP_PROBE"] = "true"
+os.environ["REDIS_URL"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dns.resolver, dns.asyncresolver  # noqa: E402
+
+import validation_cache  # noqa: E402
+from email_validation import validate_email_record  # noqa: E402
+from bulk_validation import validate_emails_bulk_sync  # noqa: E402
+from mx_health import health  # noqa: E402
+from probe_pool import probe_pool  # noqa: E402
+
+
+# ---------------------------
+# Fake SMTP servers
+# ---------------------------
+class FakeSMTP:
+    def __init__(self, behaviour: str, host: str):
+        self.behaviour = behaviour
+        self.host = host
+        self.connections = 0
+        self.first_seen: Dict[str, float] = {}
+
+    def rcpt_code(self, rcpt: str) -> int:
+        local = rcpt.split("@", 1)[0]
+        exists = 250 if local.startswith("user") else 550
+        if self.behaviour == "acceptall":
+            return 250
+        if self.behaviour == "reject":
+            return 550
+        if self.behaviour == "greylist":
+            first = self.first_seen.setdefault(rcpt, time.monotonic())
+            if time.monotonic() - first < ARGS.greylist:
+                return 451
+        return exists
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        delay = ARGS.latency / 1000 + (ARGS.tarpit if self.behaviour == "tarpit" else 0.0)
+
+        async def reply(text: str) -> None:
+            await asyncio.sleep(delay)
+            writer.write(text.encode() + b"\r\n")
+            await writer.drain()
+
+        try:
+            await reply("220 bench.local ESMTP")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                cmd = line.decode(errors="ignore").strip()
+                verb = cmd[:4].upper()
+                if verb == "EHLO":
+                    await reply("250-bench.local\r\n250 PIPELINING")
+                elif verb in ("HELO", "MAIL", "RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    rcpt = cmd.split(":", 1)[-1].strip().strip("<>").lower()
+                    code = self.rcpt_code(rcpt)
+                    await reply(f"{code} {'OK' if code == 250 else 'try later' if code == 451 else 'no such user'}")
+                elif verb == "QUIT":
+                    await reply("221 bye")
+                    break
+                else:
+                    await reply("502 command not implemented")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+def start_servers(behaviours: List[str]) -> Dict[str, FakeSMTP]:
+    servers = {b: FakeSMTP(b, f"127.0.0.{i + 2}") for i, b in enumerate(behaviours)}
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+
+    async def _serve():
+        for srv in servers.values():
+            await asyncio.start_server(srv.handle, srv.host, ARGS.port)
+        ready.set()
+
+    def _run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(_serve())
+        loop.run_forever()
+
+    threading.Thread(target=_run, daemon=True).start()
+    if not ready.wait(5):
+        sys.exit(f"could not start fake SMTP servers on 127.0.0.x:{ARGS.port}")
+    return servers
+
+
+# ---------------------------
+# Stub DNS
+# ---------------------------
+class _Answer(list):
+    """Just enough of dns.resolver.Answer for the validator: iterable MX records + rrset.ttl."""
+    def __init__(self, records, ttl: int = 300):
+        super().__init__(records)
+        self.rrset = SimpleNamespace(ttl=ttl)
+
+
+def install_stub_resolver(mx_table: Dict[str, str]) -> None:
+    """MX lookups answer from `mx_table` (domain -> host) after --dns-latency; anything else is NXDOMAIN."""
+    def _lookup(qname) -> _Answer:
+        host = mx_table.get(str(qname).lower().rstrip("."))
+        if host is None:
+            raise dns.resolver.NXDOMAIN()
+        return _Answer([SimpleNamespace(preference=10, exchange=host + ".")])
+
+    def resolve(qname, rdtype="A", *args, **kwargs):
+        time.sleep(ARGS.dns_latency / 1000)
+        return _lookup(qname)
+
+    async def aresolve(self, qname, rdtype="A", *args, **kwargs):
+        await asyncio.sleep(ARGS.dns_latency / 1000)
+        return _lookup(qname)
+
+    dns.resolver.resolve = resolve
+    dns.asyncresolver.Resolver.resolve = aresolve
+
+
+# ---------------------------
+# Workload
+# ---------------------------
+def build_workload(servers: Dict[str, FakeSMTP]):
+    rnd = random.Random(ARGS.seed)
+    mx_table: Dict[str, str] = {}
+    domains: List[str] = []
+    for b, srv in servers.items():
+        for i in range(ARGS.domains):
+            d = f"{b}{i}.bench.test"
+            mx_table[d] = srv.host
+            domains.append(d)
+    emails = []
+    for n in range(ARGS.addresses):
+        if rnd.random() < ARGS.nomx_share:
+            emails.append(f"user{n}@nomx{n % 50}.bench.test")
+            continue
+        local = f"user{n}" if rnd.random() < 0.8 else f"ghost{n}"
+        emails.append(f"{local}@{rnd.choice(domains)}")
+    return mx_table, emails
+
+
+def reset_state(servers: Dict[str, FakeSMTP]) -> None:
+    validation_cache._mx_local.clear()
+    validation_cache._accept_all_local.clear()
+    with health._lock:
+        health._hosts.clear()
+    probe_pool.clear()
+    for srv in servers.values():
+        srv.connections = 0
+        srv.first_seen.clear()
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_sync(emails: List[str]):
+    from concurrent.futures import ThreadPoolExecutor
+
+    def one(e):
+        t0 = time.monotonic()
+        res = validate_email_record(e, timeout=ARGS.timeout, do_smtp=True)
+        return res, time.monotonic() - t0
+
+    with ThreadPoolExecutor(max_workers=max(1, ARGS.threads)) as ex:
+        out = list(ex.map(one, emails))
+    return [r for r, _ in out], [lat for _, lat in out]
+
+
+def run_bulk(emails: List[str], grouped: bool):
+    """Latency here is time-to-result: when each address came out of the engine."""
+    import bulk_validation
+    t0 = time.monotonic()
+    lat: List[float] = []
+    results: List[dict] = []
+
+    async def _collect():
+        async for res in bulk_validation.validate_emails_bulk(emails, concurrency=ARGS.concurrency,
+                                                              timeout=ARGS.timeout, do_smtp=True,
+                                                              group_by_domain=grouped):
+            results.append(res)
+            lat.append(time.monotonic() - t0)
+    asyncio.run(_collect())
+    return results, lat
+
+
+def main() -> None:
+    behaviours = [b for b in ARGS.behaviours.split(",") if b in BEHAVIOURS]
+    servers = start_servers(behaviours)
+    mx_table, emails = build_workload(servers)
+    install_stub_resolver(mx_table)
+
+    report = []
+    for mode in [m.strip() for m in ARGS.modes.split(",") if m.strip()]:
+        reset_state(servers)
+        batch = emails[:ARGS.sync_limit] if mode == "sync" else emails
+        t0 = time.monotonic()
+        if mode == "sync":
+            results, lat = run_sync(batch)
+        elif mode in ("bulk", "grouped"):
+            results, lat = run_bulk(batch, grouped=(mode == "grouped"))
+        else:
+            print(f"unknown mode {mode!r}", file=sys.stderr)
+            continue
+        wall = time.monotonic() - t0
+        verdicts: Dict[str, int] = {}
+        for r in results:
+            verdicts[r.get("verdict", "unknown")] = verdicts.get(r.get("verdict", "unknown"), 0) + 1
+        report.append({
+            "mode": mode,
+            "addresses": len(batch),
+            "seconds": round(wall, 3),
+            "addr_per_sec": round(len(batch) / wall, 1) if wall else None,
+            "p50_ms": round(percentile(lat, 0.50) * 1000, 1),
+            "p99_ms": round(percentile(lat, 0.99) * 1000, 1),
+            "connections": sum(s.connections for s in servers.values()),
+            "connections_by_server": {b: s.connections for b, s in servers.items()},
+            "verdicts": verdicts,
+        })
+
+    if ARGS.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'mode':<8} {'addrs':>6} {'secs':>8} {'addr/s':>8} {'p50 ms':>8} {'p99 ms':>9} {'conns':>6}  verdicts")
+    for r in report:
+        print(f"{r['mode']:<8} {r['addresses']:>6} {r['seconds']:>8} {r['addr_per_sec']:>8} {r['p50_ms']:>8} "
+              f"{r['p99_ms']:>9} {r['connections']:>6}  {r['verdicts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# send_throttle.py
+"""
+Per-destination send throttling shared by all workers (Redis token buckets).
+
+Every recipient domain (or, with SEND_THROTTLE_BY_MX, the mail provider / primary MX
+behind it, so all Google Workspace domains share Google's bucket) has a bucket that
+refills at `rate` messages per second up to `burst`. Workers take tokens before sending;
+a message that gets none is not sent and not retried, but rescheduled for when its
+bucket will have refilled. Nothing blocks a worker while waiting. Only relay (SMTP)
+sends are throttled; SendGrid paces Web API sends to each destination itself.
+
+Layout:
+  throttle:tb:<bucket>   hash  t -> tokens left, ts -> last refill (Redis TIME, ms)
+
+Limits: SEND_DOMAIN_RATE / SEND_DOMAIN_BURST by default, per bucket in
+SEND_DOMAIN_LIMITS, e.g. "gmail.com=20/100,yahoo.com=5/20,google=30/150" (rate/burst;
+names are domains, or providers / MX hosts when keyed by MX).
+
+Redis is best-effort here too: without it (or when it errors) everything is admitted.
+"""
+import os, logging
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from validation_cache import get_redis
+
+log = logging.getLogger("mailer")
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+SEND_THROTTLE_ENABLED = os.getenv("SEND_THROTTLE_ENABLED", "true").lower() == "true"
+SEND_THROTTLE_BY_MX = os.getenv("SEND_THROTTLE_BY_MX", "false").lower() == "true"
+SEND_DOMAIN_RATE = float(os.getenv("SEND_DOMAIN_RATE", "10"))
+SEND_DOMAIN_BURST = int(os.getenv("SEND_DOMAIN_BURST", "50"))
+
+
+def _parse_limits(spec: str) -> Dict[str, Tuple[float, int]]:
+    limits = {}
+    for item in spec.split(","):
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            limits[name.strip().lower()] = (float(rate), int(burst or max(1, float(rate))))
+        except ValueError:
+            if item.strip():
+                log.warning("Ignoring bad SEND_DOMAIN_LIMITS entry %r", item)
+    return limits
+
+
+SEND_DOMAIN_LIMITS = _parse_limits(os.getenv("SEND_DOMAIN_LIMITS", ""))
+
+_KEY = "throttle:tb:"
+
+# KEYS[1] bucket; ARGV rate (tokens/s), burst, wanted. Returns {granted, tokens left (string)}.
+_TAKE = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local b = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(b[1])
+local ts = tonumber(b[2])
+if tokens == nil or ts == nil then
+  tokens = burst
+else
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+end
+local got = math.min(want, math.floor(tokens))
+tokens = tokens - got
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {got, tostring(tokens)}
+"""
+
+_script = None
+
+
+def limits_for(bucket: str) -> Tuple[float, int]:
+    """(rate per second, burst) for a bucket name."""
+    rate, burst = SEND_DOMAIN_LIMITS.get(bucket, (SEND_DOMAIN_RATE, SEND_DOMAIN_BURST))
+    return max(rate, 0.001), max(1, burst)
+
+
+# domain -> provider / primary MX; only resolved answers are kept, so a domain that fell
+# back to its own bucket during a DNS hiccup is looked up again next time
+_mx_buckets: "OrderedDict[str, str]" = OrderedDict()
+_MX_BUCKETS_MAX = 10000
+
+
+def _mx_bucket(domain: str) -> str:
+    from email_validation import check_mx_status, MX_OK  # cached MX lookups
+    bucket = _mx_buckets.get(domain)
+    if bucket is not None:
+        return bucket
+    try:
+        status, hosts, provider = check_mx_status(domain)
+    except Exception:
+        return domain
+    if status != MX_OK or not hosts:
+        return domain
+    bucket = _mx_buckets[domain] = (provider or hosts[0]).lower()
+    while len(_mx_buckets) > _MX_BUCKETS_MAX:
+        _mx_buckets.popitem(last=False)
+    return bucket
+
+
+def bucket_for(domain: str) -> str:
+    """The bucket a recipient domain draws from: the domain, or its provider / primary MX."""
+    domain = domain.lower()
+    return _mx_bucket(domain) if SEND_THROTTLE_BY_MX else domain
+
+
+def _take(wanted: Dict[str, int]) -> Optional[Dict[str, Tuple[int, float]]]:
+    """{bucket: (granted, tokens left)} in one round trip; None when Redis is unavailable."""
+    global _script
+    r = get_redis()
+    if r is None:
+        return None
+    try:
+        if _script is None:
+            _script = r.register_script(_TAKE)
+        pipe = r.pipeline(transaction=False)
+        for bucket, n in wanted.items():
+            rate, burst = limits_for(bucket)
+            _script(keys=[_KEY + bucket], args=[rate, burst, n], client=pipe)
+        replies = pipe.execute()
+    except Exception as e:
+        log.warning("Send throttle unavailable, sending unthrottled (%s)", e)
+        return None
+    return {bucket: (int(got), float(left)) for bucket, (got, left) in zip(wanted, replies)}
+
+
+def admit(recipients: Sequence[Tuple[Hashable, str]]) -> Tuple[List[Hashable], Dict[Hashable, float]]:
+    """
+    Take tokens for [(key, email)]. Returns (keys to send now, {key: seconds to wait}).
+    Deferred recipients of a bucket are spread out at its refill rate, so rescheduling
+    them all doesn't just recreate the burst.
+    """
+    if not SEND_THROTTLE_ENABLED or not recipients:
+        return [key for key, _ in recipients], {}
+    by_bucket: "OrderedDict[str, List[Hashable]]" = OrderedDict()
+    for key, email in recipients:
+        by_bucket.setdefault(bucket_for(email.rsplit("@", 1)[-1]), []).append(key)
+    taken = _take({bucket: len(keys) for bucket, keys in by_bucket.items()})
+    if taken is None:
+        return [key for key, _ in recipients], {}
+
+    allowed: List[Hashable] = []
+    deferred: Dict[Hashable, float] = {}
+    for bucket, keys in by_bucket.items():
+        got, left = taken[bucket]
+        allowed.extend(keys[:got])
+        if got < len(keys):
+            rate, _ = limits_for(bucket)
+            first = (1 - left) / rate  # until the next whole token
+            for i, key in enumerate(keys[got:]):
+                deferred[key] = first + i / rate
+            log.info("[THROTTLE] %s: %d sent now, %d deferred (up to %.0fs)",
+                     bucket, got, len(keys) - got, first + (len(keys) - got - 1) / rate)
+    return allowed, deferred
@@ -0,0 +1,222 @@
+# sendgrid_batch.py
+"""
+Batched SendGrid Web API sends over a keep-alive HTTPS connection.
+
+One `mail/send` request carries up to SENDGRID_BATCH_SIZE personalizations (SendGrid's
+limit is 1000), one per recipient, all sharing the campaign's From/subject/content.
+Each personalization carries the caller's key (our Message id) as a custom arg, so
+event webhooks can be traced back too, and optionally that recipient's substitutions
+(merge tag values, see merge_tags.py) for the shared subject/content.
+
+SendGrid accepts or rejects a request as a whole. When it rejects it for specific
+personalizations (errors whose `field` is "personalizations.<i>...."), those recipients
+are failed with SendGrid's message and the rest of the batch is sent again, so one bad
+address doesn't sink 999 good ones. Any other 4xx fails the whole batch.
+429 / 5xx / network errors raise SendGridRetryable: retry later.
+
+The HTTP connection is per thread and per process (never shared across a fork) and is
+reused across requests; SendGrid keeps idle connections open for a while. A reused
+connection the server has already closed is replaced before sending, and a request is
+only sent again when it never got onto the wire. Once written it may have been accepted,
+so a lost response raises SendGridRetryable instead of sending the batch twice.
+"""
+import os, re, json, select, threading, http.client, logging
+from typing import Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+log = logging.getLogger("mailer")
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "").strip()
+SENDGRID_EU = os.getenv("SENDGRID_EU", "false").lower() == "true"
+# Override for a local stand-in, e.g. http://127.0.0.1:8025
+SENDGRID_API_BASE = os.getenv("SENDGRID_API_BASE", "").strip() or (
+    "https://api.eu.sendgrid.com" if SENDGRID_EU else "https://api.sendgrid.com"
+)
+SENDGRID_BATCH_SIZE = max(1, min(1000, int(os.getenv("SENDGRID_BATCH_SIZE", "1000"))))
+SENDGRID_HTTP_TIMEOUT = float(os.getenv("SENDGRID_HTTP_TIMEOUT", "30"))
+
+_FIELD_INDEX = re.compile(r"^personalizations\.(\d+)\b")
+# Writing to a keep-alive connection the server had already closed
+_STALE = (BrokenPipeError, ConnectionResetError)
+
+
+class SendGridRetryable(Exception):
+    """Trying again later may work (429, 5xx, network, or a response lost after sending)."""
+
+
+class SendGridRejected(Exception):
+    """The whole request was refused (4xx not tied to individual recipients)."""
+    def __init__(self, status: int, errors: List[dict], body: str):
+        super().__init__(f"SendGrid API error {status}: {body[:500]}")
+        self.status = status
+        self.errors = errors
+        self.body = body
+
+
+# ---------------------------
+# Keep-alive transport
+# ---------------------------
+class _Transport:
+    def __init__(self, base: str, api_key: str, timeout: float):
+        parts = urlsplit(base)
+        self.https = parts.scheme != "http"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conn(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """(connection, reused) for this thread; a new one after a fork or a failure."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            if not _closed_by_peer(conn):
+                return conn, True
+            conn.close()
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        conn = cls(self.host, self.port, timeout=self.timeout)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn, False
+
+    def _drop(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None and getattr(self._local, "pid", None) == os.getpid():
+            conn.close()
+
+    def post(self, path: str, payload: dict) -> Tuple[int, str]:
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "Connection": "keep-alive",
+        }
+        for attempt in (1, 2):
+            conn, reused = self._conn()
+            try:
+                conn.request("POST", self.prefix + path, body=body, headers=headers)
+            except _STALE as e:
+                # Refused while writing: SendGrid never got the request, safe to send again
+                self._drop()
+                if reused and attempt == 1:
+                    continue
+                raise SendGridRetryable(f"connection lost: {e!r}") from e
+            except (OSError, http.client.HTTPException) as e:
+                self._drop()
+                raise SendGridRetryable(f"request failed: {e!r}") from e
+            try:
+                resp = conn.getresponse()
+                text = resp.read().decode("utf-8", errors="ignore")
+            except (OSError, http.client.HTTPException) as e:
+                # Sent but unanswered: it may have been accepted, so never resend it here
+                self._drop()
+                raise SendGridRetryable(f"no response: {e!r}") from e
+            if resp.will_close:
+                self._drop()
+            return resp.status, text
+        raise SendGridRetryable("connection lost")  # not reached
+
+
+def _closed_by_peer(conn: http.client.HTTPConnection) -> bool:
+    """An idle keep-alive socket that is readable has been closed (or is in a bad state)."""
+    if conn.sock is None:
+        return False  # not connected yet: request() connects
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+_transport: Optional[_Transport] = None
+
+
+def transport() -> _Transport:
+    global _transport
+    if _transport is None:
+        _transport = _Transport(SENDGRID_API_BASE, SENDGRID_API_KEY, SENDGRID_HTTP_TIMEOUT)
+    return _transport
+
+
+# ---------------------------
+# Batches
+# ---------------------------
+def _errors(text: str) -> List[dict]:
+    try:
+        errs = json.loads(text).get("errors") or []
+    except (ValueError, AttributeError):
+        return []
+    return [e for e in errs if isinstance(e, dict)]
+
+
+def _personalization(key: Hashable, email: str, substitutions: Optional[Mapping[Hashable, Dict[str, str]]]) -> dict:
+    p = {"to": [{"email": email}], "custom_args": {"message_id": str(key)}}
+    if substitutions is not None and key in substitutions:
+        p["substitutions"] = substitutions[key]
+    return p
+
+
+def _payload(recipients: Sequence[Tuple[Hashable, str]], subject: str, html: Optional[str], text: Optional[str],
+             from_addr: str, reply_to: Optional[str],
+             substitutions: Optional[Mapping[Hashable, Dict[str, str]]] = None) -> dict:
+    # Built as plain JSON: Mail.add_personalization prepends, and we need index i == recipients[i]
+    content = []
+    if text or not html:
+        content.append({"type": "text/plain", "value": text or "(no content)"})
+    if html:
+        content.append({"type": "text/html", "value": html})
+    payload = {
+        "from": {"email": from_addr},
+        "subject": subject,
+        "personalizations": [_personalization(key, email, substitutions) for key, email in recipients],
+        "content": content,
+    }
+    if reply_to:
+        payload["reply_to"] = {"email": reply_to}
+    return payload
+
+
+def send_batch(recipients: Sequence[Tuple[Hashable, str]], subject: str, html: Optional[str], text: Optional[str],
+               from_addr: str, reply_to: Optional[str] = None,
+               substitutions: Optional[Mapping[Hashable, Dict[str, str]]] = None) -> Dict[Hashable, Optional[str]]:
+    """
+    Send one message to many recipients ([(key, email)], at most SENDGRID_BATCH_SIZE).
+    `substitutions` maps a key to that recipient's {placeholder: value} for subject/content.
+    Returns {key: None if accepted, else SendGrid's error for that recipient}.
+    Raises SendGridRejected if the request is refused as a whole, SendGridRetryable if it may be retried.
+    """
+    out: Dict[Hashable, Optional[str]] = {}
+    todo = list(recipients)
+    while todo:
+        status, text_ = transport().post("/v3/mail/send", _payload(todo, subject, html, text, from_addr, reply_to,
+                                                                   substitutions))
+        if status == 202:
+            out.update((key, None) for key, _ in todo)
+            break
+        if status == 429 or status >= 500:
+            raise SendGridRetryable(f"SendGrid API error {status}: {text_[:500]}")
+        errors = _errors(text_)
+        bad: Dict[int, str] = {}
+        general = not errors
+        for err in errors:
+            m = _FIELD_INDEX.match(str(err.get("field") or ""))
+            if m and int(m.group(1)) < len(todo):
+                bad.setdefault(int(m.group(1)), str(err.get("message") or "rejected"))
+            else:
+                general = True
+        if general:
+            # Something about the request itself (sender, content, auth): no recipient was sent
+            raise SendGridRejected(status, errors, text_)
+        for i, msg in bad.items():
+            out[todo[i][0]] = f"SendGrid rejected recipient: {msg}"
+        todo = [r for i, r in enumerate(todo) if i not in bad]
+        log.warning("[SG] %d recipient(s) rejected in batch; resending %d", len(bad), len(todo))
+    return out
+
+
+def chunks(items: Sequence, size: int = SENDGRID_BATCH_SIZE) -> List[Sequence]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -1,15 +1,24 @@
 # app/tasks.py
 import os
+import math
+import time
+import asyncio
+import socket
 import smtplib
 import logging
 from datetime import datetime, timezone
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import Optional
+from typing import Callable, Dict, Hashable, List, Mapping, Optional, Sequence, Tuple
 
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 from db import SessionLocal
 from models import Message, Contact, Campaign
+from mx_health import health
+from relay_pool import new_pool, SMTP_MAX_MESSAGES_PER_CONN, SMTP_POOL_IDLE_SECONDS
+from async_sender import AsyncRelayEngine, EngineThread
+from mime_cache import render, render_cache, personal_message
+from merge_tags import FIELDS as MERGE_FIELDS, CampaignTemplate, compile_campaign, contact_values
+from send_throttle import admit
 
 # -------------------------------
 # Logging
@@ -37,12 +46,8 @@ if CELERY_URL:
 # -------------------------------
 # SendGrid Web API (primary)
 # -------------------------------
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, ReplyTo, Content
-from python_http_client.exceptions import BadRequestsError
+from sendgrid_batch import SENDGRID_API_KEY, SendGridRejected, SendGridRetryable, send_batch, chunks
 
-SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY", "").strip()
-SENDGRID_EU = os.getenv("SENDGRID_EU", "false").lower() == "true"
 VERIFIED_FROM = os.getenv("VERIFIED_FROM", os.getenv("SMTP_FROM", "no-reply@localhost")).strip()
 FALLBACK_TO_VERIFIED_FROM = os.getenv("FALLBACK_TO_VERIFIED_FROM", "true").lower() == "true"
 
@@ -57,65 +62,161 @@ SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
 SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "false").lower() == "true"
 SMTP_FROM_FALLBACK = os.getenv("SMTP_FROM", "no-reply@localhost")
 SMTP_ENVELOPE_FROM = os.getenv("SMTP_ENVELOPE_FROM", "")
+# Per-command socket timeout once connected; the connect timeout adapts to the relay's history
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Protocol transcript on stdout (smtplib debug level 1); noisy, for troubleshooting only
+SMTP_DEBUG = os.getenv("SMTP_DEBUG", "false").lower() == "true"
+
+def _is_relay_failure(e: Exception) -> bool:
+    """Errors that say something about the relay's health (as opposed to this message)."""
+    if isinstance(e, smtplib.SMTPResponseException) and e.smtp_code == 421:
+        return True
+    return isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                          socket.timeout, ConnectionError, socket.gaierror))
+
+def _open_relay() -> smtplib.SMTP:
+    """Connect, STARTTLS and log in to the relay; the pool keeps the result for reuse."""
+    connect_timeout = health.timeout_for(SMTP_HOST, SMTP_TIMEOUT, "connect")
+    t0 = time.monotonic()
+    if SMTP_USE_SSL:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=connect_timeout)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=connect_timeout)
+    health.record_success(SMTP_HOST, "connect", time.monotonic() - t0)
+    try:
+        server.sock.settimeout(SMTP_TIMEOUT)
+        if SMTP_DEBUG:
+            server.set_debuglevel(1)
+        if not SMTP_USE_SSL:
+            server.ehlo()
+            if SMTP_USE_TLS:
+                server.starttls()
+                server.ehlo()
+        if SMTP_USERNAME:
+            server.login(SMTP_USERNAME, SMTP_PASSWORD)
+    except Exception:
+        server.close()
+        raise
+    log.info("[SMTP] opened relay connection to %s:%s", SMTP_HOST, SMTP_PORT)
+    return server
+
+# Logged-in relay connections, reused across messages (per worker process)
+relay_pool = new_pool(_open_relay)
+
+# Batches over the asyncio engine (async_sender): pipelined, SMTP_ASYNC_CONNECTIONS connections
+SMTP_ASYNC = os.getenv("SMTP_ASYNC", "false").lower() == "true"
+async_relay = EngineThread(lambda: AsyncRelayEngine(
+    SMTP_HOST, SMTP_PORT, use_tls=SMTP_USE_TLS, use_ssl=SMTP_USE_SSL,
+    username=SMTP_USERNAME, password=SMTP_PASSWORD, timeout=SMTP_TIMEOUT,
+    max_messages=SMTP_MAX_MESSAGES_PER_CONN, idle_seconds=SMTP_POOL_IDLE_SECONDS,
+))
 
 # -------------------------------
 # Send via SendGrid Web API
 # -------------------------------
-def _send_via_sendgrid_api(
-    to_email: str,
+def _sendgrid_send(
+    recipients: Sequence[Tuple[int, str]],
     subject: str,
     html: Optional[str],
     text: Optional[str],
     requested_from: Optional[str],
-) -> None:
+    substitutions: Optional[Mapping[int, Dict[str, str]]] = None,
+) -> Dict[int, Optional[str]]:
     """
+    Send to [(key, email)] in one mail/send request (see sendgrid_batch.send_batch).
     Try with the user-typed From (must be verified in SendGrid).
     If SendGrid rejects with "not a verified sender", optionally retry
     using VERIFIED_FROM and set Reply-To to the user's address.
     """
-    host = "https://api.eu.sendgrid.com" if SENDGRID_EU else "https://api.sendgrid.com"
-    sg = SendGridAPIClient(SENDGRID_API_KEY, host=host)
-
-    def build(from_addr: str, reply_to_addr: Optional[str]) -> Mail:
-        m = Mail(from_email=Email(from_addr), to_emails=[To(to_email)], subject=subject)
-        if html:
-            m.add_content(Content("text/html", html))
-        else:
-            m.add_content(Content("text/plain", text or "(no content)"))
-        if reply_to_addr:
-            m.reply_to = ReplyTo(reply_to_addr)
-        return m
-
     user_from = (requested_from or "").strip() or VERIFIED_FROM
 
     try:
-        resp = sg.client.mail.send.post(request_body=build(user_from, None).get())
-        if resp.status_code != 202:
-            raise RuntimeError(f"SendGrid API error {resp.status_code}: {resp.body}")
-        log.info("[SG] 202 Accepted with From=%s -> %s", user_from, to_email)
-        return
+        out = send_batch(recipients, subject, html, text, user_from, substitutions=substitutions)
+        log.info("[SG] 202 Accepted with From=%s -> %d recipient(s)", user_from, len(recipients))
+        return out
 
-    except BadRequestsError as e:
-        body = getattr(e, "body", b"")
-        body_txt = body.decode(errors="ignore") if isinstance(body, (bytes, bytearray)) else str(body)
-        unverified = "verified sender identity" in body_txt.lower() or "from address does not match" in body_txt.lower()
+    except SendGridRejected as e:
+        body_txt = e.body.lower()
+        unverified = "verified sender identity" in body_txt or "from address does not match" in body_txt
 
         if unverified and FALLBACK_TO_VERIFIED_FROM and VERIFIED_FROM and user_from.lower() != VERIFIED_FROM.lower():
             log.warning("[SG] From not verified (%s). Falling back to VERIFIED_FROM=%s with Reply-To=%s",
                         user_from, VERIFIED_FROM, user_from)
-            resp2 = sg.client.mail.send.post(request_body=build(VERIFIED_FROM, user_from).get())
-            if resp2.status_code != 202:
-                raise RuntimeError(f"SendGrid fallback error {resp2.status_code}: {resp2.body}")
-            log.info("[SG] 202 Accepted (fallback) From=%s Reply-To=%s -> %s",
-                     VERIFIED_FROM, user_from, to_email)
-            return
+            out = send_batch(recipients, subject, html, text, VERIFIED_FROM, reply_to=user_from,
+                             substitutions=substitutions)
+            log.info("[SG] 202 Accepted (fallback) From=%s Reply-To=%s -> %d recipient(s)",
+                     VERIFIED_FROM, user_from, len(recipients))
+            return out
 
         # If it's a different 400, surface it
         raise
 
+def _send_via_sendgrid_api(
+    to_email: str,
+    subject: str,
+    html: Optional[str],
+    text: Optional[str],
+    requested_from: Optional[str],
+) -> None:
+    """Single-recipient send over the shared keep-alive API connection."""
+    error = _sendgrid_send([(0, to_email)], subject, html, text, requested_from).get(0)
+    if error:
+        raise RuntimeError(error)
+
 # -------------------------------
 # Unified send entry (API first, SMTP fallback)
 # -------------------------------
+def _merge_plan(subject: str, html: Optional[str], text: Optional[str], cache_key: Optional[Hashable],
+                merge: Optional[Mapping[str, Optional[str]]]) -> Optional[CampaignTemplate]:
+    """The compiled merge tags to apply for this recipient, or None when there is nothing to fill in."""
+    if merge is None:
+        return None
+    plan = (compile_campaign(cache_key, subject, html, text) if cache_key is not None
+            else CampaignTemplate(subject, html, text))
+    return plan if plan.personalized else None
+
+def _smtp_message(
+    to_email: str,
+    subject: str,
+    html: Optional[str],
+    text: Optional[str],
+    from_header: Optional[str],
+    envelope_from: Optional[str],
+    cache_key: Optional[Hashable],
+    plan: Optional[CampaignTemplate],
+    merge: Optional[Mapping[str, Optional[str]]],
+) -> Tuple[str, str, bytes]:
+    """(header From, envelope From, message bytes) for one SMTP recipient."""
+    if not html and not text:
+        text = "(no content)"
+
+    hdr_from = (from_header or "").strip() or SMTP_FROM_FALLBACK
+    env_from = (envelope_from or "").strip() or hdr_from
+
+    log.info("[SMTP] preparing -> To=%s | From(hdr)=%s | From(env)=%s | Host=%s:%s TLS=%s SSL=%s",
+             to_email, hdr_from, env_from, SMTP_HOST, SMTP_PORT, SMTP_USE_TLS, SMTP_USE_SSL)
+
+    if plan is not None and plan.body_personalized:
+        p_subject, p_html, p_text = plan.render(merge)
+        msg = personal_message(p_subject, p_html, p_text or (None if p_html else "(no content)"), hdr_from, to_email)
+    else:
+        body = render_cache.get(cache_key, subject, html, text) if cache_key is not None else render(subject, html, text)
+        # Only the subject has tags: shared body, the recipient's Subject spliced in
+        msg = body.message(hdr_from, to_email, subject=plan.subject.render(merge) if plan is not None else None)
+    return hdr_from, env_from, msg
+
+def _smtp_sent(resp: Dict[str, tuple], to_email: str, hdr_from: str, env_from: str) -> None:
+    if resp:
+        log.error("SMTP returned per-recipient errors: %s", resp)
+        raise smtplib.SMTPDataError(500, b"Per-recipient errors")
+    log.info("[SMTP] sent -> To=%s | From(hdr)=%s | From(env)=%s", to_email, hdr_from, env_from)
+
+def _smtp_failed(e: Exception, to_email: str) -> None:
+    if isinstance(e, smtplib.SMTPDataError):
+        log.error("SMTPDataError while sending to %s: %s %s", to_email, e.smtp_code, e.smtp_error)
+    else:
+        log.error("Unexpected SMTP error while sending to %s: %r", to_email, e)
+
 def _send_email(
     to_email: str,
     subject: str,
@@ -123,12 +224,23 @@ def _send_email(
     text: Optional[str],
     from_header: Optional[str],
     envelope_from: Optional[str],
+    relay: Optional[Callable] = None,
+    cache_key: Optional[Hashable] = None,
+    merge: Optional[Mapping[str, Optional[str]]] = None,
 ) -> None:
     """
     If SENDGRID_API_KEY is present, use the Web API (preferred).
-    Otherwise, use SMTP (your existing logic).
+    Otherwise, use SMTP (your existing logic). `relay` is a relay_pool batch sender to
+    reuse (default: any pooled connection). With `cache_key` (campaign id, updated_at)
+    the encoded body comes from the render cache and only the headers are per recipient.
+    `merge` is the recipient's contact_values(): merge tags in subject/html/text are filled
+    from it, using the campaign's compiled templates when `cache_key` is given.
     """
+    plan = _merge_plan(subject, html, text, cache_key, merge)
+
     if SENDGRID_API_KEY:
+        if plan is not None:
+            subject, html, text = plan.render(merge)
         return _send_via_sendgrid_api(
             to_email=to_email,
             subject=subject,
@@ -137,61 +249,60 @@ def _send_email(
             requested_from=(from_header or "").strip(),
         )
 
-    # ---- SMTP fallback (unchanged logic) ----
-    if not html and not text:
-        text = "(no content)"
-
-    hdr_from = (from_header or "").strip() or SMTP_FROM_FALLBACK
-    env_from = (envelope_from or "").strip() or hdr_from
-
-    log.info("[SMTP] preparing -> To=%s | From(hdr)=%s | From(env)=%s | Host=%s:%s TLS=%s SSL=%s",
-             to_email, hdr_from, env_from, SMTP_HOST, SMTP_PORT, SMTP_USE_TLS, SMTP_USE_SSL)
+    # ---- SMTP fallback ----
+    hdr_from, env_from, msg = _smtp_message(to_email, subject, html, text, from_header, envelope_from,
+                                            cache_key, plan, merge)
+    if not health.allow(SMTP_HOST):
+        # Fail fast; Celery's retry backoff brings us back after the circuit's cool-down
+        raise smtplib.SMTPConnectError(421, f"relay {SMTP_HOST} circuit open".encode())
+    try:
+        resp = (relay or relay_pool.sendmail)(env_from, [to_email], msg)
+        _smtp_sent(resp, to_email, hdr_from, env_from)
+    except Exception as e:
+        if _is_relay_failure(e):
+            health.record_failure(SMTP_HOST)
+        _smtp_failed(e, to_email)
+        raise
 
-    msg = MIMEMultipart("alternative")
-    msg["Subject"] = subject
-    msg["From"] = hdr_from
-    msg["To"] = to_email
-    if text:
-        msg.attach(MIMEText(text, "plain"))
-    if html:
-        msg.attach(MIMEText(html, "html"))
+async def _send_email_async(
+    to_email: str,
+    subject: str,
+    html: Optional[str],
+    text: Optional[str],
+    from_header: Optional[str],
+    envelope_from: Optional[str],
+    engine: AsyncRelayEngine,
+    cache_key: Optional[Hashable] = None,
+    merge: Optional[Mapping[str, Optional[str]]] = None,
+) -> None:
+    """
+    _send_email for asyncio callers: SMTP goes through `engine` (pipelined, shared
+    connections), so many of these can run concurrently. The Web API path runs in a thread.
+    The engine checks the relay's circuit and records its failures.
+    """
+    if SENDGRID_API_KEY:
+        return await asyncio.to_thread(_send_email, to_email, subject, html, text, from_header, envelope_from,
+                                       cache_key=cache_key, merge=merge)
 
+    plan = _merge_plan(subject, html, text, cache_key, merge)
+    hdr_from, env_from, msg = _smtp_message(to_email, subject, html, text, from_header, envelope_from,
+                                            cache_key, plan, merge)
     try:
-        if SMTP_USE_SSL:
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT) as server:
-                server.set_debuglevel(1)
-                if SMTP_USERNAME:
-                    server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                resp = server.sendmail(env_from, [to_email], msg.as_string())
-        else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT) as server:
-                server.set_debuglevel(1)
-                server.ehlo()
-                if SMTP_USE_TLS:
-                    server.starttls()
-                    server.ehlo()
-                if SMTP_USERNAME:
-                    server.login(SMTP_USERNAME, SMTP_PASSWORD)
-                resp = server.sendmail(env_from, [to_email], msg.as_string())
-
-        if resp:
-            log.error("SMTP returned per-recipient errors: %s", resp)
-            raise smtplib.SMTPDataError(500, b"Per-recipient errors")
-        log.info("[SMTP] sent -> To=%s | From(hdr)=%s | From(env)=%s", to_email, hdr_from, env_from)
-
-    except smtplib.SMTPDataError as e:
-        log.error("SMTPDataError while sending to %s: %s %s", to_email, e.smtp_code, e.smtp_error)
-        raise
+        resp = await engine.send(env_from, [to_email], msg)
+        _smtp_sent(resp, to_email, hdr_from, env_from)
     except Exception as e:
-        log.error("Unexpected SMTP error while sending to %s: %r", to_email, e)
+        _smtp_failed(e, to_email)
         raise
 
 # -------------------------------
 # Worker flow
 # -------------------------------
-def _send_now(message_id: int) -> None:
+def _send_now(message_id: int, throttle: bool = False) -> Optional[float]:
     """
     Fetch message + campaign + contact, send, and update DB status.
+    With `throttle`, a recipient domain out of send tokens (send_throttle) leaves the
+    message queued and returns the seconds to wait before trying again. Web API sends
+    aren't throttled: SendGrid paces delivery to each destination itself.
     """
     db: Session = SessionLocal()
     try:
@@ -201,6 +312,10 @@ def _send_now(message_id: int) -> None:
             return
         campaign: Campaign = db.get(Campaign, message.campaign_id)
         contact: Contact = db.get(Contact, message.contact_id)
+        if throttle and not SENDGRID_API_KEY:
+            _, deferred = admit([(message.id, contact.email)])
+            if deferred:
+                return deferred[message.id]
 
         visible_from = (campaign.from_email or "").strip() or SMTP_FROM_FALLBACK
         # Envelope From is irrelevant for Web API; kept for SMTP fallback
@@ -213,11 +328,14 @@ def _send_now(message_id: int) -> None:
             text=campaign.text_body,
             from_header=visible_from,
             envelope_from=envelope_from,
+            cache_key=(campaign.id, campaign.updated_at),
+            merge=contact_values(contact),
         )
 
         message.status = "sent"
         message.sent_at = datetime.now(timezone.utc)
         db.commit()
+        return None
 
     except Exception as e:
         db.rollback()
@@ -230,11 +348,176 @@ def _send_now(message_id: int) -> None:
     finally:
         db.close()
 
-def enqueue_send(message_id: int) -> None:
-    if celery_app:
-        celery_app.send_task("send_message_task", args=[message_id])
-    else:
-        _send_now(message_id)
+# Messages per send_batch_task (one SendGrid request holds up to 1000 recipients)
+SEND_BATCH_SIZE = int(os.getenv("SEND_BATCH_SIZE", "1000"))
+# Keep IN (...) lists well below driver parameter limits
+_IN_CHUNK = 1000
+
+class _RelayDown(Exception):
+    """The relay (not the message) failed: leave the rest of the batch queued for a retry."""
+
+def _send_campaign_batch(campaign: Campaign, recipients: List[Tuple[int, str]],
+                         outcomes: Dict[int, Optional[str]],
+                         merge: Optional[Mapping[int, Mapping[str, Optional[str]]]] = None) -> None:
+    """
+    Send one campaign to [(message_id, email)], filling {message_id: None if sent, else the error}.
+    With the Web API, SENDGRID_BATCH_SIZE recipients go out per request; otherwise one SMTP
+    transaction per message, all over one pooled relay connection (or, with SMTP_ASYNC, all
+    in flight at once over the async engine's pipelined connections). SendGridRetryable and
+    _RelayDown propagate (retry later); `outcomes` then holds what was decided before them.
+    `merge` maps message_id to the recipient's contact_values() for merge tags.
+    """
+    visible_from = (campaign.from_email or "").strip() or SMTP_FROM_FALLBACK
+    cache_key = (campaign.id, campaign.updated_at)
+    merge = merge or {}
+    if SENDGRID_API_KEY:
+        plan = compile_campaign(cache_key, campaign.subject, campaign.html_body, campaign.text_body)
+        subject, html, text = plan.keyed_sources() if plan.personalized else plan.sources
+        for chunk in chunks(recipients):
+            subs = {mid: plan.substitutions(merge.get(mid, {})) for mid, _ in chunk} if plan.personalized else None
+            try:
+                outcomes.update(_sendgrid_send(chunk, subject, html, text, visible_from, substitutions=subs))
+            except SendGridRetryable:
+                raise
+            except Exception as e:
+                outcomes.update((mid, f"{type(e).__name__}: {e}") for mid, _ in chunk)
+        return
+
+    envelope_from = (SMTP_ENVELOPE_FROM or visible_from).strip()
+    if SMTP_ASYNC:
+        async def send_all(engine: AsyncRelayEngine) -> list:
+            return await asyncio.gather(*(
+                _send_email_async(email, campaign.subject, campaign.html_body, campaign.text_body,
+                                  visible_from, envelope_from, engine, cache_key=cache_key, merge=merge.get(mid, {}))
+                for mid, email in recipients
+            ), return_exceptions=True)
+
+        relay_down = None
+        for (mid, _), result in zip(recipients, async_relay.run(send_all)):
+            if result is None:
+                outcomes[mid] = None
+            elif _is_relay_failure(result):
+                relay_down = relay_down or result  # left queued for the retry
+            else:
+                outcomes[mid] = f"{type(result).__name__}: {result}"
+        if relay_down is not None:
+            raise _RelayDown(f"{type(relay_down).__name__}: {relay_down}") from relay_down
+        return
+
+    with relay_pool.batch() as relay:
+        for mid, email in recipients:
+            try:
+                _send_email(
+                    to_email=email,
+                    subject=campaign.subject,
+                    html=campaign.html_body,
+                    text=campaign.text_body,
+                    from_header=visible_from,
+                    envelope_from=envelope_from,
+                    relay=relay,
+                    cache_key=cache_key,
+                    merge=merge.get(mid, {}),
+                )
+                outcomes[mid] = None
+            except Exception as e:
+                if _is_relay_failure(e):
+                    raise _RelayDown(f"{type(e).__name__}: {e}") from e
+                outcomes[mid] = f"{type(e).__name__}: {e}"
+
+def _write_outcomes(db: Session, outcomes: Dict[int, Optional[str]]) -> None:
+    """One bulk UPDATE (by primary key) for the batch's message statuses."""
+    if not outcomes:
+        return
+    now = datetime.now(timezone.utc)
+    rows = [
+        {"id": mid, "status": "sent", "sent_at": now, "error": None} if error is None
+        else {"id": mid, "status": "failed", "sent_at": None, "error": error}
+        for mid, error in outcomes.items()
+    ]
+    db.execute(update(Message), rows)
+    db.commit()
+
+def _send_batch_now(message_ids: List[int], deferred: Optional[Dict[int, float]] = None) -> Dict[str, int]:
+    """
+    Send many queued messages: one joined query for messages + recipients (and their merge
+    tag fields), each campaign loaded once, statuses written back in bulk. Messages no
+    longer queued are skipped, so a retry after a relay/API outage only sends what is left.
+    Given a `deferred` dict, recipient domains are throttled (send_throttle): messages over
+    their domain's rate stay queued and are added to it as {message_id: seconds to wait}
+    (SMTP relay only; SendGrid paces Web API sends itself).
+    """
+    db: Session = SessionLocal()
+    try:
+        stmt = (select(Message.id, Message.campaign_id, *(getattr(Contact, f) for f in MERGE_FIELDS))
+                .join(Contact, Contact.id == Message.contact_id)
+                .where(Message.status == "queued"))
+        ids = list(message_ids)
+        rows = []
+        for i in range(0, len(ids), _IN_CHUNK):
+            rows.extend(db.execute(stmt.where(Message.id.in_(ids[i:i + _IN_CHUNK]))).all())
+        if deferred is not None and rows and not SENDGRID_API_KEY:
+            allowed, waits = admit([(row.id, row.email) for row in rows])
+            deferred.update(waits)
+            if waits:
+                allowed = set(allowed)
+                rows = [row for row in rows if row.id in allowed]
+        by_campaign: Dict[int, List[Tuple[int, str]]] = {}
+        merge: Dict[int, Dict[str, Optional[str]]] = {}
+        for row in rows:
+            by_campaign.setdefault(row.campaign_id, []).append((row.id, row.email))
+            merge[row.id] = contact_values(row._mapping)
+        campaigns = {c.id: c for c in db.execute(
+            select(Campaign).where(Campaign.id.in_(list(by_campaign)))
+        ).scalars()} if by_campaign else {}
+
+        counts = {"sent": 0, "failed": 0, "deferred": len(deferred or ())}
+        for campaign_id, recipients in by_campaign.items():
+            outcomes: Dict[int, Optional[str]] = {}
+            try:
+                _send_campaign_batch(campaigns[campaign_id], recipients, outcomes, merge)
+            finally:
+                # Record what was decided even if an outage cut the batch short
+                _write_outcomes(db, outcomes)
+                for error in outcomes.values():
+                    counts["sent" if error is None else "failed"] += 1
+        return counts
+    finally:
+        db.close()
+
+def _fail_queued(message_ids: List[int], error: str) -> None:
+    """Give up on a batch's still-queued messages (retries exhausted)."""
+    db: Session = SessionLocal()
+    try:
+        for i in range(0, len(message_ids), _IN_CHUNK):
+            db.execute(update(Message)
+                       .where(Message.id.in_(message_ids[i:i + _IN_CHUNK]), Message.status == "queued")
+                       .values(status="failed", error=error))
+        db.commit()
+    finally:
+        db.close()
+
+def _reschedule(deferred: Dict[int, float]) -> int:
+    """
+    Publish deferred messages as send_batch_tasks, soonest first, SEND_BATCH_SIZE per task.
+    Each task is due at the longest wait among its messages, so the rest wait a little
+    longer than they must instead of getting a tiny task per second of delay. Returns tasks.
+    """
+    ids = sorted(deferred, key=deferred.__getitem__)
+    groups = [ids[i:i + SEND_BATCH_SIZE] for i in range(0, len(ids), SEND_BATCH_SIZE)]
+    for group in groups:
+        celery_app.send_task("send_batch_task", args=[group], countdown=max(1, math.ceil(deferred[group[-1]])))
+    return len(groups)
+
+def enqueue_send_many(message_ids: Sequence[int]) -> int:
+    """Publish queued messages as one send_batch_task per SEND_BATCH_SIZE (sent inline without Celery). Returns tasks."""
+    ids = list(message_ids)
+    groups = [ids[i:i + SEND_BATCH_SIZE] for i in range(0, len(ids), SEND_BATCH_SIZE)]
+    for group in groups:
+        if celery_app:
+            celery_app.send_task("send_batch_task", args=[group])
+        else:
+            _send_batch_now(group)
+    return len(groups)
 
 if celery_app:
     from celery import Celery  # type hints
@@ -242,6 +525,37 @@ if celery_app:
     @celery_app.task(name="send_message_task", bind=True, max_retries=3, default_retry_delay=10)
     def send_message_task(self, message_id: int):
         try:
-            _send_now(message_id)
+            wait = _send_now(message_id, throttle=True)
         except Exception as e:
             raise self.retry(exc=e, countdown=min(300, 10 * (2 ** self.request.retries)))
+        if wait is not None:
+            # Domain over its send rate: come back later (a new task, not a retry)
+            celery_app.send_task("send_message_task", args=[message_id], countdown=max(1, math.ceil(wait)))
+
+    @celery_app.task(name="send_batch_task", bind=True, max_retries=5, default_retry_delay=10)
+    def send_batch_task(self, message_ids: List[int]):
+        deferred: Dict[int, float] = {}
+        try:
+            counts = _send_batch_now(message_ids, deferred)
+        except (SendGridRetryable, _RelayDown) as e:
+            if self.request.retries >= self.max_retries:
+                # Throttled messages were never tried: they keep their own schedule
+                _fail_queued([mid for mid in message_ids if mid not in deferred], f"{type(e).__name__}: {e}")
+                if deferred:
+                    _reschedule(deferred)
+                raise
+            # Only still-queued messages (deferred ones included) are sent again
+            raise self.retry(exc=e, countdown=min(300, 10 * (2 ** self.request.retries)))
+        if deferred:
+            _reschedule(deferred)
+        return counts
+
+    @celery_app.task(name="reprobe_domain_task")
+    def reprobe_domain_task(domain: str):
+        from reprobe import run_domain
+        return run_domain(domain)
+
+    @celery_app.task(name="validation_job_task", acks_late=True)
+    def validation_job_task(job_id: int):
+        from validation_jobs import run_job
+        return run_job(job_id)
@@ -0,0 +1,4 @@
+# Modules under app/ import each other by bare name (as when run from app/)
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+from merge_tags import CampaignTemplate, Template
+from mime_cache import encode_header
+
+EVIL = {"first_name": "x onmouseover=alert(1)", "website": "javascript:alert(1)"}
+
+
+def render(source, values):
+    return Template(source, is_html=True).render(values)
+
+
+def test_text_and_quoted_attributes_are_escaped():
+    values = {"first_name": '<b>"Bo"</b>'}
+    assert render("<p>Hi {{first_name}}</p>", values) == "<p>Hi &lt;b&gt;&quot;Bo&quot;&lt;/b&gt;</p>"
+    assert render('<img alt="{{first_name}}">', values) == '<img alt="&lt;b&gt;&quot;Bo&quot;&lt;/b&gt;">'
+
+
+def test_unquoted_attribute_value_renders_default():
+    assert render("<img alt={{first_name|friend}}>", EVIL) == "<img alt=friend>"
+    assert render("<a href={{website}}>x</a>", {"website": "https://example.com"}) == "<a href=>x</a>"
+
+
+def test_attribute_name_position_renders_default():
+    assert render('<div {{first_name}}>', EVIL) == "<div >"
+    assert render('<a title="t" {{first_name|x}}>', EVIL) == '<a title="t" x>'
+
+
+def test_handlers_and_style_render_default():
+    assert render("<a onclick=\"hi('{{first_name}}')\">", EVIL) == "<a onclick=\"hi('')\">"
+    assert render('<p style="color:{{first_name|red}}">', EVIL) == '<p style="color:red">'
+
+
+def test_url_attributes_need_an_absolute_web_link():
+    assert render('<a href="{{website|#}}">', EVIL) == '<a href="#">'
+    assert render('<a href="{{website|#}}">', {"website": "//evil.example"}) == '<a href="#">'
+    assert render('<a href="{{website}}">', {"website": "https://example.com/?a=1&b=2"}) == \
+        '<a href="https://example.com/?a=1&amp;b=2">'
+
+
+def test_plain_templates_are_not_escaped():
+    assert Template("Hi {{first_name|there}} <3").render({"first_name": "<Bo>"}) == "Hi <Bo> <3"
+
+
+def test_subject_values_cannot_break_the_header():
+    subject = CampaignTemplate("{{first_name}}, news", None, None).subject
+    line = encode_header("Subject", subject.render({"first_name": "Hi\nthere"}))
+    assert line == b"Subject: Hi there, news\r\n"
+    line = encode_header("Subject", subject.render({"first_name": "x\r\nBcc: a@b"}))
+    assert line == b"Subject: x Bcc: a@b, news\r\n"
@@ -0,0 +1,129 @@
+# typo_index.py
+"""
+Domain typo suggestions from a precomputed edit-distance index.
+
+SymSpell-style: every candidate domain is indexed under the strings obtained by deleting
+up to `max_distance` characters from its first `prefix_length` characters. A lookup
+generates the same deletes for the input, so only the handful of candidates sharing a
+delete key are compared with a real (Damerau/OSA) edit distance, however long the list.
+Ties on distance go to the most frequent domain.
+"""
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+
+def load_domain_frequencies(path: str) -> Dict[str, int]:
+    """
+    Read a domain list: one domain per line, optionally followed by a count
+    ("gmail.com 1800000" or "gmail.com,1800000"). Blank lines and '#' comments are skipped;
+    a missing count means 1.
+    """
+    out: Dict[str, int] = {}
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(",", " ").split()
+            try:
+                count = int(float(parts[1])) if len(parts) > 1 else 1
+            except ValueError:
+                count = 1
+            domain = parts[0].lower().rstrip(".")
+            out[domain] = max(out.get(domain, 0), count)
+    return out
+
+
+def _osa_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent transpositions count 1); limit+1 once above limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                v = min(v, prev2[j - 2] + 1)
+            cur[j] = v
+            row_min = min(row_min, v)
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= limit else limit + 1
+
+
+class TypoIndex:
+    def __init__(self, domains: Union[Dict[str, int], Iterable[str]], max_distance: int = 2,
+                 prefix_length: int = 7):
+        self.max_distance = max_distance
+        self.prefix_length = max(prefix_length, max_distance + 1)
+        freqs = dict(domains) if isinstance(domains, dict) else {d: 1 for d in domains}
+        self.freq: Dict[str, int] = {d.lower(): int(c) for d, c in freqs.items() if d}
+        deletes: Dict[str, Set[str]] = {}
+        for word in self.freq:
+            for key in self._deletes(word[:self.prefix_length]):
+                deletes.setdefault(key, set()).add(word)
+        # tuples: far smaller than sets once the index is frozen
+        self._deletes_index: Dict[str, Tuple[str, ...]] = {k: tuple(v) for k, v in deletes.items()}
+
+    def __len__(self) -> int:
+        return len(self.freq)
+
+    def __contains__(self, domain: str) -> bool:
+        return domain.lower() in self.freq
+
+    def _deletes(self, s: str) -> Set[str]:
+        out = {s}
+        frontier = {s}
+        for _ in range(self.max_distance):
+            nxt = set()
+            for t in frontier:
+                if len(t) <= 1:
+                    continue
+                for i in range(len(t)):
+                    nxt.add(t[:i] + t[i + 1:])
+            out |= nxt
+            frontier = nxt
+        return out
+
+    def allowed_distance(self, term: str) -> int:
+        """Short names tolerate fewer edits: one per five characters, at least one."""
+        return min(self.max_distance, max(1, len(term) // 5))
+
+    def lookup(self, term: str) -> Optional[Tuple[str, int]]:
+        """Return (closest_domain, distance) within the allowed distance, or None. Exact hits return distance 0."""
+        term = term.lower()
+        if term in self.freq:
+            return term, 0
+        limit = self.allowed_distance(term)
+        best: Optional[str] = None
+        best_d = limit + 1
+        seen: Set[str] = set()
+        for key in self._deletes(term[:self.prefix_length]):
+            for word in self._deletes_index.get(key, ()):
+                if word in seen:
+                    continue
+                seen.add(word)
+                d = _osa_distance(term, word, min(limit, best_d))
+                if d < best_d or (d == best_d and best is not None and self.freq[word] > self.freq[best]):
+                    if d <= limit:
+                        best, best_d = word, d
+        return (best, best_d) if best is not None else None
+
+
+def build_index(defaults: Iterable[str], path: Optional[str] = None, max_distance: int = 2) -> TypoIndex:
+    """Index `defaults` plus the domains of the frequency file at `path` (if it exists)."""
+    freqs: Dict[str, int] = {d: 1 for d in defaults}
+    if path:
+        try:
+            for d, c in load_domain_frequencies(path).items():
+                freqs[d] = max(freqs.get(d, 0), c)
+        except OSError as e:
+            log.warning("Typo index: cannot read %s (%s); using built-in domains only", path, e)
+    return TypoIndex(freqs, max_distance=max_distance)
@@ -0,0 +1,185 @@
+# validation_cache.py
+"""
+Caches shared by the validator.
+
+Every entry lives in a small in-process LRU with per-entry TTL; when REDIS_URL is set it
+is mirrored to Redis so the API processes and the Celery workers see the same verdicts.
+Redis is best-effort: if it is down we keep working from the local cache.
+"""
+import os, json, time, threading, logging
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+REDIS_URL = os.getenv("REDIS_URL", "")
+CACHE_PREFIX = os.getenv("VALIDATION_CACHE_PREFIX", "sglite:v1:")
+# Accept-all verdicts: conclusive answers are stable for a long time, inconclusive ones are retried sooner
+ACCEPT_ALL_TTL = int(os.getenv("ACCEPT_ALL_CACHE_TTL", "86400"))
+ACCEPT_ALL_INCONCLUSIVE_TTL = int(os.getenv("ACCEPT_ALL_INCONCLUSIVE_TTL", "600"))
+LOCAL_CACHE_SIZE = int(os.getenv("VALIDATION_LOCAL_CACHE_SIZE", "50000"))
+# MX lookups: positive answers follow the record TTL (clamped), NXDOMAIN/no-MX use the
+# negative TTL, and transient failures (timeouts, SERVFAIL) are only remembered briefly.
+MX_CACHE_SIZE = int(os.getenv("MX_CACHE_SIZE", "20000"))
+MX_MIN_TTL = int(os.getenv("MX_MIN_TTL", "60"))
+MX_MAX_TTL = int(os.getenv("MX_MAX_TTL", "86400"))
+MX_NEGATIVE_TTL = int(os.getenv("MX_NEGATIVE_TTL", "3600"))
+MX_TEMP_TTL = int(os.getenv("MX_TEMP_TTL", "30"))
+
+MX_OK, MX_NONE, MX_TEMP = "ok", "none", "temp"
+
+# After a Redis error, stay local-only for this long instead of paying a timeout per call
+_REDIS_RETRY_AFTER = 30.0
+
+
+class _LocalTTLCache:
+    """Thread-safe LRU with per-entry expiry."""
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False, None
+            expires, value = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return False, None
+            self._data.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_redis = None
+_redis_down_until = 0.0
+
+def get_redis():
+    """Lazily connect to Redis; None when not configured or recently unreachable."""
+    global _redis
+    if not REDIS_URL or time.monotonic() < _redis_down_until:
+        return None
+    if _redis is None:
+        try:
+            import redis
+            _redis = redis.Redis.from_url(
+                REDIS_URL, decode_responses=True, socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        except Exception as e:
+            _redis_failed(e)
+            return None
+    return _redis
+
+def _redis_failed(exc: Exception) -> None:
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + _REDIS_RETRY_AFTER
+    log.warning("Validation cache: Redis unavailable, using local cache only (%s)", exc)
+
+
+def _shared_get(key: str) -> Tuple[Optional[str], int]:
+    """Return (value, remaining_ttl_seconds) from Redis, or (None, 0)."""
+    r = get_redis()
+    if r is None:
+        return None, 0
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.get(CACHE_PREFIX + key)
+        pipe.ttl(CACHE_PREFIX + key)
+        value, ttl = pipe.execute()
+        return value, max(0, ttl or 0)
+    except Exception as e:
+        _redis_failed(e)
+        return None, 0
+
+def _shared_set(key: str, value: str, ttl: float) -> None:
+    r = get_redis()
+    if r is None:
+        return
+    try:
+        r.setex(CACHE_PREFIX + key, max(1, int(ttl)), value)
+    except Exception as e:
+        _redis_failed(e)
+
+
+# ---------------------------
+# Accept-all verdicts (per domain)
+# ---------------------------
+_accept_all_local = _LocalTTLCache(LOCAL_CACHE_SIZE)
+_AA_ENCODE = {True: "1", False: "0", None: "?"}
+_AA_DECODE = {v: k for k, v in _AA_ENCODE.items()}
+
+def get_accept_all(domain: str) -> Tuple[bool, Optional[bool]]:
+    """Return (hit, verdict). verdict is True/False, or None for a cached 'inconclusive'."""
+    key = "aa:" + domain.lower()
+    hit, value = _accept_all_local.get(key)
+    if hit:
+        return True, value
+    raw, ttl = _shared_get(key)
+    if raw in _AA_DECODE and ttl > 0:
+        value = _AA_DECODE[raw]
+        _accept_all_local.set(key, value, ttl)
+        return True, value
+    return False, None
+
+def set_accept_all(domain: str, verdict: Optional[bool]) -> None:
+    key = "aa:" + domain.lower()
+    ttl = _accept_all_ttl(verdict)
+    _accept_all_local.set(key, verdict, ttl)
+    _shared_set(key, _AA_ENCODE[verdict], ttl)
+
+def _accept_all_ttl(verdict: Optional[bool]) -> int:
+    return ACCEPT_ALL_INCONCLUSIVE_TTL if verdict is None else ACCEPT_ALL_TTL
+
+
+# ---------------------------
+# MX lookups (per domain)
+# ---------------------------
+_mx_local = _LocalTTLCache(MX_CACHE_SIZE)
+
+def get_mx(domain: str) -> Optional[Tuple[str, List[str], str]]:
+    """Return (status, hosts, provider_guess) or None on a miss. status is MX_OK / MX_NONE / MX_TEMP."""
+    key = "mx:" + domain.lower()
+    hit, value = _mx_local.get(key)
+    if hit:
+        return value
+    raw, ttl = _shared_get(key)
+    if raw and ttl > 0:
+        try:
+            d = json.loads(raw)
+            value = (d["s"], list(d["h"]), d["p"])
+        except Exception:
+            return None
+        _mx_local.set(key, value, ttl)
+        return value
+    return None
+
+def set_mx(domain: str, status: str, hosts: List[str], provider_guess: str, ttl: Optional[int] = None) -> None:
+    """Store an MX result. `ttl` is the record TTL for MX_OK answers; other statuses use the configured TTLs."""
+    if status == MX_OK:
+        ttl = min(MX_MAX_TTL, max(MX_MIN_TTL, ttl if ttl is not None else MX_MIN_TTL))
+    elif status == MX_NONE:
+        ttl = MX_NEGATIVE_TTL
+    else:
+        ttl = MX_TEMP_TTL
+    key = "mx:" + domain.lower()
+    value = (status, list(hosts), provider_guess)
+    _mx_local.set(key, value, ttl)
+    _shared_set(key, json.dumps({"s": status, "h": value[1], "p": provider_guess}), ttl)
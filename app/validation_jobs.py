@@ -0,0 +1,305 @@
+# validation_jobs.py
+"""
+Background validation jobs.
+
+A job (table `validation_jobs`) names a contact selection. When it first runs, the
+selection is frozen into `items`: contact ids sorted by recipient domain, so each chunk
+touches few domains and the bulk engine can probe each domain over one SMTP session.
+Chunks of VALIDATION_JOB_CHUNK are validated, written back to Contact and committed
+together with `checkpoint`. A cancelled, failed or interrupted job therefore resumes
+exactly where it stopped.
+
+A run owns its job through a lease: it claims the row with a conditional UPDATE (a
+queued job, or a running one whose heartbeat is older than VALIDATION_JOB_LEASE) and
+renews the heartbeat with every chunk it commits. A run that finds its lease taken over
+stops, so two workers never process the same job.
+
+Live progress is mirrored to Redis (hash `vjob:<id>`) after every chunk, so status polls
+don't hit the database. Without Redis, polls read the job row.
+"""
+import os, time, uuid, logging, threading
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+
+from db import SessionLocal
+from models import Contact, ValidationJob
+from reprobe import defer_if_temp
+from validation_cache import get_redis
+from validation_store import validate_many_cached
+
+log = logging.getLogger(__name__)
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+VALIDATION_JOB_CHUNK = int(os.getenv("VALIDATION_JOB_CHUNK", "500"))
+VALIDATION_JOB_PROGRESS_TTL = int(os.getenv("VALIDATION_JOB_PROGRESS_TTL", str(7 * 24 * 3600)))
+# Seconds without a heartbeat after which a running job counts as orphaned
+VALIDATION_JOB_LEASE = int(os.getenv("VALIDATION_JOB_LEASE", "900"))
+
+STATUS_MAP = {"valid": "valid", "invalid": "invalid", "risky": "risky"}
+COUNTERS = ("valid", "invalid", "risky", "unknown")
+RESUMABLE = {"cancelled", "failed"}
+_KEY = "vjob:"
+# Keep IN (...) lists well below driver parameter limits
+_IN_CHUNK = 1000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _domain_key(email: str):
+    return email.rsplit("@", 1)[-1].lower()
+
+
+# ---------------------------
+# Progress (Redis, best-effort)
+# ---------------------------
+def _publish(job: ValidationJob, run_start: Optional[dict] = None) -> None:
+    r = get_redis()
+    if r is None:
+        return
+    fields = {"status": job.status, "total": job.total, "done": job.checkpoint,
+              **{k: getattr(job, k) for k in COUNTERS}}
+    if run_start:
+        fields.update(run_start)
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.hset(_KEY + str(job.id), mapping=fields)
+        pipe.expire(_KEY + str(job.id), VALIDATION_JOB_PROGRESS_TTL)
+        pipe.execute()
+    except Exception as e:
+        log.warning("Validation job %s: progress not published (%s)", job.id, e)
+
+
+def progress(job: ValidationJob) -> dict:
+    """Job state for the API: live counters from Redis when available, else the row; plus an ETA."""
+    data = {"status": job.status, "total": job.total, "done": job.checkpoint,
+            **{k: getattr(job, k) for k in COUNTERS}}
+    live: Dict[str, str] = {}
+    r = get_redis()
+    if r is not None:
+        try:
+            live = r.hgetall(_KEY + str(job.id)) or {}
+        except Exception:
+            live = {}
+    for k in ("total", "done", *COUNTERS):
+        if k in live:
+            data[k] = max(data[k], int(live[k]))  # the row may lag a chunk behind, never lead
+    # the row is authoritative for status (cancel/resume are written there first)
+
+    eta = None
+    if data["status"] == "running" and "t0" in live:
+        elapsed = time.time() - float(live["t0"])
+        done_this_run = data["done"] - int(live.get("d0", 0))
+        if done_this_run > 0 and elapsed > 0:
+            eta = round((data["total"] - data["done"]) * elapsed / done_this_run, 1)
+    return {
+        "id": job.id, **data, "eta_seconds": eta, "error": job.error,
+        "created_at": job.created_at, "started_at": job.started_at, "finished_at": job.finished_at,
+    }
+
+
+# ---------------------------
+# Lifecycle
+# ---------------------------
+def create_job(db, owner_id: Optional[int], contact_ids: Optional[List[int]], status_filter: Optional[str],
+               do_smtp: bool, force: bool = False, timeout: float = 6.0, concurrency: int = 20) -> ValidationJob:
+    """Add a queued job to `db` and commit it. Call enqueue_job(job.id) afterwards."""
+    job = ValidationJob(owner_id=owner_id, status="queued", contact_ids=contact_ids or None,
+                        status_filter=status_filter, do_smtp=do_smtp, force=force,
+                        timeout=timeout, concurrency=concurrency)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def enqueue_job(job_id: int) -> None:
+    from tasks import celery_app  # late import: tasks registers the task that calls run_job
+    if celery_app:
+        celery_app.send_task("validation_job_task", args=[job_id])
+    else:
+        # No broker: still keep the request thread free
+        threading.Thread(target=run_job, args=(job_id,), daemon=True).start()
+
+
+def cancel_job(db, job: ValidationJob) -> ValidationJob:
+    """Stop after the chunk in progress; the checkpoint is kept for resume_job."""
+    if job.status in ("queued", "running"):
+        job.status = "cancelled"
+        job.finished_at = _now()
+        db.commit()
+        _publish(job)
+    return job
+
+
+def _orphaned(job: ValidationJob) -> bool:
+    """Running, but its worker hasn't checked in within the lease."""
+    if job.status != "running":
+        return False
+    beat = job.heartbeat_at
+    if beat is None:
+        return True
+    if beat.tzinfo is None:  # SQLite drops the tz
+        beat = beat.replace(tzinfo=timezone.utc)
+    return _now() - beat > timedelta(seconds=VALIDATION_JOB_LEASE)
+
+
+def resume_job(db, job: ValidationJob) -> ValidationJob:
+    """Re-queue a cancelled/failed (or orphaned running) job; it continues from its checkpoint."""
+    if job.status in RESUMABLE or _orphaned(job):
+        job.status = "queued"
+        job.lease_id = None  # a run still holding it stops at its next chunk
+        job.error = None
+        job.finished_at = None
+        db.commit()
+        _publish(job)
+        enqueue_job(job.id)
+    return job
+
+
+def owned_ids(db, contact_ids: List[int], owner_id: int) -> List[int]:
+    """The ids among `contact_ids` that belong to `owner_id` (for jobs selected by id over the API)."""
+    ids = list(contact_ids)
+    owned: List[int] = []
+    for i in range(0, len(ids), _IN_CHUNK):
+        owned.extend(db.execute(select(Contact.id).where(
+            Contact.id.in_(ids[i:i + _IN_CHUNK]), Contact.owner_id == owner_id,
+        )).scalars())
+    return owned
+
+
+def _snapshot(db, job: ValidationJob) -> List[int]:
+    """
+    Freeze the selection as contact ids in (domain, id) order. An explicit id list is taken
+    as given (callers check ownership when they create the job: see owned_ids); the owner
+    only scopes status-filter selections.
+    """
+    stmt = select(Contact.id, Contact.email)
+    if job.status_filter and job.status_filter != "all":
+        stmt = stmt.where(Contact.status == job.status_filter)
+    if job.contact_ids:
+        ids = list(job.contact_ids)
+        rows = []
+        for i in range(0, len(ids), _IN_CHUNK):
+            rows.extend(db.execute(stmt.where(Contact.id.in_(ids[i:i + _IN_CHUNK]))).all())
+    else:
+        if job.owner_id is not None:
+            stmt = stmt.where(Contact.owner_id == job.owner_id)
+        rows = db.execute(stmt).all()
+    rows.sort(key=lambda row: (_domain_key(row[1]), row[0]))
+    return [cid for cid, _ in rows]
+
+
+def _run_chunk(db, job: ValidationJob, ids: List[int]) -> List[dict]:
+    contacts = db.execute(select(Contact).where(Contact.id.in_(ids))).scalars().all()
+    by_email: Dict[str, List[Contact]] = {}
+    for c in contacts:
+        by_email.setdefault(c.email, []).append(c)
+    results = validate_many_cached(db, list(by_email), timeout=job.timeout, do_smtp=job.do_smtp,
+                                   force=job.force, concurrency=job.concurrency, group_by_domain=True)
+    for res in results:
+        status = STATUS_MAP.get(res.get("verdict"), "unknown")
+        for c in by_email.get(res.get("email"), []):
+            c.status = status
+            c.reason = res.get("reason")
+            c.provider = res.get("provider")
+            setattr(job, status, getattr(job, status) + 1)
+    return results
+
+
+def _claim(db, job_id: int, lease: str) -> Optional[ValidationJob]:
+    """Take the job for this run (compare-and-set): queued, or running with an expired lease."""
+    now = _now()
+    stale = now - timedelta(seconds=VALIDATION_JOB_LEASE)
+    claimed = db.execute(
+        update(ValidationJob)
+        .where(ValidationJob.id == job_id, or_(
+            ValidationJob.status == "queued",
+            and_(ValidationJob.status == "running",
+                 or_(ValidationJob.heartbeat_at.is_(None), ValidationJob.heartbeat_at < stale)),
+        ))
+        .values(status="running", lease_id=lease, heartbeat_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    if not claimed:
+        return None
+    job = db.get(ValidationJob, job_id)
+    if job.checkpoint:
+        log.info("Validation job %s resumed at %d/%d", job.id, job.checkpoint, job.total)
+    return job
+
+
+def _renew(db, job_id: int, lease: str) -> bool:
+    """Heartbeat, committed with the chunk; False when another run has taken the job over."""
+    return db.execute(
+        update(ValidationJob)
+        .where(ValidationJob.id == job_id, ValidationJob.lease_id == lease)
+        .values(heartbeat_at=_now())
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def run_job(job_id: int) -> dict:
+    """
+    Worker entry point: claim the job and process its remaining chunks. A job still
+    "running" (a redelivered acks_late task) is only taken over once its lease expired.
+    """
+    db = SessionLocal()
+    lease = uuid.uuid4().hex
+    try:
+        job = _claim(db, job_id, lease)
+        if job is None:
+            return {"id": job_id, "skipped": True}
+        job.started_at = job.started_at or _now()
+        if job.items is None:
+            job.items = _snapshot(db, job)
+            job.total = len(job.items)
+        db.commit()
+        _publish(job, {"t0": time.time(), "d0": job.checkpoint})
+
+        items = list(job.items)
+        while job.checkpoint < job.total:
+            db.refresh(job, ["status"])
+            if job.status != "running":  # cancelled meanwhile
+                log.info("Validation job %s stopped at %d/%d", job.id, job.checkpoint, job.total)
+                return {"id": job.id, "status": job.status, "done": job.checkpoint}
+            ids = items[job.checkpoint:job.checkpoint + VALIDATION_JOB_CHUNK]
+            results = _run_chunk(db, job, ids)
+            if not _renew(db, job.id, lease):
+                db.rollback()
+                log.warning("Validation job %s: lease lost at %d/%d, stopping", job.id, job.checkpoint, job.total)
+                return {"id": job.id, "skipped": True}
+            job.checkpoint += len(ids)
+            db.commit()
+            _publish(job)
+            for res in results:
+                defer_if_temp(res)
+
+        if not _renew(db, job.id, lease):
+            db.rollback()
+            return {"id": job.id, "skipped": True}
+        job.status = "done"
+        job.finished_at = _now()
+        db.commit()
+        _publish(job)
+        log.info("Validation job %s done: %d contacts", job.id, job.total)
+        return {"id": job.id, "status": job.status, "done": job.checkpoint}
+    except Exception as e:
+        db.rollback()
+        job = db.get(ValidationJob, job_id)
+        if job is not None and job.lease_id == lease:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            job.finished_at = _now()
+            db.commit()
+            _publish(job)
+        log.exception("Validation job %s failed", job_id)
+        raise
+    finally:
+        db.close()
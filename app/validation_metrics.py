@@ -0,0 +1,391 @@
+# validation_metrics.py
+"""
+Per-stage timing histograms and outcome counters for the validators.
+
+validate_email_record and smtp_probe (and their async twins in bulk_validation) time each stage (syntax, MX lookup, TCP connect,
+banner, EHLO, STARTTLS, MAIL FROM, RCPT, accept-all check) and count its outcome code
+(SMTP reply, MX status, verdict reason). Durations go into fixed-bucket histograms,
+Prometheus style, so p50/p99 can be read off without keeping samples. Each call's total
+is also charged to its recipient domain; the domains that cost the most are kept
+(at most VALIDATION_METRICS_MAX_DOMAINS, least recently seen forgotten first).
+
+While a call runs, its own stage times are collected too (see collect()), so a result
+can carry them under a `timings` key. Nested work that has its own stage (the canary
+probes inside the accept-all check) is charged to that stage only.
+
+Each process keeps its own figures, and a background thread adds what it recorded since
+the last flush to Redis every VALIDATION_METRICS_FLUSH_SECONDS (HINCRBY per bucket), so
+the API process can report what its Celery workers validated too:
+
+  vmetrics:stages         set   stage names seen
+  vmetrics:h:<stage>      hash  b0..bN bucket counts, count, sum (seconds)
+  vmetrics:o:<stage>      hash  outcome -> count
+  vmetrics:domains        zset  domain -> total seconds (the costliest MAX_DOMAINS kept)
+  vmetrics:d:<domain>     hash  calls, <stage> seconds
+  vmetrics:since          string  when the figures were last reset (epoch seconds)
+
+Without Redis only the per-process figures exist.
+"""
+import os, time, logging, threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from validation_cache import get_redis
+
+log = logging.getLogger(__name__)
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+VALIDATION_METRICS_ENABLED = os.getenv("VALIDATION_METRICS_ENABLED", "true").lower() == "true"
+VALIDATION_METRICS_MAX_DOMAINS = int(os.getenv("VALIDATION_METRICS_MAX_DOMAINS", "2000"))
+# How often each process adds its new figures to the shared (Redis) totals; 0 disables sharing
+VALIDATION_METRICS_FLUSH_SECONDS = float(os.getenv("VALIDATION_METRICS_FLUSH_SECONDS", "5"))
+
+STAGES = ("syntax", "mx", "pool", "tcp_connect", "banner", "ehlo", "starttls", "mail_from", "rcpt",
+          "smtp_probe", "accept_all", "total")
+# Upper bounds in seconds; the last bucket is +Inf
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_KEY = "vmetrics:"
+# Per-domain rows outlive a reset at most this long (seconds)
+_DOMAIN_TTL = 7 * 24 * 3600
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        i = 0
+        while i < len(BUCKETS) and seconds > BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def copy(self) -> "Histogram":
+        h = Histogram()
+        h.counts, h.count, h.sum = list(self.counts), self.count, self.sum
+        return h
+
+    @classmethod
+    def from_hash(cls, fields: Dict[str, str]) -> "Histogram":
+        h = cls()
+        h.counts = [int(fields.get(f"b{i}", 0)) for i in range(len(BUCKETS) + 1)]
+        h.count = int(fields.get("count", 0))
+        h.sum = float(fields.get("sum", 0.0))
+        return h
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None above the last bound)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else None
+        return None
+
+    def snapshot(self) -> dict:
+        p50, p99 = self.quantile(0.5), self.quantile(0.99)
+        return {
+            "count": self.count,
+            "sum_ms": round(self.sum * 1000, 1),
+            "avg_ms": round(self.sum * 1000 / self.count, 1) if self.count else None,
+            "p50_le_ms": p50 * 1000 if p50 is not None else None,
+            "p99_le_ms": p99 * 1000 if p99 is not None else None,
+            "buckets": {("+Inf" if i == len(BUCKETS) else str(BUCKETS[i])): n for i, n in enumerate(self.counts)},
+        }
+
+
+class ValidationMetrics:
+    def __init__(self, max_domains: int = VALIDATION_METRICS_MAX_DOMAINS, enabled: bool = VALIDATION_METRICS_ENABLED,
+                 flush_seconds: float = VALIDATION_METRICS_FLUSH_SECONDS):
+        self.enabled = enabled
+        self.max_domains = max(0, max_domains)
+        self.flush_seconds = flush_seconds
+        self._hist: Dict[str, Histogram] = {}
+        self._outcomes: Dict[str, Dict[str, int]] = {}
+        self._domains: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._started = time.time()
+        self._lock = threading.Lock()
+        # Recorded since the last flush to Redis
+        self._new_hist: Dict[str, Histogram] = {}
+        self._new_outcomes: Dict[str, Dict[str, int]] = {}
+        self._new_domains: Dict[str, Dict[str, float]] = {}
+        self._flusher_pid: Optional[int] = None
+
+    def observe(self, stage: str, seconds: float, outcome=None) -> None:
+        if not self.enabled:
+            return
+        self._start_flusher()
+        with self._lock:
+            for hists, outcomes in ((self._hist, self._outcomes), (self._new_hist, self._new_outcomes)):
+                hist = hists.get(stage)
+                if hist is None:
+                    hist = hists[stage] = Histogram()
+                hist.observe(seconds)
+                if outcome is not None:
+                    counts = outcomes.setdefault(stage, {})
+                    counts[str(outcome)] = counts.get(str(outcome), 0) + 1
+
+    def charge_domain(self, domain: str, stages: Dict[str, float]) -> None:
+        """Add one call's stage times (seconds, including "total") to its domain."""
+        if not self.enabled or not self.max_domains or not domain:
+            return
+        domain = domain.lower()
+        with self._lock:
+            row = self._domains.pop(domain, None) or {"calls": 0}
+            new = self._new_domains.setdefault(domain, {"calls": 0})
+            for r in (row, new):
+                r["calls"] += 1
+                for stage, seconds in stages.items():
+                    r[stage] = r.get(stage, 0.0) + seconds
+            self._domains[domain] = row
+            while len(self._domains) > self.max_domains:
+                self._domains.popitem(last=False)
+
+    # ---- shared totals (Redis) ----
+    def _start_flusher(self) -> None:
+        """One flush thread per process (threads don't survive a fork)."""
+        if self._flusher_pid == os.getpid() or self.flush_seconds <= 0:
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            # figures inherited from the parent were the parent's to flush
+            self._new_hist, self._new_outcomes, self._new_domains = {}, {}, {}
+        threading.Thread(target=self._flush_loop, name="validation-metrics", daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self) -> None:
+        """Add what this process recorded since the last flush to the shared totals."""
+        with self._lock:
+            hists, outcomes, domains = self._new_hist, self._new_outcomes, self._new_domains
+            self._new_hist, self._new_outcomes, self._new_domains = {}, {}, {}
+        if not (hists or outcomes or domains):
+            return
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.set(_KEY + "since", self._started, nx=True)
+            if hists:
+                pipe.sadd(_KEY + "stages", *hists)
+            for stage, h in hists.items():
+                key = _KEY + "h:" + stage
+                for i, n in enumerate(h.counts):
+                    if n:
+                        pipe.hincrby(key, f"b{i}", n)
+                pipe.hincrby(key, "count", h.count)
+                pipe.hincrbyfloat(key, "sum", h.sum)
+            for stage, counts in outcomes.items():
+                for outcome, n in counts.items():
+                    pipe.hincrby(_KEY + "o:" + stage, outcome, n)
+            for domain, row in domains.items():
+                key = _KEY + "d:" + domain
+                for name, value in row.items():
+                    if name == "calls":
+                        pipe.hincrby(key, name, int(value))
+                    else:
+                        pipe.hincrbyfloat(key, name, value)
+                pipe.expire(key, _DOMAIN_TTL)
+                pipe.zincrby(_KEY + "domains", row.get("total", 0.0), domain)
+            if domains:
+                pipe.zremrangebyrank(_KEY + "domains", 0, -self.max_domains - 1)
+            pipe.execute()
+        except Exception as e:
+            log.warning("Validation metrics not shared (%s)", e)
+
+    def _shared(self, top_domains: int) -> Optional[Tuple[float, Dict[str, Histogram], Dict[str, Dict[str, int]],
+                                                         List[Tuple[str, Dict[str, float]]]]]:
+        r = get_redis()
+        if r is None:
+            return None
+        try:
+            stages = sorted(r.smembers(_KEY + "stages"))
+            pipe = r.pipeline(transaction=False)
+            pipe.get(_KEY + "since")
+            for stage in stages:
+                pipe.hgetall(_KEY + "h:" + stage)
+                pipe.hgetall(_KEY + "o:" + stage)
+            if top_domains > 0:
+                pipe.zrevrange(_KEY + "domains", 0, top_domains - 1)
+            replies = pipe.execute()
+            names = replies[-1] if top_domains > 0 else []
+            rows = []
+            if names:
+                pipe = r.pipeline(transaction=False)
+                for d in names:
+                    pipe.hgetall(_KEY + "d:" + d)
+                rows = pipe.execute()
+        except Exception as e:
+            log.warning("Shared validation metrics unavailable (%s)", e)
+            return None
+        since = float(replies[0]) if replies[0] else self._started
+        hists = {s: Histogram.from_hash(replies[1 + 2 * i]) for i, s in enumerate(stages)}
+        outcomes = {s: {k: int(v) for k, v in replies[2 + 2 * i].items()} for i, s in enumerate(stages)}
+        domains = [(d, {k: float(v) for k, v in row.items()}) for d, row in zip(names, rows) if row]
+        return since, hists, outcomes, domains
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hist.clear()
+            self._outcomes.clear()
+            self._domains.clear()
+            self._new_hist, self._new_outcomes, self._new_domains = {}, {}, {}
+            self._started = time.time()
+        r = get_redis()
+        if r is None:
+            return
+        try:
+            keys = list(r.scan_iter(match=_KEY + "*", count=1000))
+            if keys:
+                r.delete(*keys)
+            r.set(_KEY + "since", self._started)
+        except Exception as e:
+            log.warning("Shared validation metrics not reset (%s)", e)
+
+    # ---- reports ----
+    def _figures(self, shared: bool, top_domains: int):
+        """(scope, since, histograms, outcomes, domain rows by cost); shared falls back to this process."""
+        if shared:
+            self.flush()  # include this process's latest
+            figures = self._shared(top_domains)
+            if figures is not None:
+                return ("cluster",) + figures
+        with self._lock:
+            hists = {s: h.copy() for s, h in self._hist.items()}
+            outcomes = {s: dict(c) for s, c in self._outcomes.items()}
+            domains = sorted(((d, dict(row)) for d, row in self._domains.items()),
+                             key=lambda kv: kv[1].get("total", 0.0), reverse=True)[:max(0, top_domains)]
+        return "process", self._started, hists, outcomes, domains
+
+    def snapshot(self, top_domains: int = 20, shared: bool = False) -> dict:
+        """
+        Figures of this process, or with `shared` the totals of every process that flushed
+        to Redis ("scope" says which one you got).
+        """
+        scope, since, hists, outcomes, domains = self._figures(shared, top_domains)
+        stages = {s: h.snapshot() for s, h in hists.items()}
+        top = [{"domain": d, "calls": int(row.get("calls", 0)),
+                **{f"{k}_ms": round(v * 1000, 1) for k, v in row.items() if k != "calls"}}
+               for d, row in domains]
+        ordered = {s: stages[s] for s in STAGES if s in stages}
+        ordered.update((s, h) for s, h in stages.items() if s not in ordered)
+        return {"scope": scope, "since": since, "stages": ordered, "outcomes": outcomes, "top_domains": top}
+
+    def prometheus(self, shared: bool = False) -> str:
+        """Text exposition format (histograms in seconds, outcome counters)."""
+        _scope, _since, hists, outcomes, _domains = self._figures(shared, 0)
+        lines: List[str] = [
+            "# HELP validation_stage_seconds Time spent per validation stage",
+            "# TYPE validation_stage_seconds histogram",
+        ]
+        for stage, h in hists.items():
+            cum = 0
+            for i, n in enumerate(h.counts):
+                cum += n
+                le = "+Inf" if i == len(BUCKETS) else repr(BUCKETS[i])
+                lines.append(f'validation_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cum}')
+            lines.append(f'validation_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+            lines.append(f'validation_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        lines += ["# HELP validation_stage_outcomes_total Outcome codes per validation stage",
+                  "# TYPE validation_stage_outcomes_total counter"]
+        for stage, counts in outcomes.items():
+            for outcome, n in counts.items():
+                lines.append(f'validation_stage_outcomes_total{{stage="{stage}",outcome="{outcome}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = ValidationMetrics()
+
+
+# ---------------------------
+# Per-call collection
+# ---------------------------
+class Timings:
+    """Stage times (summed when a stage repeats) and the last outcome per stage, for one call."""
+    __slots__ = ("seconds", "outcomes")
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.outcomes: Dict[str, str] = {}
+
+    def add(self, stage: str, seconds: float, outcome=None) -> None:
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        if outcome is not None:
+            self.outcomes[stage] = str(outcome)
+
+    def as_dict(self) -> dict:
+        return {"ms": {s: round(v * 1000, 1) for s, v in self.seconds.items()}, "codes": dict(self.outcomes)}
+
+
+_current: ContextVar[Optional[Timings]] = ContextVar("validation_timings", default=None)
+
+
+@contextmanager
+def collect() -> Iterator[Timings]:
+    """Collect the stage times recorded in this context (this thread / task) into a Timings."""
+    t = Timings()
+    token = _current.set(t)
+    try:
+        yield t
+    finally:
+        _current.reset(token)
+
+
+def record(stage: str, seconds: float, outcome=None) -> None:
+    """Histogram + outcome counter, and the current call's Timings if one is being collected."""
+    metrics.observe(stage, seconds, outcome)
+    t = _current.get()
+    if t is not None:
+        t.add(stage, seconds, outcome)
+
+
+def note(timings: Dict[str, float]) -> None:
+    """Add stage times measured elsewhere (e.g. in a connect-race thread) to the current call only."""
+    t = _current.get()
+    if t is not None:
+        for stage, seconds in timings.items():
+            t.add(stage, seconds)
+
+
+class timed:
+    """
+    `with timed("mx") as st: ...; st.outcome = status` records the block's duration.
+    isolate=True keeps stages recorded inside the block out of the current call's Timings
+    (they still reach the histograms), so the block is only counted once.
+    """
+    __slots__ = ("stage", "isolate", "outcome", "_t0", "_token")
+
+    def __init__(self, stage: str, isolate: bool = False):
+        self.stage = stage
+        self.isolate = isolate
+        self.outcome = None
+
+    def __enter__(self) -> "timed":
+        self._token = _current.set(None) if self.isolate else None
+        self._t0 = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        seconds = time.monotonic() - self._t0
+        if self._token is not None:
+            _current.reset(self._token)
+        record(self.stage, seconds, self.outcome if exc_type is None else "error")
@@ -0,0 +1,160 @@
+# validation_store.py
+"""
+Persistent validation results (table `validation_results`, one row per normalized email).
+
+Callers ask for a result through validate_cached / validate_many_cached: a stored result
+is reused while it is younger than VALIDATION_MAX_AGE and at least as thorough as the
+request (a DNS-only result never answers a request that wants an SMTP probe). Transient
+outcomes (greylisting, DNS hiccups, errors) are never reused. `force=True` always
+re-validates. Results are upserted through the caller's session (INSERT ... ON CONFLICT
+(email) DO UPDATE, so concurrent workers storing the same address don't collide); the
+caller commits.
+"""
+import os, time
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import ValidationResult
+from email_validation import validate_email_record, normalize, DEFAULT_TIMEOUT, ALLOW_SMTP_PROBE
+
+# ---------------------------
+# Config (via .env)
+# ---------------------------
+VALIDATION_MAX_AGE = int(os.getenv("VALIDATION_MAX_AGE", str(7 * 24 * 3600)))  # seconds
+
+# Reasons that describe the moment, not the mailbox
+TRANSIENT_REASONS = {"smtp-temp", "dns-temp"}
+# Keep IN (...) lists well below driver parameter limits
+_IN_CHUNK = 1000
+# Dialects with INSERT ... ON CONFLICT DO UPDATE
+_UPSERT = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+def _rows_for(db: Session, keys: List[str]) -> List[ValidationResult]:
+    rows: List[ValidationResult] = []
+    for i in range(0, len(keys), _IN_CHUNK):
+        rows.extend(db.execute(
+            select(ValidationResult).where(ValidationResult.email.in_(keys[i:i + _IN_CHUNK]))
+            .execution_options(populate_existing=True)  # rows are upserted behind the ORM's back
+        ).scalars().all())
+    return rows
+
+
+def store_key(email: str) -> str:
+    return normalize(str(email or "")).lower()
+
+
+def _is_fresh(row: ValidationResult, do_smtp: bool, max_age: int) -> bool:
+    if row.verdict == "unknown" or row.reason in TRANSIENT_REASONS:
+        return False
+    # Syntax/MX failures are final; anything else decided without SMTP can't answer an SMTP request
+    if do_smtp and ALLOW_SMTP_PROBE and not row.smtp_probed and row.verdict != "invalid":
+        return False
+    checked = row.checked_at
+    if checked is None:
+        return False
+    if checked.tzinfo is None:  # SQLite drops the tz
+        checked = checked.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - checked <= timedelta(seconds=max_age)
+
+
+def _to_result(row: ValidationResult, email: str) -> dict:
+    return {
+        "email": email, "verdict": row.verdict, "status": row.verdict,
+        "score": row.score, "checks": row.checks or {}, "provider": row.provider,
+        "suggestion": row.suggestion, "reason": row.reason,
+        "cached": True, "checked_at": row.checked_at.isoformat() if row.checked_at else None,
+    }
+
+
+def _values(res: dict, duration_ms: Optional[int]) -> dict:
+    return {
+        "verdict": res.get("verdict") or "unknown",
+        "reason": res.get("reason"),
+        "provider": res.get("provider"),
+        "suggestion": res.get("suggestion"),
+        "score": res.get("score"),
+        "checks": res.get("checks"),
+        "smtp_probed": bool((res.get("checks") or {}).get("smtp_checked")),
+        "duration_ms": duration_ms,
+        "checked_at": datetime.now(timezone.utc),
+    }
+
+
+def lookup_fresh(db: Session, emails: Iterable[str], do_smtp: bool, max_age: Optional[int] = None) -> Dict[str, dict]:
+    """Return {input_email: stored_result} for every email with a fresh stored result."""
+    max_age = VALIDATION_MAX_AGE if max_age is None else max_age
+    keys: Dict[str, List[str]] = {}
+    for e in emails:
+        keys.setdefault(store_key(e), []).append(e)
+    if not keys:
+        return {}
+    out: Dict[str, dict] = {}
+    for row in _rows_for(db, list(keys)):
+        if _is_fresh(row, do_smtp, max_age):
+            for e in keys.get(row.email, []):
+                out[e] = _to_result(row, e)
+    return out
+
+
+def save_results(db: Session, results: Iterable[dict], duration_ms: Optional[int] = None) -> None:
+    """Upsert results (one INSERT ... ON CONFLICT for the whole batch). Unknown/error results are not stored."""
+    by_key: Dict[str, dict] = {}
+    for res in results:
+        if res.get("cached") or res.get("verdict") in (None, "unknown"):
+            continue
+        by_key[store_key(res.get("email"))] = res
+    if not by_key:
+        return
+    rows = [{"email": key, **_values(res, duration_ms)} for key, res in by_key.items()]
+    insert = _UPSERT.get(db.get_bind().dialect.name)
+    if insert is None:
+        # No ON CONFLICT: update what exists, add the rest (racing inserts can still collide)
+        existing = {row.email: row for row in _rows_for(db, list(by_key))}
+        for values in rows:
+            row = existing.get(values["email"])
+            if row is None:
+                db.add(ValidationResult(**values))
+            else:
+                for name, value in values.items():
+                    setattr(row, name, value)
+        return
+    stmt = insert(ValidationResult)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[ValidationResult.email],
+        set_={name: stmt.excluded[name] for name in rows[0] if name != "email"},
+    ), rows)
+
+
+def validate_cached(db: Session, email: str, timeout: float = DEFAULT_TIMEOUT, do_smtp: bool = False,
+                    force: bool = False, max_age: Optional[int] = None, timings: bool = False) -> dict:
+    """validate_email_record, answered from the store when a fresh result exists (stored results carry no timings)."""
+    if not force:
+        hit = lookup_fresh(db, [email], do_smtp, max_age).get(email)
+        if hit:
+            return hit
+    t0 = time.monotonic()
+    res = validate_email_record(email, timeout=timeout, do_smtp=do_smtp, timings=timings)
+    save_results(db, [res], int((time.monotonic() - t0) * 1000))
+    return res
+
+
+def validate_many_cached(db: Session, emails: List[str], timeout: float = DEFAULT_TIMEOUT, do_smtp: bool = False,
+                         force: bool = False, concurrency: Optional[int] = None,
+                         group_by_domain: bool = True, prechecked: Optional[Mapping[str, dict]] = None) -> List[dict]:
+    """Bulk twin of validate_cached: stored results first, the bulk engine for the rest (see validate_emails_bulk)."""
+    from bulk_validation import validate_emails_bulk_sync
+
+    cached = {} if force else lookup_fresh(db, emails, do_smtp)
+    todo = [e for e in emails if e not in cached]
+    fresh: List[dict] = []
+    if todo:
+        fresh = validate_emails_bulk_sync(todo, concurrency=concurrency, timeout=timeout, do_smtp=do_smtp,
+                                          group_by_domain=group_by_domain, prechecked=prechecked)
+        save_results(db, fresh)
+    return list(cached.values()) + fresh